@@ -39,3 +39,29 @@ ALGORITHM_WINDOW = "window"
 # Pick-up mode for Sawatabi Solver
 PICKUP_MODE_RANDOM = "random"
 PICKUP_MODE_SEQUENTIAL = "sequential"
+PICKUP_MODE_COLORING = "coloring"
+
+# Post-process methods for PostProcessedSolver
+POST_PROCESS_DESCENT = "descent"
+POST_PROCESS_TABU = "tabu"
+
+# Cluster moves for Sawatabi Solver
+CLUSTER_METHOD_SWENDSEN_WANG = "swendsen_wang"
+CLUSTER_METHOD_HOUDAYER = "houdayer"
+
+# Kernels (representations of couplings) for Sawatabi Solver
+KERNEL_AUTO = "auto"
+KERNEL_SPARSE = "sparse"
+KERNEL_DENSE = "dense"
+
+# Temperature schedules for Sawatabi Solver
+SCHEDULE_MANUAL = "manual"
+SCHEDULE_AUTO = "auto"
+INTERPOLATION_GEOMETRIC = "geometric"
+INTERPOLATION_LINEAR = "linear"
+
+# Reasons to stop annealing in Sawatabi Solver
+STOP_REASON_NUM_SWEEPS = "num_sweeps"
+STOP_REASON_ZERO_ACCEPTANCE = "zero_acceptance"
+STOP_REASON_STAGNATION = "stagnation"
+STOP_REASON_TIME_LIMIT = "time_limit"
@@ -15,6 +15,7 @@
 from sawatabi.model.abstract_model import AbstractModel
 from sawatabi.model.logical_model import LogicalModel
 from sawatabi.model.physical_model import PhysicalModel
+from sawatabi.model.physical_model_delta import PhysicalModelDelta
 from sawatabi.model import constraint
 
-__all__ = ["AbstractModel", "LogicalModel", "PhysicalModel", "constraint"]
+__all__ = ["AbstractModel", "LogicalModel", "PhysicalModel", "PhysicalModelDelta", "constraint"]
@@ -12,12 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import pprint
 
 import dimod
+import numpy as np
 
 import sawatabi.constants as constants
 from sawatabi.model.abstract_model import AbstractModel
+from sawatabi.model.physical_model_delta import PhysicalModelDelta
 
 
 class PhysicalModel(AbstractModel):
@@ -31,6 +34,10 @@ class PhysicalModel(AbstractModel):
         self._variables_set = set()
         self._label_to_index = {}
         self._index_to_label = {}
+        # 2-body interactions in a factored form: a list of (labels, u, v)
+        self._low_rank_interactions = []
+        self._fingerprint = None
+        self._fingerprint_state = None
 
     ################################
     # Interaction
@@ -38,6 +45,98 @@ class PhysicalModel(AbstractModel):
 
     def add_interaction(self, name, body, coefficient):
         self._raw_interactions[body][name] = coefficient
+        self._fingerprint = None
+
+    def add_low_rank_interaction(self, labels, u, v=None):
+        """
+        Adds 2-body interactions between all pairs of the given variables in a factored form,
+            J_{ij} = ( sum_k u_{ik} * v_{jk} + sum_k u_{jk} * v_{ik} ) / 2    (i < j)
+        where u and v are (len(labels), rank) matrices (v = u if omitted). The coefficients are in the same sign as
+        ordinary 2-body interactions. For example, a number partitioning problem (J = -a a^T) is given by u = a and v = -a
+        (column vectors of the numbers) without expanding O(n^2) interactions, and SawatabiSolver calculates energy diffs from them in O(rank).
+        Variables which are not in the model yet are added to the end of the variable order.
+        """
+        self._check_argument_type("labels", labels, (list, tuple))
+        u = np.array(u, dtype=np.float64)
+        v = u.copy() if v is None else np.array(v, dtype=np.float64)
+        if u.ndim == 1:
+            u = u[:, np.newaxis]
+        if v.ndim == 1:
+            v = v[:, np.newaxis]
+        if (u.ndim != 2) or (u.shape[0] != len(labels)) or (u.shape != v.shape):
+            raise ValueError("u and v must be (len(labels), rank) matrices of the same shape.")
+        if len(set(labels)) != len(labels):
+            raise ValueError("labels must not contain duplicates.")
+
+        for label in labels:
+            if label not in self._label_to_index:
+                index = len(self._index_to_label)
+                self._label_to_index[label] = index
+                self._index_to_label[index] = label
+            self._variables_set.add(label)
+        self._low_rank_interactions.append((list(labels), u, v))
+        self._fingerprint = None
+
+    def _expand_low_rank_interactions(self):
+        """
+        Returns the low-rank interactions expanded into a dict of ordinary 2-body interactions.
+        """
+        quadratic = {}
+        for labels, u, v in self._low_rank_interactions:
+            couplings = (u @ v.T + v @ u.T) / 2.0
+            rows, cols = np.triu_indices(len(labels), k=1)
+            for i, j, coeff in zip(rows.tolist(), cols.tolist(), couplings[rows, cols].tolist()):
+                key = (labels[i], labels[j])
+                quadratic[key] = quadratic.get(key, 0.0) + coeff
+        return quadratic
+
+    ################################
+    # Fingerprint
+    ################################
+
+    def fingerprint(self):
+        """
+        Returns a hash string of the mtype, interactions, offset and variable order of the model.
+        Models with the same fingerprint are converted to the same arrays by solvers, so it can be used as a cache key.
+        Interactions are hashed term by term and summed, so that the value does not depend on the order in which they were added,
+        and is calculated by NumPy without sorting. The value is cached, and reset when an interaction is added.
+        """
+        if self._fingerprint is None:
+            linear = self._raw_interactions[constants.INTERACTION_LINEAR]
+            quadratic = self._raw_interactions[constants.INTERACTION_QUADRATIC]
+            self._set_fingerprint_state(
+                (
+                    self._mtype,
+                    _term_hash_sum(list(linear.keys()), list(linear.values()), pairwise=False),
+                    _term_hash_sum(list(quadratic.keys()), list(quadratic.values()), pairwise=True),
+                    float(self._offset),
+                    _labels_digest(self._index_to_label),
+                    hashlib.sha256(repr([(labels, u.tobytes(), v.tobytes()) for labels, u, v in self._low_rank_interactions]).encode("utf-8")).hexdigest(),
+                )
+            )
+        return self._fingerprint
+
+    def _set_fingerprint_state(self, state):
+        # The state holds the components of the fingerprint, from which the fingerprint of a patched model is derived
+        self._fingerprint_state = state
+        self._fingerprint = hashlib.sha256(repr(state).encode("utf-8")).hexdigest()
+
+    def _patched_fingerprint_state(self, delta):
+        """
+        Returns the fingerprint state of the model to which the delta is applied, in O(len(delta)).
+        The hashes of the coefficients before the changes are subtracted from the sums, and those after the changes are added.
+        """
+        self.fingerprint()
+        mtype, linear, quadratic, _, labels, low_rank = self._fingerprint_state
+        sums = []
+        for total, changes, pairwise in [(linear, delta._linear, False), (quadratic, delta._quadratic, True)]:
+            keys = list(changes.keys())
+            before = _term_hash_sum(keys, [v[0] for v in changes.values()], pairwise=pairwise)
+            after = _term_hash_sum(keys, [v[1] for v in changes.values()], pairwise=pairwise)
+            sums.append(tuple((t - b + a) % (2 ** 64) for t, b, a in zip(total, before, after)))
+        if delta._index_to_label is not None:
+            labels = _labels_digest(delta._index_to_label)
+        return (mtype, sums[0], sums[1], float(delta._offset[1]), labels, low_rank)
 
     ################################
     # Offset
@@ -49,6 +148,166 @@ class PhysicalModel(AbstractModel):
         """
         return self._offset
 
+    ################################
+    # Fix
+    ################################
+
+    def fix_variables(self, fixed):
+        """
+        Returns a new PhysicalModel in which the given variables are fixed to the given values.
+        Interactions with the fixed variables are folded into linear terms and the offset,
+        so the energy of any state is the same as in the original model.
+        """
+        self._check_argument_type("fixed", fixed, dict)
+        if len(self._low_rank_interactions) > 0:
+            raise ValueError("Cannot fix variables of a model with low-rank interactions.")
+
+        if self.get_mtype() == constants.MODEL_ISING:
+            allowed_values = [1, -1]
+        elif self.get_mtype() == constants.MODEL_QUBO:
+            allowed_values = [1, 0]
+        for label, value in fixed.items():
+            if label not in self._label_to_index:
+                raise ValueError(f"Variable '{label}' does not exist in the model.")
+            if value not in allowed_values:
+                raise ValueError(f"'value' must be one of {allowed_values} because the model is {self.get_mtype()}.")
+
+        linear, quadratic = {}, {}
+        offset = self._offset
+        for k, v in self._raw_interactions[constants.INTERACTION_LINEAR].items():
+            if k in fixed:
+                offset += -1 * fixed[k] * v
+            else:
+                linear[k] = linear.get(k, 0.0) + v
+        for k, v in self._raw_interactions[constants.INTERACTION_QUADRATIC].items():
+            if (k[0] in fixed) and (k[1] in fixed):
+                offset += -1 * fixed[k[0]] * fixed[k[1]] * v
+            elif k[0] in fixed:
+                # 2-body interaction will become a 1-body interaction
+                linear[k[1]] = linear.get(k[1], 0.0) + fixed[k[0]] * v
+            elif k[1] in fixed:
+                linear[k[0]] = linear.get(k[0], 0.0) + fixed[k[1]] * v
+            else:
+                quadratic[k] = v
+
+        physical = PhysicalModel(mtype=self._mtype)
+        for k, v in quadratic.items():
+            physical.add_interaction(k, body=constants.INTERACTION_QUADRATIC, coefficient=v)
+            physical._variables_set.add(k[0])
+            physical._variables_set.add(k[1])
+        for k, v in linear.items():
+            # Variables whose coefficients are cancelled out are kept with zero so that they still appear in the samples
+            if (v != 0.0) or (k not in physical._variables_set):
+                physical.add_interaction(k, body=constants.INTERACTION_LINEAR, coefficient=v)
+                physical._variables_set.add(k)
+        physical._offset = offset
+
+        # Variables without any interactions are also kept as they are free variables
+        current_index = 0
+        for index in sorted(self._index_to_label.keys()):
+            label = self._index_to_label[index]
+            if label in fixed:
+                continue
+            if label not in physical._variables_set:
+                physical.add_interaction(label, body=constants.INTERACTION_LINEAR, coefficient=0.0)
+                physical._variables_set.add(label)
+            physical._label_to_index[label] = current_index
+            physical._index_to_label[current_index] = label
+            current_index += 1
+
+        return physical
+
+    ################################
+    # Diff / Patch
+    ################################
+
+    def diff(self, other):
+        """
+        Returns a PhysicalModelDelta which represents the changes from this model to the other model.
+        The delta holds the fingerprint of this model, so that solvers can find the arrays which the delta is applied to.
+        """
+        self._check_argument_type("other", other, PhysicalModel)
+        if self._mtype != other._mtype:
+            raise ValueError("Cannot take the diff of models with different mtypes.")
+        if not self._same_low_rank_interactions(other):
+            raise ValueError("Cannot take the diff of models with different low-rank interactions.")
+
+        linear = {}
+        self_linear = self._raw_interactions[constants.INTERACTION_LINEAR]
+        other_linear = other._raw_interactions[constants.INTERACTION_LINEAR]
+        for k, v in self_linear.items():
+            after = other_linear.get(k, 0.0)
+            if v != after:
+                linear[k] = (v, after)
+        for k, v in other_linear.items():
+            if k not in self_linear:
+                linear[k] = (0.0, v)
+
+        quadratic = {}
+        self_quadratic = self._raw_interactions[constants.INTERACTION_QUADRATIC]
+        other_quadratic = other._raw_interactions[constants.INTERACTION_QUADRATIC]
+        for k, v in self_quadratic.items():
+            after = other_quadratic.get(k, other_quadratic.get((k[1], k[0]), 0.0))
+            if v != after:
+                quadratic[k] = (v, after)
+        for k, v in other_quadratic.items():
+            if (k not in self_quadratic) and ((k[1], k[0]) not in self_quadratic):
+                quadratic[k] = (0.0, v)
+
+        added_variables = [label for label in other._label_to_index.keys() if label not in self._label_to_index]
+        removed_variables = [label for label in self._label_to_index.keys() if label not in other._label_to_index]
+        index_to_label = None
+        if self._index_to_label != other._index_to_label:
+            index_to_label = dict(other._index_to_label)
+
+        delta = PhysicalModelDelta(
+            mtype=self._mtype,
+            num_variables_before=len(self._index_to_label),
+            linear=linear,
+            quadratic=quadratic,
+            offset=(self._offset, other._offset),
+            added_variables=added_variables,
+            removed_variables=removed_variables,
+            index_to_label=index_to_label,
+            base_fingerprint=self.fingerprint(),
+        )
+        # The fingerprint of the other model is derived from this one, without hashing all of its interactions
+        if other._fingerprint is None:
+            other._set_fingerprint_state(self._patched_fingerprint_state(delta))
+        return delta
+
+    def patch(self, delta):
+        """
+        Returns a new PhysicalModel to which the given PhysicalModelDelta is applied.
+        """
+        self._check_argument_type("delta", delta, PhysicalModelDelta)
+        if self._mtype != delta.get_mtype():
+            raise ValueError("Cannot patch a model with a delta of a different mtype.")
+
+        physical = PhysicalModel(mtype=self._mtype)
+        for body, changes in [(constants.INTERACTION_LINEAR, delta._linear), (constants.INTERACTION_QUADRATIC, delta._quadratic)]:
+            for k, v in self._raw_interactions[body].items():
+                physical.add_interaction(k, body=body, coefficient=v)
+            for k, (_, after) in changes.items():
+                if (body == constants.INTERACTION_QUADRATIC) and (k not in physical._raw_interactions[body]):
+                    if (k[1], k[0]) in physical._raw_interactions[body]:
+                        k = (k[1], k[0])
+                if after != 0.0:
+                    physical.add_interaction(k, body=body, coefficient=after)
+                elif k in physical._raw_interactions[body]:
+                    physical._raw_interactions[body].pop(k)
+        physical._offset = delta._offset[1]
+
+        if delta._index_to_label is not None:
+            physical._index_to_label = dict(delta._index_to_label)
+        else:
+            physical._index_to_label = dict(self._index_to_label)
+        physical._label_to_index = {v: k for k, v in physical._index_to_label.items()}
+        physical._variables_set = set(physical._label_to_index.keys())
+        physical._low_rank_interactions = list(self._low_rank_interactions)
+
+        return physical
+
     ################################
     # Converts to another model
     ################################
@@ -62,6 +321,9 @@ class PhysicalModel(AbstractModel):
             linear[k] = sign * v
         for k, v in self._raw_interactions[constants.INTERACTION_QUADRATIC].items():
             quadratic[k] = sign * v
+        # Low-rank interactions are expanded, which takes O(n^2)
+        for k, v in self._expand_low_rank_interactions().items():
+            quadratic[k] = quadratic.get(k, 0.0) + sign * v
 
         if self.get_mtype() == constants.MODEL_ISING:
             vartype = dimod.SPIN
@@ -85,6 +347,9 @@ class PhysicalModel(AbstractModel):
         for k, v in self._raw_interactions[constants.INTERACTION_QUADRATIC].items():
             index = [self._label_to_index[k[0]], self._label_to_index[k[1]]]
             polynomial.append([index[0], index[1], -1.0 * v])
+        for k, v in self._expand_low_rank_interactions().items():
+            index = [self._label_to_index[k[0]], self._label_to_index[k[1]]]
+            polynomial.append([index[0], index[1], -1.0 * v])
 
         return polynomial
 
@@ -100,8 +365,17 @@ class PhysicalModel(AbstractModel):
             and (self._offset == other._offset)
             and (self._label_to_index == other._label_to_index)
             and (self._index_to_label == other._index_to_label)
+            and self._same_low_rank_interactions(other)
         )
 
+    def _same_low_rank_interactions(self, other):
+        if len(self._low_rank_interactions) != len(other._low_rank_interactions):
+            return False
+        for (labels, u, v), (other_labels, other_u, other_v) in zip(self._low_rank_interactions, other._low_rank_interactions):
+            if (labels != other_labels) or (not np.array_equal(u, other_u)) or (not np.array_equal(v, other_v)):
+                return False
+        return True
+
     def __ne__(self, other):
         return not self.__eq__(other)
 
@@ -123,6 +397,56 @@ class PhysicalModel(AbstractModel):
         s.append(self.append_prefix(pprint.pformat(self._raw_interactions[constants.INTERACTION_LINEAR]), length=4))
         s.append("┃  quadratic:")
         s.append(self.append_prefix(pprint.pformat(self._raw_interactions[constants.INTERACTION_QUADRATIC]), length=4))
+        if len(self._low_rank_interactions) > 0:
+            s.append("┃  low_rank:")
+            for labels, u, _ in self._low_rank_interactions:
+                s.append("┃" + (" " * 4) + f"{len(labels)} variables, rank {u.shape[1]}")
         s.append("┣━ offset: " + str(self._offset))
         s.append("┗" + ("━" * 64))
         return "\n".join(s)
+
+
+def _mix64(x):
+    """
+    Returns the splitmix64 finalizer of a uint64 array, which scatters the bits of each element.
+    """
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _label_hashes(labels):
+    """
+    Returns a (len(labels), 2) uint64 array of 128-bit hashes of the labels, which do not depend on the process.
+    """
+    digests = b"".join(hashlib.blake2b(repr(label).encode("utf-8"), digest_size=16).digest() for label in labels)
+    return np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+
+
+def _term_hash_sum(keys, coefficients, pairwise):
+    """
+    Returns the sum of the 128-bit hashes of the terms modulo 2^64 for each half, as a tuple of two ints.
+    A term is hashed from the hashes of its labels and the bits of its coefficient, where the labels of a pair are
+    symmetric so that (a, b) and (b, a) are the same. Terms with zero coefficients are the same as missing ones.
+    """
+    coefficients = np.array(coefficients, dtype=np.float64).reshape(-1)
+    ids = {}
+    if pairwise:
+        first = np.fromiter((ids.setdefault(k[0], len(ids)) for k in keys), dtype=np.int64, count=len(keys))
+        second = np.fromiter((ids.setdefault(k[1], len(ids)) for k in keys), dtype=np.int64, count=len(keys))
+        hashes = _label_hashes(list(ids.keys()))
+        a, b = hashes[first], hashes[second]
+        with np.errstate(over="ignore"):
+            labels = _mix64(_mix64(np.minimum(a, b)) + np.maximum(a, b))
+    else:
+        indices = np.fromiter((ids.setdefault(k, len(ids)) for k in keys), dtype=np.int64, count=len(keys))
+        labels = _mix64(_label_hashes(list(ids.keys()))[indices])
+    with np.errstate(over="ignore"):
+        terms = _mix64(labels + coefficients.view(np.uint64)[:, np.newaxis])
+    terms = terms[coefficients != 0.0]
+    return tuple(int(s) for s in terms.sum(axis=0, dtype=np.uint64))
+
+
+def _labels_digest(index_to_label):
+    return hashlib.sha256(repr(tuple(index_to_label[i] for i in range(len(index_to_label)))).encode("utf-8")).hexdigest()
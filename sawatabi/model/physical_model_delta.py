@@ -0,0 +1,95 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pprint
+
+from sawatabi.base_mixin import BaseMixin
+
+
+class PhysicalModelDelta(BaseMixin):
+    """
+    A compact difference between two PhysicalModels, created by `PhysicalModel.diff`.
+    Each changed coefficient is held as a pair of (before, after), where 0.0 means the interaction does not exist.
+    """
+
+    def __init__(self, mtype, num_variables_before, linear, quadratic, offset, added_variables, removed_variables, index_to_label=None, base_fingerprint=None):
+        self._mtype = mtype
+        self._num_variables_before = num_variables_before
+        self._linear = linear
+        self._quadratic = quadratic
+        self._offset = offset
+        self._added_variables = added_variables
+        self._removed_variables = removed_variables
+        # The index order of the new model, only if it has been changed
+        self._index_to_label = index_to_label
+        # The fingerprint of the model which the delta was taken from
+        self._base_fingerprint = base_fingerprint
+
+    def get_mtype(self):
+        return self._mtype
+
+    def get_base_fingerprint(self):
+        return self._base_fingerprint
+
+    def is_empty(self):
+        """
+        Returns True if the two models are the same.
+        """
+        return (
+            (len(self._linear) == 0)
+            and (len(self._quadratic) == 0)
+            and (self._offset[0] == self._offset[1])
+            and (len(self._added_variables) == 0)
+            and (len(self._removed_variables) == 0)
+            and (self._index_to_label is None)
+        )
+
+    def has_structural_changes(self):
+        """
+        Returns True if variables are added / removed or reordered.
+        """
+        return self._index_to_label is not None
+
+    ################################
+    # Built-in functions
+    ################################
+
+    def __len__(self):
+        return len(self._linear) + len(self._quadratic)
+
+    def __repr__(self):
+        s = "PhysicalModelDelta({"
+        s += "'mtype': '" + str(self._mtype) + "', "
+        s += "'linear': " + str(self._linear) + ", "
+        s += "'quadratic': " + str(self._quadratic) + ", "
+        s += "'offset': " + str(self._offset) + ", "
+        s += "'added_variables': " + str(self._added_variables) + ", "
+        s += "'removed_variables': " + str(self._removed_variables) + "})"
+        return s
+
+    def __str__(self):
+        s = []
+        s.append("┏" + ("━" * 64))
+        s.append("┃ PHYSICAL MODEL DELTA")
+        s.append("┣" + ("━" * 64))
+        s.append("┣━ mtype: " + str(self._mtype))
+        s.append("┣━ linear (before, after):")
+        s.append("┃" + (" " * 4) + pprint.pformat(self._linear))
+        s.append("┣━ quadratic (before, after):")
+        s.append("┃" + (" " * 4) + pprint.pformat(self._quadratic))
+        s.append("┣━ offset (before, after): " + str(self._offset))
+        s.append("┣━ added_variables: " + str(self._added_variables))
+        s.append("┣━ removed_variables: " + str(self._removed_variables))
+        s.append("┗" + ("━" * 64))
+        return "\n".join(s)
@@ -16,6 +16,20 @@ from sawatabi.solver.abstract_solver import AbstractSolver
 from sawatabi.solver.local_solver import LocalSolver
 from sawatabi.solver.dwave_solver import DWaveSolver
 from sawatabi.solver.optigan_solver import OptiganSolver
+from sawatabi.solver.post_processed_solver import PostProcessedSolver
+from sawatabi.solver.presolved_solver import PresolvedSolver
 from sawatabi.solver.sawatabi_solver import SawatabiSolver
+from sawatabi.solver.sqa_solver import SQASolver
+from sawatabi.solver.tree_decomposition_solver import TreeDecompositionSolver
 
-__all__ = ["AbstractSolver", "LocalSolver", "DWaveSolver", "OptiganSolver", "SawatabiSolver"]
+__all__ = [
+    "AbstractSolver",
+    "LocalSolver",
+    "DWaveSolver",
+    "OptiganSolver",
+    "PostProcessedSolver",
+    "PresolvedSolver",
+    "SawatabiSolver",
+    "SQASolver",
+    "TreeDecompositionSolver",
+]
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
+
 from sawatabi.base_mixin import BaseMixin
 
 
@@ -21,3 +23,14 @@ class AbstractSolver(BaseMixin):
 
     def solve(self, model):
         raise NotImplementedError("#{self.class}##{__method__} must be implemented.")
+
+    @staticmethod
+    def _split_reads(num_reads, num_workers, seed=None):
+        """
+        Splits reads into shards for parallel workers.
+        Returns a list of (indices of reads, SeedSequence) for each shard, so that each worker has
+        an independent and reproducible random stream derived from the given seed.
+        """
+        num_shards = max(1, min(num_workers, num_reads))
+        seed_sequences = np.random.SeedSequence(seed).spawn(num_shards)
+        return list(zip(np.array_split(np.arange(num_reads), num_shards), seed_sequences))
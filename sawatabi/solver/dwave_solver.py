@@ -12,7 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from dwave.system.composites import EmbeddingComposite
+import hashlib
+import json
+import os
+import time
+
+import minorminer
+from dwave.system.composites import EmbeddingComposite, FixedEmbeddingComposite
 from dwave.system.samplers import DWaveSampler
 
 import sawatabi.constants as constants
@@ -21,19 +27,46 @@ from sawatabi.solver.abstract_solver import AbstractSolver
 
 
 class DWaveSolver(AbstractSolver):
-    def __init__(self, endpoint=None, token=None, solver="Advantage_system1.1", embedding_parameters=None):
+    """
+    A solver which samples on a D-Wave QPU through a minor-embedding.
+    If embedding_cache is True, embeddings are cached by the structure of the model and the topology of the sampler,
+    and a cached embedding is used by FixedEmbeddingComposite instead of finding a new one. Embeddings are also stored as
+    JSON files in embedding_cache_dir if given, so that they are shared across processes.
+    A structured dimod sampler can be given as `sampler` instead of DWaveSampler, such as a mock for offline use.
+    """
+
+    def __init__(
+        self,
+        endpoint=None,
+        token=None,
+        solver="Advantage_system1.1",
+        embedding_parameters=None,
+        sampler=None,
+        embedding_cache=False,
+        embedding_cache_dir=None,
+    ):
         super().__init__()
         self._endpoint = endpoint
         self._token = token
         self._solver = solver
 
-        self._composite = self._create_composite(embedding_parameters)
+        self._check_argument_type("embedding_cache", embedding_cache, bool)
+        if embedding_cache_dir is not None:
+            self._check_argument_type("embedding_cache_dir", embedding_cache_dir, (str, os.PathLike))
+        self._embedding_parameters = embedding_parameters if isinstance(embedding_parameters, dict) else {}
+        self._embedding_cache = {} if (embedding_cache or (embedding_cache_dir is not None)) else None
+        self._embedding_cache_dir = embedding_cache_dir
+        self._topology_hash = None
 
-    def _create_composite(self, embedding_parameters=None):
-        if (self._endpoint is not None) and (self._token is not None):
-            sampler = DWaveSampler(endpoint=self._endpoint, token=self._token, solver=self._solver)
-        else:
-            sampler = DWaveSampler(solver=self._solver)
+        self._composite = self._create_composite(embedding_parameters, sampler)
+
+    def _create_composite(self, embedding_parameters=None, sampler=None):
+        if sampler is None:
+            if (self._endpoint is not None) and (self._token is not None):
+                sampler = DWaveSampler(endpoint=self._endpoint, token=self._token, solver=self._solver)
+            else:
+                sampler = DWaveSampler(solver=self._solver)
+        self._sampler = sampler
 
         if (embedding_parameters is not None) and isinstance(embedding_parameters, dict):
             solver = EmbeddingComposite(sampler, embedding_parameters=embedding_parameters)
@@ -45,12 +78,83 @@ class DWaveSolver(AbstractSolver):
     def solve(self, model, **kwargs):
         self._check_argument_type("model", model, PhysicalModel)
 
-        if len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0 and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0:
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
             raise ValueError("Model cannot be empty.")
 
         # Converts to BQM (model representation for D-Wave)
         bqm = model.to_bqm()
 
-        sampleset = self._composite.sample(bqm, **kwargs)
+        if self._embedding_cache is None:
+            sampleset = self._composite.sample(bqm, **kwargs)
+            return sampleset
+
+        start_sec = time.perf_counter()
+        key = self.embedding_key(bqm)
+        embedding = self._load_embedding(key)
+        hit = embedding is not None
+        if not hit:
+            embedding = self._find_embedding(bqm)
+            self._store_embedding(key, embedding)
+        embedding_sec = time.perf_counter() - start_sec
+
+        sampleset = FixedEmbeddingComposite(self._sampler, embedding).sample(bqm, **kwargs)
+        sampleset.info["embedding_cache"] = {
+            "key": key,
+            "hit": hit,
+            "embedding_sec": embedding_sec,
+        }
 
         return sampleset
+
+    def embedding_key(self, bqm):
+        """
+        Returns a canonical hash of the edge set of the BQM (with the variables as self-loops) and the topology of the sampler.
+        The key does not depend on the coefficients, nor on the order of the variables and the interactions.
+        """
+        if self._topology_hash is None:
+            # The topology of a sampler does not change, so it is hashed only once
+            topology = (sorted(self._sampler.nodelist), sorted(tuple(sorted(edge)) for edge in self._sampler.edgelist))
+            self._topology_hash = hashlib.sha256(repr(topology).encode()).hexdigest()
+        edges = sorted(tuple(sorted((repr(u), repr(v)))) for u, v in bqm.quadratic)
+        nodes = sorted(repr(v) for v in bqm.variables)
+        return hashlib.sha256(repr((nodes, edges, self._topology_hash)).encode()).hexdigest()
+
+    def _find_embedding(self, bqm):
+        # Variables are given as self-loops so that isolated ones are also embedded, in the same manner as EmbeddingComposite
+        source_edgelist = list(bqm.quadratic) + [(v, v) for v in bqm.variables]
+        embedding = minorminer.find_embedding(source_edgelist, self._sampler.edgelist, **self._embedding_parameters)
+        if (len(bqm.variables) > 0) and (len(embedding) == 0):
+            raise ValueError("No embedding found.")
+        return {v: [int(q) for q in chain] for v, chain in embedding.items()}
+
+    def _embedding_path(self, key):
+        return os.path.join(self._embedding_cache_dir, f"{key}.json")
+
+    def _load_embedding(self, key):
+        """
+        Returns the cached embedding from the memory or the disk, or None if not cached.
+        """
+        if key in self._embedding_cache:
+            return self._embedding_cache[key]
+        if (self._embedding_cache_dir is None) or (not os.path.exists(self._embedding_path(key))):
+            return None
+        with open(self._embedding_path(key)) as f:
+            # Labels of physical models are strings, so that they are stored as they are
+            embedding = {label: chain for label, chain in json.load(f)["embedding"]}
+        self._embedding_cache[key] = embedding
+        return embedding
+
+    def _store_embedding(self, key, embedding):
+        self._embedding_cache[key] = embedding
+        if self._embedding_cache_dir is None:
+            return
+        os.makedirs(self._embedding_cache_dir, exist_ok=True)
+        # Written to a temporary file first, so that other processes never read a partial file
+        tmp_path = f"{self._embedding_path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"embedding": [[label, chain] for label, chain in embedding.items()]}, f)
+        os.replace(tmp_path, self._embedding_path(key))
@@ -0,0 +1,514 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dimod
+import numpy as np
+
+import sawatabi.constants as constants
+from sawatabi.base_mixin import BaseMixin
+from sawatabi.model.physical_model import PhysicalModel
+from sawatabi.model.physical_model_delta import PhysicalModelDelta
+
+
+class IsingArrays(BaseMixin):
+    """
+    Coefficients of a PhysicalModel in the Ising (SPIN) form, held in NumPy arrays for the samplers.
+
+    The energy of a spin state x (in the `_index_to_label` order of the model) is
+        E(x) = - sum_{i} h_{i} * x_i - sum_{i<j} J_{ij} * x_i * x_j + offset
+    which is the same as the energy of the original model (even if it is a QUBO model).
+    J is held in the CSR (compressed sparse row) format containing both (i, j) and (j, i).
+    With the dense kernel, J is also held as a contiguous (n, n) matrix, which is faster for (almost) fully connected models.
+    Low-rank interactions of the model are held separately as factors U and V (J_low_rank = (U V^T + V U^T) / 2 without the diagonal),
+    and are not included in the local fields maintained by `flip`. Samplers add them from the projections U^T x and V^T x.
+    Coefficients can be held in float32 to improve cache behavior on large graphs.
+    """
+
+    def __init__(self, model, dtype="float64"):
+        super().__init__()
+        self._check_argument_type("model", model, PhysicalModel)
+        self._check_dtype(dtype)
+        self._dtype = np.dtype(dtype)
+
+        self._mtype = model.get_mtype()
+        self._labels = [model._index_to_label[i] for i in range(len(model._index_to_label))]
+        self._label_to_index = {label: i for i, label in enumerate(self._labels)}
+        num_variables = len(self._labels)
+
+        self._h = np.zeros(num_variables, dtype=np.float64)
+        self._offset = 0.0
+        self._indptr = np.zeros(num_variables + 1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._data = np.zeros(0, dtype=np.float64)
+        self._kernel = constants.KERNEL_SPARSE
+        self._dense = None
+        self._low_rank_u = np.zeros((num_variables, 0))
+        self._low_rank_v = np.zeros((num_variables, 0))
+        self._low_rank_diag = np.zeros(num_variables)
+        self._update_offset(model.get_offset())
+
+        linear = model._raw_interactions[constants.INTERACTION_LINEAR]
+        quadratic = model._raw_interactions[constants.INTERACTION_QUADRATIC]
+        linear_index = np.array([self._label_to_index[k] for k in linear.keys()], dtype=np.int64)
+        linear_coeff = np.array(list(linear.values()), dtype=np.float64)
+        rows = np.array([self._label_to_index[k[0]] for k in quadratic.keys()], dtype=np.int64)
+        cols = np.array([self._label_to_index[k[1]] for k in quadratic.keys()], dtype=np.int64)
+        quadratic_coeff = np.array(list(quadratic.values()), dtype=np.float64)
+
+        self._update_linear(linear_index, linear_coeff)
+        self._build_csr(*self._to_spin_couplings(rows, cols, quadratic_coeff))
+        for labels, u, v in model._low_rank_interactions:
+            self._add_low_rank(np.array([self._label_to_index[k] for k in labels], dtype=np.int64), u, v)
+        self._h = self._h.astype(self._dtype)
+
+    ################################
+    # Properties
+    ################################
+
+    @property
+    def num_variables(self):
+        return len(self._labels)
+
+    @property
+    def labels(self):
+        return self._labels
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def set_dtype(self, dtype):
+        """
+        Changes the dtype of the coefficients in place.
+        """
+        self._check_dtype(dtype)
+        self._dtype = np.dtype(dtype)
+        self._h = self._h.astype(self._dtype)
+        self._data = self._data.astype(self._dtype)
+        if self._dense is not None:
+            self._dense = self._dense.astype(self._dtype)
+
+    @property
+    def density(self):
+        """
+        Returns the ratio of the number of couplings to the number of all pairs of variables.
+        """
+        num_variables = self.num_variables
+        if num_variables < 2:
+            return 0.0
+        return len(self._data) / (num_variables * (num_variables - 1))
+
+    @property
+    def kernel(self):
+        return self._kernel
+
+    @property
+    def low_rank(self):
+        """
+        Returns the total rank of the low-rank interactions, which is zero if there are none.
+        """
+        return self._low_rank_u.shape[1]
+
+    def set_kernel(self, kernel):
+        """
+        Changes the representation of couplings used by the samplers, which is either "sparse" (CSR) or "dense" (an (n, n) matrix).
+        The CSR arrays are always kept, so that the dense matrix is only an addition.
+        """
+        allowed_kernel = [constants.KERNEL_SPARSE, constants.KERNEL_DENSE]
+        if kernel not in allowed_kernel:
+            raise ValueError(f"kernel must be one of {allowed_kernel}")
+        self._kernel = kernel
+        if kernel == constants.KERNEL_DENSE:
+            if self._dense is None:
+                self._build_dense()
+        else:
+            self._dense = None
+
+    @property
+    def vartype(self):
+        """
+        Returns the dimod vartype of the original model.
+        """
+        return dimod.SPIN if self._mtype == constants.MODEL_ISING else dimod.BINARY
+
+    ################################
+    # Energy
+    ################################
+
+    def couplings_dot(self, x):
+        """
+        Returns J x for a spin vector x of shape (n,), or X J for a spin matrix X of shape (R, n).
+        """
+        if self._dense is not None:
+            # J is symmetric, so X J is the same as (J X^T)^T
+            return np.asarray(x) @ self._dense
+        num_variables = self.num_variables
+        x2d = np.atleast_2d(x)
+        num_rows = x2d.shape[0]
+        weights = (x2d[:, self._indices] * self._data).ravel()
+        positions = (np.arange(num_rows)[:, np.newaxis] * num_variables + self._csr_rows[np.newaxis, :]).ravel()
+        result = np.bincount(positions, weights=weights, minlength=num_rows * num_variables).reshape(num_rows, num_variables)
+        return result[0] if np.ndim(x) == 1 else result
+
+    def low_rank_projections(self, x):
+        """
+        Returns the projections (x U, x V) of a spin vector or matrix onto the factors of the low-rank interactions.
+        """
+        return x @ self._low_rank_u, x @ self._low_rank_v
+
+    def low_rank_dot(self, x):
+        """
+        Returns J_low_rank x for a spin vector, or X J_low_rank for a spin matrix, in O(n * rank).
+        """
+        p, q = self.low_rank_projections(x)
+        return (q @ self._low_rank_u.T + p @ self._low_rank_v.T) / 2.0 - x * self._low_rank_diag
+
+    def energy_diff_range(self):
+        """
+        Returns the estimated (smallest, largest) energy diffs by flipping a single spin, in the same manner as neal.default_beta_range.
+        The largest one is bounded by the absolute sums of the coefficients around each variable,
+        and the smallest one is given by the smallest non-zero coefficient.
+        """
+        abs_data = np.abs(self._data).astype(np.float64)
+        row_sums = np.abs(self._h).astype(np.float64) + np.bincount(self._csr_rows, weights=abs_data, minlength=self.num_variables)
+        coefficients = [np.abs(self._h), abs_data]
+        if self.low_rank > 0:
+            abs_u, abs_v = np.abs(self._low_rank_u), np.abs(self._low_rank_v)
+            row_sums += (abs_u @ abs_v.sum(axis=0) + abs_v @ abs_u.sum(axis=0)) / 2.0
+            coefficients.append(np.abs(self._low_rank_diag))
+        coefficients = np.concatenate(coefficients)
+        coefficients = coefficients[coefficients > 0.0]
+        if len(coefficients) == 0:
+            return 1.0, 1.0
+        return 2.0 * float(np.min(coefficients)), 2.0 * float(np.max(row_sums))
+
+    def dense_couplings(self):
+        """
+        Returns all couplings as a symmetric (n, n) matrix of float64 with the zero diagonal, including the low-rank interactions.
+        """
+        couplings = np.zeros((self.num_variables, self.num_variables))
+        couplings[self._csr_rows, self._indices] = self._data
+        if self.low_rank > 0:
+            couplings += (self._low_rank_u @ self._low_rank_v.T + self._low_rank_v @ self._low_rank_u.T) / 2.0
+            np.fill_diagonal(couplings, 0.0)
+        return couplings
+
+    def local_fields(self, x):
+        """
+        Returns the local fields (h_i + sum_j J_ij x_j) for a spin vector or matrix.
+        Low-rank interactions are not included (see `low_rank_dot`).
+        """
+        return (self._h + self.couplings_dot(x)).astype(self._dtype, copy=False)
+
+    def energy(self, x):
+        """
+        Returns the energy of a spin vector, or the energies of a spin matrix row by row.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        couplings = self.couplings_dot(x)
+        if self.low_rank > 0:
+            couplings = couplings + self.low_rank_dot(x)
+        return -np.sum(x * (self._h + 0.5 * couplings), axis=-1) + self._offset
+
+    def flip(self, idx, x, fields):
+        """
+        Flips x[idx] in place, and updates the local fields of its neighbors in O(degree).
+        """
+        x[idx] *= -1
+        if self._dense is not None:
+            # A row of the symmetric matrix is the same as its column, and is contiguous
+            fields += (2 * x[idx]) * self._dense[idx]
+            return
+        start, end = self._indptr[idx], self._indptr[idx + 1]
+        fields[self._indices[start:end]] += (2 * x[idx]) * self._data[start:end]
+
+    def flip_rows(self, rows, indices, x, fields):
+        """
+        Flips x[rows[k], indices[k]] for each k in place, i.e. one spin for each of the given rows of a spin matrix,
+        and updates the local fields of their neighbors. Each row must appear only once.
+        """
+        x[rows, indices] *= -1
+        if self._dense is not None:
+            fields[rows] += (2 * x[rows, indices])[:, np.newaxis] * self._dense[indices]
+            return
+        starts, ends = self._indptr[indices], self._indptr[indices + 1]
+        lengths = ends - starts
+        # Positions in the CSR arrays of all neighbors of the flipped spins
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = np.arange(np.sum(lengths)) + offsets
+        flips = np.repeat(2 * x[rows, indices], lengths)
+        fields[np.repeat(rows, lengths), self._indices[positions]] += flips * self._data[positions]
+
+    ################################
+    # Clusters
+    ################################
+
+    @staticmethod
+    def connected_components(num_nodes, u, v):
+        """
+        Returns a label for each node such that nodes connected by the edges (u[k], v[k]) have the same label,
+        which is the smallest node id in the component. This is a vectorized union-find by min-label propagation
+        with pointer jumping, so all replicas can be processed at once by giving their nodes different ids.
+        """
+        labels = np.arange(num_nodes)
+        while True:
+            lu, lv = labels[u], labels[v]
+            if np.array_equal(lu, lv):
+                return labels
+            smaller = np.minimum(lu, lv)
+            np.minimum.at(labels, lu, smaller)
+            np.minimum.at(labels, lv, smaller)
+            np.minimum.at(labels, u, smaller)
+            np.minimum.at(labels, v, smaller)
+            # Every label points to a node of the same component with a smaller or equal id
+            while True:
+                jumped = labels[labels]
+                if np.array_equal(jumped, labels):
+                    break
+                labels = jumped
+
+    ################################
+    # Coloring
+    ################################
+
+    def color_classes(self):
+        """
+        Returns a list of color classes of the coupling graph colored greedily (largest degree first).
+        Variables in the same class share no couplings, so they can be updated simultaneously.
+        Each class is a tuple of (variables, src, positions, targets, inverse), where `positions` are
+        the CSR entries of the variables, `src` are their rows as positions in `variables`,
+        and `targets[inverse]` are their columns (neighbors).
+        """
+        if self._color_classes is not None:
+            return self._color_classes
+
+        num_variables = self.num_variables
+        degrees = np.diff(self._indptr)
+        colors = np.full(num_variables, -1, dtype=np.int64)
+        for idx in np.argsort(-degrees, kind="stable"):
+            start, end = self._indptr[idx], self._indptr[idx + 1]
+            neighbor_colors = set(colors[self._indices[start:end]].tolist())
+            color = 0
+            while color in neighbor_colors:
+                color += 1
+            colors[idx] = color
+
+        self._color_classes = []
+        for color in range(colors.max() + 1 if num_variables > 0 else 0):
+            variables = np.flatnonzero(colors == color)
+            counts = degrees[variables]
+            src = np.repeat(np.arange(len(variables)), counts)
+            # Positions of the CSR entries of the variables
+            offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+            positions = np.repeat(self._indptr[variables], counts) + offsets
+            targets, inverse = np.unique(self._indices[positions], return_inverse=True)
+            self._color_classes.append((variables, src, positions, targets, inverse))
+        return self._color_classes
+
+    def flip_class(self, color_class, x, fields, accepted):
+        """
+        Flips the accepted spins of a color class for all replicas in place, and updates the local fields.
+        `x` and `fields` are (num_reads, num_variables) matrices and `accepted` is a (num_reads, len(variables)) mask.
+        """
+        variables, src, positions, targets, inverse = color_class
+        flips = np.where(accepted, -2 * x[:, variables], 0)
+        x[:, variables] += flips
+        if len(targets) == 0:
+            return
+        num_reads = x.shape[0]
+        weights = (flips[:, src] * self._data[positions]).ravel()
+        bins = (np.arange(num_reads)[:, np.newaxis] * len(targets) + inverse[np.newaxis, :]).ravel()
+        fields[:, targets] += np.bincount(bins, weights=weights, minlength=num_reads * len(targets)).reshape(num_reads, len(targets))
+
+    ################################
+    # Delta
+    ################################
+
+    def apply_delta(self, delta):
+        """
+        Applies a PhysicalModelDelta in place.
+        Only the changed coefficients are touched as long as the sparsity structure does not change.
+        """
+        self._check_argument_type("delta", delta, PhysicalModelDelta)
+        if delta.get_mtype() != self._mtype:
+            raise ValueError("mtype of the delta does not match.")
+        if delta._num_variables_before != self.num_variables:
+            raise ValueError("The delta was not created from the cached model.")
+
+        # Added variables are temporarily appended to the end
+        num_before = self.num_variables
+        for label in delta._added_variables:
+            self._label_to_index[label] = len(self._labels)
+            self._labels.append(label)
+        if len(delta._added_variables) > 0:
+            num_added = len(delta._added_variables)
+            self._h = np.concatenate([self._h, np.zeros(num_added, dtype=self._h.dtype)])
+            self._low_rank_u = np.vstack([self._low_rank_u, np.zeros((num_added, self.low_rank))])
+            self._low_rank_v = np.vstack([self._low_rank_v, np.zeros((num_added, self.low_rank))])
+            self._low_rank_diag = np.concatenate([self._low_rank_diag, np.zeros(num_added)])
+
+        self._update_offset(delta._offset[1] - delta._offset[0])
+
+        if len(delta._linear) > 0:
+            linear_index = np.array([self._label_to_index[k] for k in delta._linear.keys()], dtype=np.int64)
+            linear_diff = np.array([after - before for before, after in delta._linear.values()], dtype=np.float64)
+            self._update_linear(linear_index, linear_diff)
+
+        new_rows, new_cols, new_data = [], [], []
+        if len(delta._quadratic) > 0:
+            rows = np.array([self._label_to_index[k[0]] for k in delta._quadratic.keys()], dtype=np.int64)
+            cols = np.array([self._label_to_index[k[1]] for k in delta._quadratic.keys()], dtype=np.int64)
+            diff = np.array([after - before for before, after in delta._quadratic.values()], dtype=np.float64)
+            rows, cols, diff = self._to_spin_couplings(rows, cols, diff)
+            for i, j, d in zip(rows, cols, diff):
+                if not (self._add_to_coupling(i, j, d) and self._add_to_coupling(j, i, d)):
+                    new_rows.append(i)
+                    new_cols.append(j)
+                    new_data.append(d)
+
+        if (len(new_rows) > 0) or (len(delta._added_variables) > 0) or delta.has_structural_changes():
+            # The sparsity structure has changed, so rebuild CSR (in NumPy) with the new entries
+            rows, cols, data = self._csr_to_coo()
+            rows = np.concatenate([rows, np.array(new_rows, dtype=np.int64)])
+            cols = np.concatenate([cols, np.array(new_cols, dtype=np.int64)])
+            data = np.concatenate([data.astype(np.float64), np.array(new_data, dtype=np.float64)])
+
+            if delta._index_to_label is not None:
+                # Reorder variables as the new model, dropping the removed ones
+                new_labels = [delta._index_to_label[i] for i in range(len(delta._index_to_label))]
+                new_label_to_index = {label: i for i, label in enumerate(new_labels)}
+                old_to_new = np.array([new_label_to_index.get(label, -1) for label in self._labels], dtype=np.int64)
+                keep = old_to_new >= 0
+                h = np.zeros(len(new_labels), dtype=self._h.dtype)
+                h[old_to_new[keep]] = self._h[keep]
+                for name in ["_low_rank_u", "_low_rank_v", "_low_rank_diag"]:
+                    factor = getattr(self, name)
+                    reordered = np.zeros((len(new_labels),) + factor.shape[1:])
+                    reordered[old_to_new[keep]] = factor[keep]
+                    setattr(self, name, reordered)
+                keep_edges = keep[rows] & keep[cols]
+                rows, cols, data = old_to_new[rows[keep_edges]], old_to_new[cols[keep_edges]], data[keep_edges]
+                self._h = h
+                self._labels = new_labels
+                self._label_to_index = new_label_to_index
+            elif num_before != self.num_variables:
+                raise ValueError("The delta does not contain the new index order.")
+
+            self._build_csr(rows, cols, data)
+
+    ################################
+    # Internal
+    ################################
+
+    @staticmethod
+    def _check_dtype(dtype):
+        allowed_dtype = ["float32", "float64"]
+        if str(dtype) not in allowed_dtype:
+            raise ValueError(f"dtype must be one of {allowed_dtype}")
+
+    def _update_offset(self, diff):
+        self._offset += diff
+
+    def _update_linear(self, index, diff):
+        if self._mtype == constants.MODEL_QUBO:
+            # x = (s + 1) / 2
+            diff = diff / 2.0
+            self._offset -= np.sum(diff)
+        np.add.at(self._h, index, diff)
+
+    def _to_spin_couplings(self, rows, cols, coeff):
+        # Self-loops are not couplings: s_i * s_i = 1 and x_i * x_i = x_i
+        loops = rows == cols
+        if np.any(loops):
+            if self._mtype == constants.MODEL_QUBO:
+                self._update_linear(rows[loops], coeff[loops])
+            else:
+                self._offset -= np.sum(coeff[loops])
+            rows, cols, coeff = rows[~loops], cols[~loops], coeff[~loops]
+
+        if self._mtype == constants.MODEL_QUBO:
+            # x_i * x_j = (s_i * s_j + s_i + s_j + 1) / 4
+            coeff = coeff / 4.0
+            np.add.at(self._h, rows, coeff)
+            np.add.at(self._h, cols, coeff)
+            self._offset -= np.sum(coeff)
+        return rows, cols, coeff
+
+    def _add_low_rank(self, index, u, v):
+        """
+        Adds low-rank interactions among the variables of the given indices, where u and v are (len(index), rank) factors.
+        """
+        if self._mtype == constants.MODEL_QUBO:
+            # x_i * x_j = (s_i * s_j + s_i + s_j + 1) / 4, summed over all pairs using the sums of the factors
+            diag = np.sum(u * v, axis=1)
+            row_sums = (u @ np.sum(v, axis=0) + v @ np.sum(u, axis=0)) / 2.0
+            np.add.at(self._h, index, (row_sums - diag) / 4.0)
+            self._offset -= (np.sum(u, axis=0) @ np.sum(v, axis=0) - np.sum(diag)) / 8.0
+            u, v = u / 2.0, v / 2.0
+
+        full_u = np.zeros((self.num_variables, u.shape[1]))
+        full_v = np.zeros((self.num_variables, v.shape[1]))
+        full_u[index] = u
+        full_v[index] = v
+        self._low_rank_u = np.hstack([self._low_rank_u, full_u])
+        self._low_rank_v = np.hstack([self._low_rank_v, full_v])
+        self._low_rank_diag = np.sum(self._low_rank_u * self._low_rank_v, axis=1)
+
+    def _build_csr(self, rows, cols, data):
+        """
+        Builds CSR arrays from coupling entries given in one direction, summing duplicates up.
+        """
+        num_variables = self.num_variables
+        rows, cols, data = np.concatenate([rows, cols]), np.concatenate([cols, rows]), np.concatenate([data, data])
+
+        order = np.lexsort((cols, rows))
+        rows, cols, data = rows[order], cols[order], data[order]
+        if len(rows) > 0:
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            data = np.bincount(np.cumsum(first) - 1, weights=data)
+            rows, cols = rows[first], cols[first]
+            nonzero = data != 0.0
+            rows, cols, data = rows[nonzero], cols[nonzero], data[nonzero]
+
+        self._indptr = np.zeros(num_variables + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_variables), out=self._indptr[1:])
+        self._indices = cols.astype(np.int64)
+        self._data = data.astype(self._dtype)
+        self._csr_rows = rows.astype(np.int64)
+        self._color_classes = None
+        if self._kernel == constants.KERNEL_DENSE:
+            self._build_dense()
+
+    def _build_dense(self):
+        self._dense = np.zeros((self.num_variables, self.num_variables), dtype=self._dtype)
+        self._dense[self._csr_rows, self._indices] = self._data
+
+    def _csr_to_coo(self):
+        # Only the upper triangle is returned, since `_build_csr` adds the other direction
+        upper = self._csr_rows < self._indices
+        return self._csr_rows[upper].copy(), self._indices[upper].copy(), self._data[upper].copy()
+
+    def _add_to_coupling(self, i, j, diff):
+        if max(i, j) >= len(self._indptr) - 1:
+            # Newly added variables are not in CSR yet
+            return False
+        start, end = self._indptr[i], self._indptr[i + 1]
+        pos = start + np.searchsorted(self._indices[start:end], j)
+        if (pos < end) and (self._indices[pos] == j):
+            self._data[pos] += diff
+            if self._dense is not None:
+                self._dense[i, j] += diff
+            return True
+        return False
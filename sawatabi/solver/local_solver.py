@@ -13,20 +13,32 @@
 # limitations under the License.
 
 import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 import dimod
 import neal
+import numpy as np
 
 import sawatabi.constants as constants
 from sawatabi.model.physical_model import PhysicalModel
 from sawatabi.solver.abstract_solver import AbstractSolver
+from sawatabi.solver.ising_arrays import IsingArrays
 
 
 class LocalSolver(AbstractSolver):
-    def __init__(self, exact=False):
+    def __init__(self, exact=False, cache_size=1):
         super().__init__()
         self._exact = exact
 
+        self._check_argument_type("cache_size", cache_size, int)
+        if cache_size < 1:
+            raise ValueError("'cache_size' must be a positive integer.")
+        # Default beta ranges of recently solved models keyed by their fingerprints, evicted in the LRU order
+        self._cache_size = cache_size
+        self._beta_range_cache = OrderedDict()
+
         if self._exact:
             # dimod's brute force solver
             self._solver = dimod.ExactSolver()
@@ -34,34 +46,240 @@ class LocalSolver(AbstractSolver):
             # Simulated annealing (SA)
             self._solver = neal.SimulatedAnnealingSampler()
 
-    def solve(self, model, **kwargs):
+    def solve(self, model, num_workers=1, **kwargs):
         self._check_argument_type("model", model, PhysicalModel)
 
-        if len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0 and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0:
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
             raise ValueError("Model cannot be empty.")
 
-        bqm = model.to_bqm()
+        self._check_argument_type("num_workers", num_workers, int)
+        if num_workers < 1:
+            raise ValueError("'num_workers' must be a positive integer.")
+
+        streaming = self._exact and (kwargs.get("num_states") is not None)
+        if self._exact and (not streaming):
+            if num_workers > 1:
+                raise ValueError("'num_workers' cannot be used with the exact solver unless 'num_states' is given.")
+            if len(model._label_to_index) > 20:
+                warnings.warn("dimod's ExactSolver holds all 2^n states in memory. Give 'num_states' to keep only the lowest states.")
+
+        # The streaming exact solver does not need the BQM
+        bqm = None if streaming else model.to_bqm()
 
         start_sec = time.perf_counter()
-        if self._exact:
+        worker_execution_sec = None
+        if streaming:
+            # Streaming brute force solver which keeps only the lowest states
+            sampleset, worker_execution_sec = self._solve_exact(model, num_workers, **kwargs)
+        elif self._exact:
             # dimod's brute force solver
             sampleset = self._solver.sample(bqm)
         else:
-            # Simulated annealing (SA)
-            sampleset = self._solver.sample(bqm, **kwargs)
+            # A cached default beta range is given explicitly, so that neal (and each worker) does not recompute it.
+            # On a cache miss, the range computed by neal is cached from the info of the sampleset.
+            # A custom beta schedule does not take a beta range.
+            key = None
+            if (kwargs.get("beta_range") is None) and (kwargs.get("beta_schedule_type") != "custom") and (kwargs.get("beta_schedule") is None):
+                key = model.fingerprint()
+                if key in self._beta_range_cache:
+                    self._beta_range_cache.move_to_end(key)
+                    kwargs["beta_range"] = list(self._beta_range_cache[key])
+            if num_workers == 1:
+                # Simulated annealing (SA)
+                sampleset = self._solver.sample(bqm, **kwargs)
+            else:
+                # Simulated annealing (SA) with reads split across a process pool
+                sampleset, worker_execution_sec = self._sample_in_parallel(bqm, num_workers, **kwargs)
+            if (key is not None) and (sampleset.info.get("beta_range") is not None):
+                self._cache_beta_range(key, sampleset.info["beta_range"])
 
         # Update the timing
         execution_sec = time.perf_counter() - start_sec
         sampleset.info["timing"] = {
             "execution_sec": execution_sec,
         }
+        if worker_execution_sec is not None:
+            sampleset.info["timing"]["num_workers"] = len(worker_execution_sec)
+            sampleset.info["timing"]["worker_execution_sec"] = worker_execution_sec
+            sampleset.info["timing"]["total_worker_execution_sec"] = sum(worker_execution_sec)
 
         return sampleset
 
+    def _solve_exact(self, model, num_workers, num_states, chunk_size=2**16, **kwargs):
+        """
+        Enumerates all states without holding them in memory, and returns the `num_states` lowest ones.
+        Other arguments are ignored, in the same manner as dimod's brute force solver.
+        States are enumerated by chunks of `chunk_size` states in the Gray-code order, and the enumeration is split
+        across a process pool by fixing the spins of the last variables (prefix) if num_workers > 1.
+        """
+        self._check_argument_type("num_states", num_states, int)
+        if num_states < 1:
+            raise ValueError("'num_states' must be a positive integer.")
+        self._check_argument_type("chunk_size", chunk_size, int)
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be a positive integer.")
+
+        arrays = IsingArrays(model)
+        num_variables = arrays.num_variables
+        # States are encoded into int64
+        if num_variables > 62:
+            raise ValueError("The streaming exact solver supports up to 62 variables.")
+        couplings = arrays.dense_couplings()
+        num_chunk_bits = min(num_variables, chunk_size.bit_length() - 1)
+        num_prefix_bits = min(num_variables - num_chunk_bits, (num_workers - 1).bit_length())
+        args = (arrays._h.astype(np.float64), couplings, arrays._offset, num_chunk_bits, num_prefix_bits, num_states)
+
+        if num_prefix_bits == 0:
+            results = [_enumerate_in_worker(*args, 0)]
+            worker_execution_sec = None
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(_enumerate_in_worker, *args, prefix) for prefix in range(2**num_prefix_bits)]
+                results = [future.result() for future in futures]
+            worker_execution_sec = [result[2] for result in results]
+
+        energies = np.concatenate([result[0] for result in results])
+        codes = np.concatenate([result[1] for result in results])
+        order = np.lexsort((codes, energies))[:num_states]
+        spins = ((codes[order][:, np.newaxis] >> np.arange(num_variables)) & 1) * 2 - 1
+        sampleset = dimod.SampleSet.from_samples((spins, arrays.labels), vartype=dimod.SPIN, energy=energies[order], sort_labels=True)
+        sampleset.change_vartype(arrays.vartype, inplace=True)
+        return sampleset, worker_execution_sec
+
+    def _sample_in_parallel(self, bqm, num_workers, **kwargs):
+        initial_states = None
+        if kwargs.get("initial_states") is not None:
+            initial_states = dimod.as_samples(kwargs.pop("initial_states"))
+        num_reads = kwargs.pop("num_reads", None)
+        if num_reads is None:
+            num_reads = len(initial_states[0]) if initial_states is not None else 1
+
+        # Each worker has an independent seed spawned from the given one, so that the results are reproducible
+        shards = self._split_reads(num_reads, num_workers, kwargs.pop("seed", None))
+        # The BQM is sent to each worker process once when it starts, instead of with each shard
+        with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_worker, initargs=(bqm,)) as executor:
+            futures = []
+            for indices, seed_sequence in shards:
+                # neal only accepts a 31-bit seed in practice
+                shard_kwargs = dict(kwargs, num_reads=len(indices), seed=int(seed_sequence.generate_state(1)[0] % (2**31)))
+                if initial_states is not None:
+                    # Reads beyond the given initial states are generated by the sampler as usual
+                    shard_states = initial_states[0][indices[indices < len(initial_states[0])]]
+                    if len(shard_states) > 0:
+                        shard_kwargs["initial_states"] = (shard_states, initial_states[1])
+                futures.append(executor.submit(_sample_in_worker, shard_kwargs))
+            results = [future.result() for future in futures]
+
+        sampleset = dimod.concatenate([result[0] for result in results])
+        # Info such as beta_range is the same for all shards
+        sampleset.info.update(results[0][0].info)
+        return sampleset, [result[1] for result in results]
+
     def default_beta_range(self, model):
         self._check_argument_type("model", model, PhysicalModel)
 
-        if len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0 and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0:
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
             raise ValueError("Model cannot be empty.")
 
-        return neal.default_beta_range(model.to_bqm())
+        return self._default_beta_range(model)
+
+    def _default_beta_range(self, model):
+        """
+        Returns the default beta range of neal for the model, which is cached by the fingerprint of the model.
+        """
+        key = model.fingerprint()
+        if key in self._beta_range_cache:
+            self._beta_range_cache.move_to_end(key)
+        else:
+            self._cache_beta_range(key, neal.default_beta_range(model.to_bqm()))
+        return list(self._beta_range_cache[key])
+
+    def _cache_beta_range(self, key, beta_range):
+        self._beta_range_cache[key] = list(beta_range)
+        self._beta_range_cache.move_to_end(key)
+        while len(self._beta_range_cache) > self._cache_size:
+            self._beta_range_cache.popitem(last=False)
+
+
+# The BQM shared by all shards in a worker process
+_worker_bqm = None
+
+
+def _init_worker(bqm):
+    global _worker_bqm
+    _worker_bqm = bqm
+
+
+def _sample_in_worker(kwargs):
+    # Only the kwargs of a shard are sent to the worker, and the BQM is taken from the one set by _init_worker
+    start_sec = time.perf_counter()
+    sampleset = neal.SimulatedAnnealingSampler().sample(_worker_bqm, **kwargs)
+    return sampleset, time.perf_counter() - start_sec
+
+
+def _enumerate_in_worker(h, couplings, offset, num_chunk_bits, num_prefix_bits, num_states, prefix):
+    # Each worker enumerates the states of its prefix, and returns only its lowest states with its own timing
+    start_sec = time.perf_counter()
+    energies, codes = _enumerate_lowest_states(h, couplings, offset, num_chunk_bits, num_prefix_bits, num_states, prefix)
+    return energies, codes, time.perf_counter() - start_sec
+
+
+def _enumerate_lowest_states(h, couplings, offset, num_chunk_bits, num_prefix_bits, num_states, prefix):
+    """
+    Enumerates the Ising states whose last `num_prefix_bits` spins are given by the bits of `prefix`,
+    and returns the energies and the codes of the `num_states` lowest states, where the bit i of a code is 1 if x_i = +1.
+    Spins of the first `num_chunk_bits` variables (chunk) are enumerated at once as a matrix, and the other spins are
+    enumerated in the Gray-code order, so that a single spin is flipped between chunks. The fields from the flipped spin
+    to the chunk and the energy of the other spins are updated in O(n), and the energies of a chunk are given by a product.
+    """
+    num_variables = len(h)
+    num_high = num_variables - num_chunk_bits
+    chunk, high = slice(0, num_chunk_bits), slice(num_chunk_bits, num_variables)
+    couplings_chunk, couplings_cross, couplings_high = couplings[chunk, chunk], couplings[chunk, high], couplings[high, high]
+
+    # E(x) = -(h x + x J x / 2) + offset is split into the terms of the chunk, the cross terms and the terms of the others
+    chunk_codes = np.arange(2**num_chunk_bits, dtype=np.int64)
+    chunk_spins = (((chunk_codes[:, np.newaxis] >> np.arange(num_chunk_bits)) & 1) * 2 - 1).astype(np.float64)
+    chunk_energies = -(chunk_spins @ h[chunk] + 0.5 * np.sum((chunk_spins @ couplings_chunk) * chunk_spins, axis=1)) + offset
+
+    # Spins out of the prefix start from -1
+    num_gray_bits = num_high - num_prefix_bits
+    high_spins = np.concatenate([-np.ones(num_gray_bits), ((prefix >> np.arange(num_prefix_bits)) & 1) * 2.0 - 1.0])
+    high_code = int(np.sum(((high_spins + 1) // 2).astype(np.int64) << np.arange(num_high, dtype=np.int64)))
+    cross_fields = couplings_cross @ high_spins
+    high_fields = h[high] + couplings_high @ high_spins
+    high_energy = -float(high_spins @ (h[high] + 0.5 * couplings_high @ high_spins))
+
+    best_energies = np.zeros(0)
+    best_codes = np.zeros(0, dtype=np.int64)
+    threshold = np.inf
+    for step in range(2**num_gray_bits):
+        if step > 0:
+            # The spin to flip in the Gray-code order is given by the number of trailing zeros of the step
+            j = (step & -step).bit_length() - 1
+            high_energy += 2.0 * high_spins[j] * high_fields[j]
+            high_spins[j] *= -1
+            high_fields += 2.0 * high_spins[j] * couplings_high[:, j]
+            cross_fields += 2.0 * high_spins[j] * couplings_cross[:, j]
+            high_code ^= 1 << j
+
+        energies = chunk_energies - chunk_spins @ cross_fields + high_energy
+        candidates = np.flatnonzero(energies <= threshold)
+        if len(candidates) == 0:
+            continue
+        best_energies = np.concatenate([best_energies, energies[candidates]])
+        best_codes = np.concatenate([best_codes, (high_code << num_chunk_bits) | chunk_codes[candidates]])
+        if len(best_energies) >= num_states:
+            order = np.lexsort((best_codes, best_energies))[:num_states]
+            best_energies, best_codes = best_energies[order], best_codes[order]
+            threshold = best_energies[-1]
+
+    return best_energies, best_codes
@@ -0,0 +1,178 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import dimod
+import numpy as np
+
+import sawatabi.constants as constants
+from sawatabi.model.physical_model import PhysicalModel
+from sawatabi.solver.abstract_solver import AbstractSolver
+from sawatabi.solver.ising_arrays import IsingArrays
+
+
+class PostProcessedSolver(AbstractSolver):
+    """
+    A solver wrapper which improves the samples of the wrapped solver by local search,
+    either a steepest descent to the nearest local minimum or a tabu search.
+    """
+
+    def __init__(self, solver, method=constants.POST_PROCESS_DESCENT, tenure=None, max_iterations=None, time_limit_sec=None):
+        super().__init__()
+        self._check_argument_type("solver", solver, AbstractSolver)
+        allowed_methods = [constants.POST_PROCESS_DESCENT, constants.POST_PROCESS_TABU]
+        if method not in allowed_methods:
+            raise ValueError(f"method must be one of {allowed_methods}")
+        if tenure is not None:
+            self._check_argument_type("tenure", tenure, int)
+            if tenure < 0:
+                raise ValueError("'tenure' must be a non-negative integer.")
+        if max_iterations is not None:
+            self._check_argument_type("max_iterations", max_iterations, int)
+            if max_iterations < 1:
+                raise ValueError("'max_iterations' must be a positive integer.")
+        if time_limit_sec is not None:
+            self._check_argument_type("time_limit_sec", time_limit_sec, (int, float))
+            if time_limit_sec <= 0:
+                raise ValueError("'time_limit_sec' must be a positive number.")
+        self._solver = solver
+        self._method = method
+        self._tenure = tenure
+        self._max_iterations = max_iterations
+        self._time_limit_sec = time_limit_sec
+
+    def improve(self, model, sampleset):
+        """
+        Returns a SampleSet whose samples are improved by the local search.
+        """
+        self._check_argument_type("model", model, PhysicalModel)
+        self._check_argument_type("sampleset", sampleset, dimod.SampleSet)
+
+        arrays = IsingArrays(model)
+        if arrays.low_rank > 0:
+            raise ValueError("PostProcessedSolver does not support models with low-rank interactions.")
+        columns = [sampleset.variables.index(label) for label in arrays.labels]
+        x = sampleset.record.sample[:, columns].astype(int)
+        if sampleset.vartype is dimod.BINARY:
+            x = 2 * x - 1  # to SPIN
+
+        energies = arrays.energy(x)
+        initial_energies = energies.copy()
+        fields = arrays.local_fields(x)
+        if self._method == constants.POST_PROCESS_DESCENT:
+            x, energies, num_iterations = self._descent(arrays, x, fields, energies)
+        elif self._method == constants.POST_PROCESS_TABU:
+            x, energies, num_iterations = self._tabu(arrays, x, fields, energies)
+
+        if arrays.vartype is dimod.BINARY:
+            x = (x + 1) // 2
+
+        info = dict(sampleset.info)
+        info["post_process"] = {
+            "method": self._method,
+            "num_iterations": num_iterations,
+            "num_improved": int(np.count_nonzero(energies < initial_energies)),
+        }
+        improved = dimod.SampleSet.from_samples(
+            (x, arrays.labels),
+            vartype=arrays.vartype,
+            energy=energies,
+            info=info,
+            num_occurrences=sampleset.record.num_occurrences,
+            sort_labels=True,
+        )
+        return improved.aggregate()
+
+    def _descent(self, arrays, x, fields, energies):
+        """
+        Flips the spin which decreases the energy the most for each sample, until no flip decreases it.
+        """
+        start_sec = time.perf_counter()
+        num_iterations = 0
+        while (self._max_iterations is None) or (num_iterations < self._max_iterations):
+            diff = 2.0 * x * fields
+            indices = np.argmin(diff, axis=1)
+            best = diff[np.arange(len(x)), indices]
+            # A small tolerance avoids flipping back and forth due to rounding errors
+            rows = np.flatnonzero(best < -1e-12)
+            if len(rows) == 0:
+                break
+            arrays.flip_rows(rows, indices[rows], x, fields)
+            energies[rows] += best[rows]
+            num_iterations += 1
+            if (self._time_limit_sec is not None) and (self._time_limit_sec <= time.perf_counter() - start_sec):
+                break
+        return x, energies, num_iterations
+
+    def _tabu(self, arrays, x, fields, energies):
+        """
+        Flips the best spin which is not tabu for each sample, even if the energy increases.
+        A flipped spin becomes tabu for `tenure` iterations, unless flipping it gives a better state than ever (aspiration).
+        Returns the best states found.
+        """
+        num_reads, num_variables = x.shape
+        tenure = self._tenure if self._tenure is not None else max(1, min(20, num_variables // 4))
+        tenure = min(tenure, num_variables - 1)
+        max_iterations = self._max_iterations if self._max_iterations is not None else 10 * num_variables
+
+        best_x = x.copy()
+        best_energies = energies.copy()
+        tabu_until = np.zeros((num_reads, num_variables), dtype=int)
+        rows = np.arange(num_reads)
+
+        start_sec = time.perf_counter()
+        num_iterations = 0
+        while num_iterations < max_iterations:
+            diff = 2.0 * x * fields
+            allowed = (tabu_until <= num_iterations) | (energies[:, np.newaxis] + diff < best_energies[:, np.newaxis] - 1e-12)
+            indices = np.argmin(np.where(allowed, diff, np.inf), axis=1)
+            arrays.flip_rows(rows, indices, x, fields)
+            energies += diff[rows, indices]
+            tabu_until[rows, indices] = num_iterations + 1 + tenure
+            num_iterations += 1
+
+            improved = energies < best_energies - 1e-12
+            best_x[improved] = x[improved]
+            best_energies[improved] = energies[improved]
+
+            if (self._time_limit_sec is not None) and (self._time_limit_sec <= time.perf_counter() - start_sec):
+                break
+        return best_x, best_energies, num_iterations
+
+    def solve(self, model, **kwargs):
+        self._check_argument_type("model", model, PhysicalModel)
+
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
+            raise ValueError("Model cannot be empty.")
+
+        extra = None
+        sampleset = self._solver.solve(model, **kwargs)
+        if isinstance(sampleset, tuple):
+            # Some solvers return stats together with the sampleset
+            sampleset, extra = sampleset
+
+        start_sec = time.perf_counter()
+        sampleset = self.improve(model, sampleset)
+        if isinstance(sampleset.info.get("timing"), dict):
+            sampleset.info["timing"]["post_process_sec"] = time.perf_counter() - start_sec
+
+        if extra is None:
+            return sampleset
+        else:
+            return sampleset, extra
@@ -0,0 +1,166 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import dimod
+import numpy as np
+
+import sawatabi.constants as constants
+from sawatabi.model.physical_model import PhysicalModel
+from sawatabi.solver.abstract_solver import AbstractSolver
+
+try:
+    from dwave.preprocessing import roof_duality as _roof_duality
+except ImportError:  # pragma: no cover
+    # Older dimod ships roof duality by itself
+    from dimod.roof_duality import fix_variables as _fix_variables
+
+    def _roof_duality(bqm, strict=True):
+        return None, _fix_variables(bqm, sampling_mode=strict)
+
+
+class PresolvedSolver(AbstractSolver):
+    """
+    A solver wrapper which fixes variables whose optimal values are known in advance,
+    solves the reduced model with the wrapped solver, and expands the result back to all variables.
+    """
+
+    def __init__(self, solver, roof_duality=True, dominance=True):
+        super().__init__()
+        self._check_argument_type("solver", solver, AbstractSolver)
+        self._solver = solver
+        self._roof_duality = roof_duality
+        self._dominance = dominance
+        self._original_model = None
+        self._fixed = {}
+
+    def presolve(self, model):
+        """
+        Returns the reduced PhysicalModel. The fixed values are kept for `expand`.
+        """
+        self._check_argument_type("model", model, PhysicalModel)
+
+        self._original_model = model
+        self._fixed = {}
+        reduced = model
+
+        # Persistency via roof duality
+        if self._roof_duality and (len(reduced._label_to_index) > 0):
+            _, fixed = _roof_duality(reduced.to_bqm(), strict=True)
+            if len(fixed) > 0:
+                fixed = {k: int(v) for k, v in fixed.items()}
+                self._fixed.update(fixed)
+                reduced = reduced.fix_variables(fixed)
+
+        # Dominance: a variable whose linear term exceeds all of its interactions can be fixed.
+        # Fixing a variable may make its neighbors dominant, so repeat until nothing changes.
+        if self._dominance:
+            while len(reduced._label_to_index) > 0:
+                fixed = self._find_dominant_variables(reduced)
+                if len(fixed) == 0:
+                    break
+                self._fixed.update(fixed)
+                reduced = reduced.fix_variables(fixed)
+
+        return reduced
+
+    @staticmethod
+    def _find_dominant_variables(model):
+        # Ranges of the local field (h_i + sum_j J_ij x_j) over all states of the neighbors
+        lower = {label: 0.0 for label in model._label_to_index.keys()}
+        upper = {label: 0.0 for label in model._label_to_index.keys()}
+        for k, v in model._raw_interactions[constants.INTERACTION_LINEAR].items():
+            lower[k] += v
+            upper[k] += v
+        for k, v in model._raw_interactions[constants.INTERACTION_QUADRATIC].items():
+            for label in k:
+                if model.get_mtype() == constants.MODEL_ISING:
+                    # |h_i| > sum_j |J_ij|
+                    lower[label] -= abs(v)
+                    upper[label] += abs(v)
+                elif v < 0.0:
+                    lower[label] += v
+                else:
+                    upper[label] += v
+
+        # Note that the signs of our (sawatabi's) Hamiltonian are negative,
+        # so a variable always prefers the larger value when its local field is positive.
+        low_value = -1 if model.get_mtype() == constants.MODEL_ISING else 0
+        fixed = {}
+        for label in model._label_to_index.keys():
+            if lower[label] > 0.0:
+                fixed[label] = 1
+            elif upper[label] < 0.0:
+                fixed[label] = low_value
+        return fixed
+
+    def expand(self, sampleset):
+        """
+        Returns a SampleSet which contains the fixed variables as well as the solved ones.
+        """
+        self._check_argument_type("sampleset", sampleset, dimod.SampleSet)
+
+        labels = list(sampleset.variables) + list(self._fixed.keys())
+        fixed_values = np.array(list(self._fixed.values()), dtype=sampleset.record.sample.dtype)
+        samples = np.hstack([sampleset.record.sample, np.tile(fixed_values, (len(sampleset.record), 1))])
+
+        info = dict(sampleset.info)
+        info["presolve"] = {
+            "num_fixed": len(self._fixed),
+            "fixed": dict(self._fixed),
+        }
+        return dimod.SampleSet.from_samples(
+            (samples, labels),
+            vartype=sampleset.vartype,
+            energy=sampleset.record.energy,
+            info=info,
+            num_occurrences=sampleset.record.num_occurrences,
+            sort_labels=True,
+        )
+
+    def solve(self, model, **kwargs):
+        self._check_argument_type("model", model, PhysicalModel)
+
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
+            raise ValueError("Model cannot be empty.")
+
+        start_sec = time.perf_counter()
+        reduced = self.presolve(model)
+        presolve_sec = time.perf_counter() - start_sec
+
+        extra = None
+        if len(reduced._label_to_index) == 0:
+            # All variables are fixed, so the fixed values are the optimal solution
+            vartype = dimod.SPIN if model.get_mtype() == constants.MODEL_ISING else dimod.BINARY
+            sampleset = dimod.SampleSet.from_samples([{}], vartype=vartype, energy=[reduced.get_offset()])
+            sampleset._info = {"timing": {"execution_sec": 0.0}}
+        else:
+            sampleset = self._solver.solve(reduced, **kwargs)
+            if isinstance(sampleset, tuple):
+                # Some solvers return stats together with the sampleset
+                sampleset, extra = sampleset
+
+        sampleset = self.expand(sampleset)
+        if isinstance(sampleset.info.get("timing"), dict):
+            sampleset.info["timing"]["presolve_sec"] = presolve_sec
+
+        if extra is None:
+            return sampleset
+        else:
+            return sampleset, extra
@@ -15,24 +15,33 @@
 # import logging
 import math
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 import dimod
 import numpy as np
 
 import sawatabi.constants as constants
 from sawatabi.model.physical_model import PhysicalModel
+from sawatabi.model.physical_model_delta import PhysicalModelDelta
 from sawatabi.solver.abstract_solver import AbstractSolver
+from sawatabi.solver.ising_arrays import IsingArrays
 
 # logger = logging.getLogger(__name__)
 
 
 class SawatabiSolver(AbstractSolver):
-    def __init__(self):
+    def __init__(self, cache_size=1):
+        super().__init__()
+        self._check_argument_type("cache_size", cache_size, int)
+        if cache_size < 1:
+            raise ValueError("'cache_size' must be a positive integer.")
         self._model = None
-        self._original_bqm = None
-        self._bqm = None
+        self._arrays = None
         self._rng = None
-        super().__init__()
+        # Arrays of recently solved models keyed by their fingerprints, evicted in the LRU order
+        self._cache_size = cache_size
+        self._arrays_cache = OrderedDict()
 
     def solve(
         self,
@@ -46,19 +55,52 @@ class SawatabiSolver(AbstractSolver):
         pickup_mode=constants.PICKUP_MODE_RANDOM,
         seed=None,
         need_stats=False,
+        delta=None,
+        dtype="float64",
+        vectorized=False,
+        num_workers=1,
+        tempering_options=None,
+        population_options=None,
+        cluster_options=None,
+        early_stopping=None,
+        time_limit_sec=None,
+        stats_stride=1,
+        kernel=constants.KERNEL_AUTO,
+        return_best=False,
+        restart_options=None,
+        schedule=constants.SCHEDULE_MANUAL,
+        schedule_interpolation=constants.INTERPOLATION_GEOMETRIC,
+        frozen=None,
     ):
         self._check_argument_type("model", model, PhysicalModel)
 
-        if len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0 and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0:
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
             raise ValueError("Model cannot be empty.")
 
-        if initial_states and (len(initial_states) != num_reads):
+        if (initial_states is not None) and (len(initial_states) != 0) and (len(initial_states) != num_reads):
             raise ValueError("Length of initial_states must be the same as num_reads.")
 
-        allowed_pickup_mode = [constants.PICKUP_MODE_RANDOM, constants.PICKUP_MODE_SEQUENTIAL]
+        allowed_pickup_mode = [constants.PICKUP_MODE_RANDOM, constants.PICKUP_MODE_SEQUENTIAL, constants.PICKUP_MODE_COLORING]
         if pickup_mode not in allowed_pickup_mode:
             raise ValueError(f"pickup_mode must be one of {allowed_pickup_mode}")
 
+        allowed_kernel = [constants.KERNEL_AUTO, constants.KERNEL_SPARSE, constants.KERNEL_DENSE]
+        if kernel not in allowed_kernel:
+            raise ValueError(f"kernel must be one of {allowed_kernel}")
+
+        allowed_schedule = [constants.SCHEDULE_MANUAL, constants.SCHEDULE_AUTO]
+        if schedule not in allowed_schedule:
+            raise ValueError(f"schedule must be one of {allowed_schedule}")
+        allowed_interpolation = [constants.INTERPOLATION_GEOMETRIC, constants.INTERPOLATION_LINEAR]
+        if schedule_interpolation not in allowed_interpolation:
+            raise ValueError(f"schedule_interpolation must be one of {allowed_interpolation}")
+        if (schedule == constants.SCHEDULE_AUTO) and (reverse_options or tempering_options):
+            raise ValueError("The auto schedule cannot be used together with reverse_options or tempering_options")
+
         if reverse_options:
             self._check_argument_type("reverse_options", reverse_options, dict)
             if "reverse_period" not in reverse_options:
@@ -66,53 +108,324 @@ class SawatabiSolver(AbstractSolver):
             if "reverse_temperature" not in reverse_options:
                 raise ValueError("reverse_options must contain 'reverse_temperature'")
 
+        if tempering_options:
+            self._check_argument_type("tempering_options", tempering_options, dict)
+            if "min_temperature" not in tempering_options:
+                raise ValueError("tempering_options must contain 'min_temperature'")
+            if "max_temperature" not in tempering_options:
+                raise ValueError("tempering_options must contain 'max_temperature'")
+            if not (0.0 < tempering_options["min_temperature"] <= tempering_options["max_temperature"]):
+                raise ValueError("tempering_options must satisfy 0 < 'min_temperature' <= 'max_temperature'")
+            if tempering_options.get("num_replicas", 8) < 1:
+                raise ValueError("'num_replicas' in tempering_options must be a positive integer.")
+            if reverse_options:
+                raise ValueError("tempering_options cannot be used together with reverse_options")
+
+        if population_options is not None:
+            self._check_argument_type("population_options", population_options, dict)
+            if population_options.get("sweeps_per_step", 1) < 1:
+                raise ValueError("'sweeps_per_step' in population_options must be a positive integer.")
+            if tempering_options or reverse_options:
+                raise ValueError("population_options cannot be used together with tempering_options or reverse_options")
+
+        if cluster_options:
+            self._check_argument_type("cluster_options", cluster_options, dict)
+            allowed_cluster_methods = [constants.CLUSTER_METHOD_SWENDSEN_WANG, constants.CLUSTER_METHOD_HOUDAYER]
+            if cluster_options.get("method", constants.CLUSTER_METHOD_SWENDSEN_WANG) not in allowed_cluster_methods:
+                raise ValueError(f"'method' in cluster_options must be one of {allowed_cluster_methods}")
+            if cluster_options.get("interval", 1) < 1:
+                raise ValueError("'interval' in cluster_options must be a positive integer.")
+            if tempering_options or (population_options is not None):
+                raise ValueError("cluster_options cannot be used together with tempering_options or population_options")
+
+        if early_stopping:
+            self._check_argument_type("early_stopping", early_stopping, dict)
+            allowed_keys = ["zero_acceptance_sweeps", "stagnation_sweeps", "stagnation_tolerance"]
+            for key in early_stopping.keys():
+                if key not in allowed_keys:
+                    raise ValueError(f"early_stopping can only contain {allowed_keys}")
+            for key in ["zero_acceptance_sweeps", "stagnation_sweeps"]:
+                if (key in early_stopping) and (early_stopping[key] < 1):
+                    raise ValueError(f"'{key}' in early_stopping must be a positive integer.")
+
+        if time_limit_sec is not None:
+            self._check_argument_type("time_limit_sec", time_limit_sec, (int, float))
+            if time_limit_sec <= 0:
+                raise ValueError("'time_limit_sec' must be a positive number.")
+
+        self._check_argument_type("return_best", return_best, bool)
+        if return_best and (population_options is not None):
+            raise ValueError("return_best cannot be used together with population_options")
+
+        if restart_options is not None:
+            self._check_argument_type("restart_options", restart_options, dict)
+            if restart_options.get("stagnation_sweeps", 10) < 1:
+                raise ValueError("'stagnation_sweeps' in restart_options must be a positive integer.")
+            if not (0.0 < restart_options.get("elite_fraction", 0.25) <= 1.0):
+                raise ValueError("'elite_fraction' in restart_options must be in (0, 1].")
+            if not (0.0 <= restart_options.get("perturbation", 0.1) <= 1.0):
+                raise ValueError("'perturbation' in restart_options must be in [0, 1].")
+            if tempering_options or (population_options is not None):
+                raise ValueError("restart_options cannot be used together with tempering_options or population_options")
+
+        if frozen is not None:
+            if (initial_states is None) or (len(initial_states) == 0):
+                raise ValueError("frozen needs initial_states which hold the values of the frozen variables.")
+            if (pickup_mode == constants.PICKUP_MODE_COLORING) or cluster_options or (population_options is not None) or (restart_options is not None):
+                raise ValueError("frozen cannot be used together with the coloring pickup mode, cluster_options, population_options or restart_options")
+
+        if (early_stopping or (time_limit_sec is not None)) and (tempering_options or (population_options is not None)):
+            raise ValueError("early_stopping and time_limit_sec cannot be used together with tempering_options or population_options")
+
+        if delta is not None:
+            self._check_argument_type("delta", delta, PhysicalModelDelta)
+
+        self._check_argument_type("num_workers", num_workers, int)
+        if num_workers < 1:
+            raise ValueError("'num_workers' must be a positive integer.")
+
+        self._check_argument_type("stats_stride", stats_stride, int)
+        if stats_stride < 1:
+            raise ValueError("'stats_stride' must be a positive integer.")
+
         # Use a rangom generator so that this random sequence is isolated
         if seed:
             self._rng = np.random.default_rng(seed)
         else:
             self._rng = np.random.default_rng()
 
-        bqm = model.to_bqm(sign=1.0)
-        self._original_bqm = bqm
+        # Coefficients are stored into arrays in the Ising (SPIN) form for speed up.
+        # Arrays of a model solved recently are reused as they are.
+        # If a delta is given, only the changes are applied to the cached arrays of the model which the delta was taken from,
+        # and the arrays are built from the model if they are not cached in the same dtype.
+        # The dtype is a part of the key, because casting the coefficients back to a wider dtype would lose precision.
+        key = (model.fingerprint(), dtype)
+        base_key = (delta.get_base_fingerprint(), dtype) if delta is not None else None
+        if key in self._arrays_cache:
+            self._arrays = self._arrays_cache[key]
+            self._arrays_cache.move_to_end(key)
+        elif base_key in self._arrays_cache:
+            # The base arrays are changed in place, so they are cached for the new model instead
+            self._arrays = self._arrays_cache.pop(base_key)
+            self._arrays.apply_delta(delta)
+            self._arrays_cache[key] = self._arrays
+        else:
+            self._arrays = IsingArrays(model, dtype=dtype)
+            self._arrays_cache[key] = self._arrays
+        while len(self._arrays_cache) > self._cache_size:
+            self._arrays_cache.popitem(last=False)
+        if kernel == constants.KERNEL_AUTO:
+            kernel = self._select_kernel(self._arrays)
+        self._arrays.set_kernel(kernel)
+
+        if (self._arrays.low_rank > 0) and ((pickup_mode == constants.PICKUP_MODE_COLORING) or cluster_options):
+            raise ValueError("The coloring pickup mode and cluster_options cannot be used for a model with low-rank interactions.")
+        self._model = model
 
         # To Ising model for SawatabiSolver annealing process
-        if bqm.vartype is not dimod.SPIN:
-            bqm = bqm.change_vartype(dimod.SPIN, inplace=False)
+        initial_states = self._to_initial_matrix(initial_states)
 
-            # Convert initial states as well
-            if initial_states:
-                for i, initial_state in enumerate(initial_states):
-                    for k, v in initial_state.items():
-                        if v == 0:
-                            initial_states[i][k] = -1
+        # Only the variables which are not frozen are picked up, while the frozen spins still contribute to the local fields
+        active = self._to_active_indices(frozen) if (frozen is not None) else None
 
-        self._model = model
-        self._bqm = bqm
-
-        # For speed up, store coefficients into a list (array)
-        self._bqm_linear = [0.0 for _ in range(self._bqm.num_variables)]
-        for label, coeff in self._bqm.linear.items():
-            index = self._model._label_to_index[label]
-            self._bqm_linear[index] = coeff
-        self._bqm_adj = [{} for _ in range(self._bqm.num_variables)]
-        for label, adj in self._bqm.adj.items():
-            index = self._model._label_to_index[label]
-            adj_dict = {}
-            for alabel, coeff in adj.items():
-                aindex = self._model._label_to_index[alabel]
-                adj_dict[aindex] = coeff
-            self._bqm_adj[index] = adj_dict
+        # The auto schedule replaces initial_temperature and cooling_rate with temperatures derived from the coefficients
+        temperatures = None
+        if schedule == constants.SCHEDULE_AUTO:
+            hot_temperature, cold_temperature = self._auto_temperature_range(self._arrays)
+            temperatures = self._interpolate_temperatures(num_sweeps, hot_temperature, cold_temperature, schedule_interpolation)
+
+        sample_kwargs = {
+            "num_sweeps": num_sweeps,
+            "cooling_rate": cooling_rate,
+            "initial_temperature": initial_temperature,
+            "reverse_options": reverse_options,
+            "pickup_mode": pickup_mode,
+            "vectorized": vectorized,
+            "tempering_options": tempering_options,
+            "population_options": population_options,
+            "cluster_options": cluster_options,
+            "early_stopping": early_stopping,
+            # Stats are not recorded at all if they are not needed
+            "stats_stride": stats_stride if need_stats else None,
+            "return_best": return_best,
+            "restart_options": restart_options,
+            "temperatures": temperatures,
+            "active": active,
+        }
 
         start_sec = time.perf_counter()
+        # The deadline is shared across all reads, and is in the wall-clock time so that it is valid in worker processes as well
+        sample_kwargs["deadline"] = (time.time() + time_limit_sec) if (time_limit_sec is not None) else None
 
-        samples = []
-        energies = []
+        if num_workers == 1:
+            x, energies, stats, info = self._sample(num_reads=num_reads, initial_states=initial_states, **sample_kwargs)
+            worker_execution_sec = None
+        else:
+            # Reads are split across a process pool, and each worker anneals its shard with an independent random stream
+            shards = self._split_reads(num_reads, num_workers, seed)
+            with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                futures = []
+                for indices, seed_sequence in shards:
+                    shard_kwargs = dict(sample_kwargs, num_reads=len(indices))
+                    shard_kwargs["initial_states"] = initial_states[indices] if (initial_states is not None) else None
+                    futures.append(executor.submit(_sample_in_worker, self._arrays, seed_sequence, shard_kwargs))
+                results = [future.result() for future in futures]
+            x = np.vstack([result[0] for result in results])
+            energies = np.concatenate([result[1] for result in results])
+            stats = [st for result in results for st in result[2]]
+            info = {}
+            if population_options is not None:
+                # Populations of the workers are independent, so their partition functions are averaged by their sizes
+                log_z = [result[3]["log_partition_function"] + np.log(len(indices) / num_reads) for result, (indices, _) in zip(results, shards)]
+                info["log_partition_function"] = np.logaddexp.reduce(log_z)
+            if tempering_options:
+                # Swaps are attempted in proportion to the number of reads, so the rates are averaged by the shard sizes
+                swap_rates = [result[3]["swap_acceptance_rates"] * len(indices) for result, (indices, _) in zip(results, shards)]
+                info["swap_acceptance_rates"] = np.sum(swap_rates, axis=0) / num_reads
+            if "stop_reasons" in results[0][3]:
+                info["stop_reasons"] = [reason for result in results for reason in result[3]["stop_reasons"]]
+            worker_execution_sec = [result[4] for result in results]
+
+        # Update the timing
+        execution_sec = time.perf_counter() - start_sec
+
+        samples = (x, self._arrays.labels)
+        sampleset = dimod.SampleSet.from_samples(samples, vartype=dimod.SPIN, energy=energies, aggregate_samples=True, sort_labels=True)
+        sampleset._info = {
+            "timing": {
+                "execution_sec": execution_sec,
+            },
+        }
+        if worker_execution_sec is not None:
+            sampleset._info["timing"]["num_workers"] = len(worker_execution_sec)
+            sampleset._info["timing"]["worker_execution_sec"] = worker_execution_sec
+            sampleset._info["timing"]["total_worker_execution_sec"] = sum(worker_execution_sec)
+        if "stop_reasons" in info:
+            sampleset._info["stop_reason"] = self._summarize_stop_reasons(info["stop_reasons"])
+            sampleset._info["stop_reasons"] = info["stop_reasons"]
+        if "log_partition_function" in info:
+            # F = -T log Z at each temperature step
+            log_z = info["log_partition_function"]
+            if temperatures is None:
+                temperatures = self._temperature_schedule(num_sweeps, cooling_rate, initial_temperature, None)
+            free_energies = -temperatures * log_z
+            sampleset._info["population"] = {
+                "log_partition_function_history": log_z.tolist(),
+                "free_energy_history": free_energies.tolist(),
+                "free_energy": float(free_energies[-1]),
+            }
+        if schedule == constants.SCHEDULE_AUTO:
+            sampleset._info["schedule"] = {
+                "hot_temperature": hot_temperature,
+                "cold_temperature": cold_temperature,
+                "interpolation": schedule_interpolation,
+            }
+        if "swap_acceptance_rates" in info:
+            sampleset._info["tempering"] = {
+                "swap_acceptance_rates": info["swap_acceptance_rates"].tolist(),
+            }
+
+        sampleset = sampleset.change_vartype(self._arrays.vartype, inplace=True)
+        if not need_stats:
+            return sampleset
+        else:
+            return sampleset, stats
+
+    def _sample(
+        self,
+        num_reads,
+        num_sweeps,
+        cooling_rate,
+        initial_temperature,
+        initial_states,
+        reverse_options,
+        pickup_mode,
+        vectorized,
+        tempering_options,
+        population_options,
+        cluster_options,
+        early_stopping,
+        deadline,
+        stats_stride,
+        return_best=False,
+        restart_options=None,
+        temperatures=None,
+        active=None,
+    ):
+        """
+        Anneals the reads with the current arrays and random generator.
+        If temperatures are given, they are used instead of the schedule by cooling_rate and initial_temperature.
+        If active indices are given, only the spins of them are flipped.
+        Returns spins as a (num_reads, num_variables) matrix, energies, stats for each read as structured arrays,
+        and a dict which holds the estimates of log Z at each temperature step (only for population annealing),
+        the swap acceptance rates (only for parallel tempering) or the reasons why the reads stopped.
+        """
+        if population_options is not None:
+            x, energies, energy_hist, temperature_hist, acceptance_hist, log_z = self.population_annealing(
+                num_reads=num_reads,
+                num_sweeps=num_sweeps,
+                cooling_rate=cooling_rate,
+                initial_temperature=initial_temperature,
+                initial_states=initial_states,
+                sweeps_per_step=population_options.get("sweeps_per_step", 1),
+                pickup_mode=pickup_mode,
+                stats_stride=stats_stride,
+                temperatures=temperatures,
+            )
+            stats = [self._stats_record(stats_stride, energy_hist[:, r], temperature_hist, acceptance_hist[:, r]) for r in range(num_reads)]
+            return x, energies, stats, {"log_partition_function": log_z}
+
+        if tempering_options:
+            x, energies, energy_hist, temperature_hist, acceptance_hist, swap_rates = self.tempering(
+                num_reads=num_reads,
+                num_sweeps=num_sweeps,
+                initial_states=initial_states,
+                tempering_options=tempering_options,
+                pickup_mode=pickup_mode,
+                stats_stride=stats_stride,
+                active=active,
+            )
+            # Histories hold a value for each replica ordered by the temperature ladder
+            stats = [self._stats_record(stats_stride, energy_hist[:, r], temperature_hist, acceptance_hist[:, r]) for r in range(num_reads)]
+            return x, energies, stats, {"swap_acceptance_rates": swap_rates}
+
+        if vectorized or (pickup_mode == constants.PICKUP_MODE_COLORING) or cluster_options or (restart_options is not None):
+            # All reads are annealed together as a (num_reads, num_variables) spin matrix.
+            # Spins of the same color are updated simultaneously in the coloring mode, and cluster moves and restarts
+            # work on the matrix, so they always use this path.
+            x, energies, energy_hist, temperature_hist, acceptance_hist, stop_reason = self.annealing_replicas(
+                num_reads=num_reads,
+                num_sweeps=num_sweeps,
+                cooling_rate=cooling_rate,
+                initial_temperature=initial_temperature,
+                initial_states=initial_states,
+                reverse_options=reverse_options,
+                pickup_mode=pickup_mode,
+                cluster_options=cluster_options,
+                early_stopping=early_stopping,
+                deadline=deadline,
+                stats_stride=stats_stride,
+                return_best=return_best,
+                restart_options=restart_options,
+                temperatures=temperatures,
+                active=active,
+            )
+            stats = [self._stats_record(stats_stride, energy_hist[:, r], temperature_hist, acceptance_hist[:, r]) for r in range(num_reads)]
+            return x, energies, stats, {"stop_reasons": [stop_reason] * num_reads}
+
+        x = np.zeros((num_reads, self._arrays.num_variables), dtype=int)
+        energies = np.zeros(num_reads)
         stats = []
+        stop_reasons = []
         for r in range(num_reads):
+            # Reads after the deadline are not started, but at least one read is returned
+            if (r > 0) and (deadline is not None) and (deadline <= time.time()):
+                x, energies = x[:r], energies[:r]
+                break
             initial_state_for_this_read = None
-            if initial_states:
+            if initial_states is not None:
                 initial_state_for_this_read = initial_states[r]
-            sample, energy, energy_hist, temperature_hist, acceptance_hist = self.annealing(
+            spins, energy, energy_hist, temperature_hist, acceptance_hist, stop_reason = self.annealing(
                 num_reads=num_reads,
                 num_sweeps=num_sweeps,
                 cooling_rate=cooling_rate,
@@ -120,140 +433,760 @@ class SawatabiSolver(AbstractSolver):
                 initial_state=initial_state_for_this_read,
                 reverse_options=reverse_options,
                 pickup_mode=pickup_mode,
+                early_stopping=early_stopping,
+                deadline=deadline,
+                stats_stride=stats_stride,
+                return_best=return_best,
+                temperatures=temperatures,
+                active=active,
             )
             # These samples and energies are in the Ising (SPIN) format
-            samples.append(sample)
-            energies.append(energy)
-            stats.append(
-                {
-                    "energy_history": energy_hist,
-                    "temperature_history": temperature_hist,
-                    "acceptance_history": acceptance_hist,
-                }
-            )
+            x[r] = spins
+            energies[r] = energy
+            stop_reasons.append(stop_reason)
+            stats.append(self._stats_record(stats_stride, energy_hist, temperature_hist, acceptance_hist))
+        return x, energies, stats, {"stop_reasons": stop_reasons}
 
-        # Update the timing
-        execution_sec = time.perf_counter() - start_sec
+    @staticmethod
+    def _select_kernel(arrays):
+        """
+        Returns the dense kernel for (almost) fully connected models such as TSP and NPP, as long as the matrix is not too large.
+        """
+        num_variables = arrays.num_variables
+        if (arrays.density >= 0.5) and (num_variables * num_variables * arrays.dtype.itemsize <= 2**28):
+            return constants.KERNEL_DENSE
+        return constants.KERNEL_SPARSE
 
-        sampleset = dimod.SampleSet.from_samples(samples, vartype=dimod.SPIN, energy=energies, aggregate_samples=True, sort_labels=True)
-        sampleset._info = {
-            "timing": {
-                "execution_sec": execution_sec,
-            },
-        }
+    def _to_initial_matrix(self, initial_states):
+        """
+        Returns initial states as a (num_reads, num_variables) matrix of spins in the order of the labels of the arrays.
+        initial_states can be either a list of dicts from labels to values, or a matrix (such as an int8 array)
+        whose columns are in the `_index_to_label` order of the model. Values of a QUBO model (0 or 1) are converted to spins.
+        The given states are not modified.
+        """
+        if (initial_states is None) or (len(initial_states) == 0):
+            return None
 
-        sampleset = sampleset.change_vartype(self._original_bqm.vartype, inplace=True)
-        if not need_stats:
-            return sampleset
+        if self._arrays.vartype is dimod.SPIN:
+            allowed_values = [-1, 1]
         else:
-            return sampleset, stats
+            allowed_values = [0, 1]
+
+        if isinstance(initial_states, np.ndarray):
+            if initial_states.shape[1:] != (self._arrays.num_variables,):
+                raise ValueError(f"initial_states must be a matrix with {self._arrays.num_variables} columns.")
+            states = initial_states.astype(int)
+        else:
+            states = np.array([[state[label] for label in self._arrays.labels] for state in initial_states], dtype=int)
+
+        if not np.all(np.isin(states, allowed_values)):
+            raise ValueError(f"Values of initial_states must be one of {allowed_values}.")
+        if self._arrays.vartype is not dimod.SPIN:
+            states = 2 * states - 1
+        return states
+
+    def _to_active_indices(self, frozen):
+        """
+        Returns the indices of the variables which are not frozen, in the order of the labels of the arrays.
+        frozen can be either a boolean mask whose elements are in the `_index_to_label` order of the model, or labels of the variables.
+        """
+        if isinstance(frozen, np.ndarray) and (frozen.dtype == bool):
+            if frozen.shape != (self._arrays.num_variables,):
+                raise ValueError(f"frozen must be a mask with {self._arrays.num_variables} elements.")
+            return np.flatnonzero(~frozen)
+
+        self._check_argument_type("frozen", frozen, (list, tuple, set, np.ndarray))
+        index = {label: i for i, label in enumerate(self._arrays.labels)}
+        unknown = [label for label in frozen if label not in index]
+        if len(unknown) > 0:
+            raise ValueError(f"Labels in frozen must be variables of the model: {unknown}")
+        mask = np.zeros(self._arrays.num_variables, dtype=bool)
+        mask[[index[label] for label in frozen]] = True
+        return np.flatnonzero(~mask)
+
+    @staticmethod
+    def _stats_record(stats_stride, energy_hist, temperature_hist, acceptance_hist):
+        """
+        Returns the histories of a read as a structured array, which has a row for each recorded sweep.
+        Fields of the histories are sub-arrays if they hold a value for each replica (parallel tempering).
+        """
+        dtype = [
+            ("sweep", np.int64),
+            ("energy_history", np.float64, energy_hist.shape[1:]),
+            ("temperature_history", np.float64, temperature_hist.shape[1:]),
+            ("acceptance_history", np.int64, acceptance_hist.shape[1:]),
+        ]
+        record = np.zeros(len(energy_hist), dtype=dtype)
+        record["sweep"] = np.arange(len(energy_hist)) * (stats_stride or 1)
+        record["energy_history"] = energy_hist
+        record["temperature_history"] = temperature_hist
+        record["acceptance_history"] = acceptance_hist
+        return record
 
-    def annealing(self, num_reads, num_sweeps, cooling_rate, initial_temperature, initial_state, reverse_options, pickup_mode):
-        num_variables = self._bqm.num_variables
+    def annealing(
+        self,
+        num_reads,
+        num_sweeps,
+        cooling_rate,
+        initial_temperature,
+        initial_state,
+        reverse_options,
+        pickup_mode,
+        early_stopping=None,
+        deadline=None,
+        stats_stride=1,
+        return_best=False,
+        temperatures=None,
+        active=None,
+    ):
+        num_variables = self._arrays.num_variables
         if initial_state is None:
             x = ((self._rng.integers(2, size=num_variables) - 0.5) * 2).astype(int)  # -1 or +1
         else:
-            x = np.ones(shape=(num_variables), dtype=int)
-            for v in self._bqm.variables:
-                idx = self._model._label_to_index[v]
-                x[idx] = initial_state[v]
-
-        initial_sample = dict(zip(list(self._model._index_to_label.values()), x))
-        # logger.info(f"initial_spins: {initial_sample}")
-        initial_energy = self._bqm.energy(initial_sample) * -1.0  # Note that the signs of original bqm is opposite from ours
+            x = np.array(initial_state, dtype=int)
+
+        # logger.info(f"initial_spins: {dict(zip(self._arrays.labels, x))}")
+        initial_energy = self._arrays.energy(x)
+
+        # Local fields (h_i + sum_j J_ij x_j) are kept up to date on each flip,
+        # so that a proposal only needs to look up the local field of the picked spin.
+        fields = self._arrays.local_fields(x)
         # logger.info(f"initial_energy: {initial_energy}")
 
-        if not reverse_options:
-            # Forward (normal) annealing
-            temperature = initial_temperature
-        else:
-            # Reverse annealing
-            temperature = 1e-9
-            reverse_target_temperature = reverse_options["reverse_temperature"]  # The max temperature when the phase is reverse annealing
+        # Temperatures of all sweeps, including the reverse annealing phase if any
+        if temperatures is None:
+            temperatures = self._temperature_schedule(num_sweeps, cooling_rate, initial_temperature, reverse_options)
 
         energy = initial_energy
-        reversing_phase = True if reverse_options is not None else False
         sweep = 0
 
-        energy_hist = []
-        temperature_hist = []
-        acceptance_hist = []
+        # The best state is checked at the end of each sweep, and copied only when it is improved
+        best_x, best_energy = (x.copy(), energy) if return_best else (None, None)
+
+        # Stats are recorded every `stats_stride` sweeps into preallocated buffers
+        num_records = _num_records(num_sweeps, stats_stride)
+        energy_hist = np.zeros(num_records)
+        temperature_hist = np.zeros(num_records)
+        acceptance_hist = np.zeros(num_records, dtype=int)
+        recorded = 0
 
-        # Create a random values for accept beforehand for speed up
-        self._accept_randoms = self._rng.random(size=num_sweeps * num_variables)
-        self._accept_randoms_idx = -1
+        # Early stopping is not checked while reversing, because the temperature starts from almost zero
+        criteria = _StoppingCriteria(early_stopping, deadline, reverse_options["reverse_period"] if reverse_options else 0)
+        stop_reason = constants.STOP_REASON_NUM_SWEEPS
 
         for sweep in range(num_sweeps):  # outer loop (=sweeps)
-            # Normal annealing in the last half of period if reverse annealing is performed
-            if reversing_phase and (reverse_options["reverse_period"] <= sweep):
-                reversing_phase = False
+            temperature = temperatures[sweep]
+            # logger.info(f"sweep: {sweep + 1}/{num_sweeps}  (temperature: {temperature})")
+
+            recording = (stats_stride is not None) and (sweep % stats_stride == 0)
+            if recording:
+                energy_hist[recorded] = energy
+                temperature_hist[recorded] = temperature
 
-            # logger.info(f"sweep: {sweep + 1}/{num_sweeps}  (temperature: {temperature}, reversing_phase: {reversing_phase})")
+            # Pick up a spin (variable) randomly or sequentially
+            pickups = self._pickups(pickup_mode, active)
 
-            energy_hist.append(energy)
-            temperature_hist.append(temperature)
+            # Random values for accept are created for each sweep, so that the memory does not grow with the number of sweeps.
+            # A flip is accepted if diff <= -T * log(u), which is equivalent to u < exp(-diff / T)
+            thresholds = (-temperature * np.log1p(-self._rng.random(size=len(pickups)))).tolist()
 
-            # Pick up a spin (variable) randomly
-            if pickup_mode == constants.PICKUP_MODE_RANDOM:
-                pickups = self._rng.permutation(num_variables)
-            # Pick up a spin (variable) sequentially
-            elif pickup_mode == constants.PICKUP_MODE_SEQUENTIAL:
-                pickups = np.arange(num_variables)
+            # Projections onto the low-rank factors are recalculated for each sweep in O(n * rank) to avoid drifting
+            projections = self._arrays.low_rank_projections(x) if (self._arrays.low_rank > 0) else None
 
             acceptances = 0
             for inner, idx in enumerate(pickups):  # inner loop
                 # logger.debug(f"inner: {inner + 1}/{num_variables}  (pickuped: {idx})")
 
                 # `diff` represents an energy value gained after flipping
-                diff = self.calc_energy_diff(idx, x)
+                diff = self.calc_energy_diff(idx, x, fields, projections)
 
-                if self.is_acceptable(diff, temperature):
-                    x[idx] *= -1
+                if diff <= thresholds[inner]:
+                    if projections is not None:
+                        projections[0][:] -= 2 * x[idx] * self._arrays._low_rank_u[idx]
+                        projections[1][:] -= 2 * x[idx] * self._arrays._low_rank_v[idx]
+                    self._arrays.flip(idx, x, fields)
                     energy += diff
                     acceptances += 1
                     # logger.debug(f"Spin {self._model._index_to_label[idx]} was flipped to {x[idx]}")
                 # logger.debug(f"energy: {energy}")
 
-            acceptance_hist.append(acceptances)
+            if recording:
+                acceptance_hist[recorded] = acceptances
+                recorded += 1
+
+            if return_best and (energy < best_energy):
+                best_x, best_energy = x.copy(), energy
+
+            reason = criteria.update(sweep, acceptances, energy)
+            if reason is not None:
+                stop_reason = reason
+                break
+
+        # Check energy if needed
+        # recalc_energy = self._arrays.energy(x)
+        # assert math.isclose(energy, recalc_energy, rel_tol=1e-9, abs_tol=1e-9)
+
+        if return_best:
+            x, energy = best_x, best_energy
+
+        return x, energy, energy_hist[:recorded], temperature_hist[:recorded], acceptance_hist[:recorded], stop_reason
+
+    def annealing_replicas(
+        self,
+        num_reads,
+        num_sweeps,
+        cooling_rate,
+        initial_temperature,
+        initial_states,
+        reverse_options,
+        pickup_mode,
+        cluster_options=None,
+        early_stopping=None,
+        deadline=None,
+        stats_stride=1,
+        return_best=False,
+        restart_options=None,
+        temperatures=None,
+        active=None,
+    ):
+        """
+        Anneals all reads together. Spins of all replicas are held in a (num_reads, num_variables) matrix,
+        and energy diffs and Metropolis acceptances are calculated for all replicas at once.
+        If cluster_options are given, a cluster move is performed every `interval` sweeps.
+        If restart_options are given, reads whose best energies have not been improved for `stagnation_sweeps` sweeps
+        restart from one of the best states of the elite reads, with a fraction (`perturbation`) of the spins flipped randomly.
+        All replicas stop together, when none of them accepts a flip or the lowest energy among them stagnates.
+        """
+        num_variables = self._arrays.num_variables
+        if initial_states is None:
+            x = ((self._rng.integers(2, size=(num_reads, num_variables)) - 0.5) * 2).astype(int)  # -1 or +1
+        else:
+            x = np.array(initial_states, dtype=int)
+
+        energies = self._arrays.energy(x)
+        fields = self._arrays.local_fields(x)
+        if temperatures is None:
+            temperatures = self._temperature_schedule(num_sweeps, cooling_rate, initial_temperature, reverse_options)
 
+        num_records = _num_records(num_sweeps, stats_stride)
+        energy_hist = np.zeros((num_records, num_reads))
+        acceptance_hist = np.zeros((num_records, num_reads), dtype=int)
+
+        criteria = _StoppingCriteria(early_stopping, deadline, reverse_options["reverse_period"] if reverse_options else 0)
+        stop_reason = constants.STOP_REASON_NUM_SWEEPS
+        num_sweeps_done = num_sweeps
+
+        # Restarts need the best states, because the current states of the restarted reads are discarded
+        tracking = return_best or (restart_options is not None)
+        if tracking:
+            best_x = x.copy()
+            best_energies = energies.copy()
+            last_improved = np.zeros(num_reads, dtype=int)
+
+        for sweep in range(num_sweeps):  # outer loop (=sweeps)
+            recording = (stats_stride is not None) and (sweep % stats_stride == 0)
+            if recording:
+                energy_hist[sweep // stats_stride] = energies
+
+            if pickup_mode == constants.PICKUP_MODE_COLORING:
+                acceptances = self._sweep_replicas_by_color(x, fields, energies, temperatures[sweep])
+            else:
+                acceptances = self._sweep_replicas(x, fields, energies, temperatures[sweep], self._pickups(pickup_mode, active))
+            if recording:
+                acceptance_hist[sweep // stats_stride] = acceptances
+
+            if cluster_options and ((sweep + 1) % cluster_options.get("interval", 1) == 0):
+                method = cluster_options.get("method", constants.CLUSTER_METHOD_SWENDSEN_WANG)
+                if method == constants.CLUSTER_METHOD_SWENDSEN_WANG:
+                    self._swendsen_wang(x, temperatures[sweep])
+                elif method == constants.CLUSTER_METHOD_HOUDAYER:
+                    self._houdayer(x)
+                # Flipping clusters changes many fields, so they are recalculated at once
+                fields[:] = self._arrays.local_fields(x)
+                energies[:] = self._arrays.energy(x)
+
+            if tracking:
+                improved = energies < best_energies
+                best_x[improved] = x[improved]
+                best_energies[improved] = energies[improved]
+                last_improved[improved] = sweep
+                if restart_options is not None:
+                    self._restart_stagnant_reads(x, fields, energies, best_x, best_energies, last_improved, sweep, restart_options)
+
+            reason = criteria.update(sweep, np.sum(acceptances), np.min(energies))
+            if reason is not None:
+                stop_reason = reason
+                num_sweeps_done = sweep + 1
+                break
+
+        if tracking:
+            x, energies = best_x, best_energies
+
+        num_records = _num_records(num_sweeps_done, stats_stride)
+        temperature_hist = temperatures[:: stats_stride or 1][:num_records]
+        return (
+            x,
+            energies,
+            energy_hist[:num_records],
+            temperature_hist,
+            acceptance_hist[:num_records],
+            stop_reason,
+        )
+
+    def _restart_stagnant_reads(self, x, fields, energies, best_x, best_energies, last_improved, sweep, restart_options):
+        """
+        Restarts the stagnant reads in place from perturbed best states of the elite reads.
+        The best states of the restarted reads are kept, so nothing found so far is lost.
+        """
+        stagnant = np.flatnonzero(sweep - last_improved >= restart_options.get("stagnation_sweeps", 10))
+        if len(stagnant) == 0:
+            return
+
+        num_reads, num_variables = x.shape
+        num_elites = max(1, int(np.ceil(restart_options.get("elite_fraction", 0.25) * num_reads)))
+        elites = np.argsort(best_energies, kind="stable")[:num_elites]
+        sources = self._rng.choice(elites, size=len(stagnant))
+
+        states = best_x[sources].copy()
+        states[self._rng.random(size=states.shape) < restart_options.get("perturbation", 0.1)] *= -1
+        x[stagnant] = states
+        fields[stagnant] = self._arrays.local_fields(states)
+        energies[stagnant] = self._arrays.energy(states)
+        last_improved[stagnant] = sweep
+
+    def _swendsen_wang(self, x, temperature):
+        """
+        Performs a Swendsen-Wang cluster move on all replicas in place.
+        Each satisfied interaction (J_{ij} * x_i * x_j > 0) is bonded with the probability 1 - exp(-2 |J_{ij}| / T),
+        which is the ordinary Swendsen-Wang for ferromagnetic interactions. Since bonded interactions stay satisfied
+        and the others do not depend on the spins, each cluster is flipped independently by the heat bath on its linear terms.
+        """
+        num_reads, num_variables = x.shape
+        rows, cols, couplings = self._arrays._csr_to_coo()
+
+        satisfied = couplings[np.newaxis, :] * x[:, rows] * x[:, cols] > 0.0
+        probabilities = -np.expm1(-2.0 * np.abs(couplings) / temperature)
+        bonded = satisfied & (self._rng.random(size=satisfied.shape) < probabilities[np.newaxis, :])
+
+        # Nodes of the r-th replica have ids from r * num_variables to (r + 1) * num_variables - 1
+        replicas, edges = np.nonzero(bonded)
+        labels = IsingArrays.connected_components(num_reads * num_variables, replicas * num_variables + rows[edges], replicas * num_variables + cols[edges])
+
+        # Energy diff of the linear terms by flipping each cluster, and its heat bath probability to flip
+        diff = np.bincount(labels, weights=(2.0 * x * self._arrays._h[np.newaxis, :]).ravel(), minlength=num_reads * num_variables)
+        flip_probabilities = 0.5 * (1.0 - np.tanh(diff / (2.0 * temperature)))
+        flipped = self._rng.random(size=num_reads * num_variables) < flip_probabilities
+        x[flipped[labels].reshape(num_reads, num_variables)] *= -1
+
+    def _houdayer(self, x):
+        """
+        Performs a Houdayer cluster move on pairs of replicas (0, 1), (2, 3), ... in place.
+        A cluster is grown from a random variable on which the two replicas disagree, through the interactions
+        between such variables, and flipped in both replicas. The total energy of the pair is unchanged, so it is always accepted.
+        """
+        num_pairs = x.shape[0] // 2
+        num_variables = x.shape[1]
+        if num_pairs == 0:
+            return
+        rows, cols, _ = self._arrays._csr_to_coo()
+        end = 2 * num_pairs
+        first, second = x[0:end:2], x[1:end:2]
+        disagree = first != second
+
+        pairs, edges = np.nonzero(disagree[:, rows] & disagree[:, cols])
+        labels = IsingArrays.connected_components(num_pairs * num_variables, pairs * num_variables + rows[edges], pairs * num_variables + cols[edges])
+        labels = labels.reshape(num_pairs, num_variables)
+
+        # Pick up a disagreeing variable randomly for each pair
+        seeds = np.argmax(np.where(disagree, self._rng.random(size=disagree.shape), -1.0), axis=1)
+        cluster = (labels == labels[np.arange(num_pairs), seeds][:, np.newaxis]) & disagree
+        first[cluster] *= -1
+        second[cluster] *= -1
+
+    def population_annealing(
+        self,
+        num_reads,
+        num_sweeps,
+        cooling_rate,
+        initial_temperature,
+        initial_states,
+        sweeps_per_step,
+        pickup_mode,
+        stats_stride=1,
+        temperatures=None,
+    ):
+        """
+        Population annealing. A population of num_reads states is reweighted by the Boltzmann factor and resampled
+        at each temperature step, and then swept a few times at the new temperature.
+        Returns the final population and estimates of log Z at each temperature step from the mean weights.
+        The histories in the stats follow the ancestors of each final state.
+        """
+        num_variables = self._arrays.num_variables
+        if initial_states is None:
+            x = ((self._rng.integers(2, size=(num_reads, num_variables)) - 0.5) * 2).astype(int)  # -1 or +1
+        else:
+            x = np.array(initial_states, dtype=int)
+
+        energies = self._arrays.energy(x)
+        fields = self._arrays.local_fields(x)
+        if temperatures is None:
+            temperatures = self._temperature_schedule(num_sweeps, cooling_rate, initial_temperature, None)
+
+        # A random population is a sample at the infinite temperature (beta = 0), where Z = 2^n.
+        # Note that the estimates of log Z are biased if initial states are given.
+        beta = 0.0
+        log_z = num_variables * np.log(2.0)
+
+        num_records = _num_records(num_sweeps, stats_stride)
+        energy_hist = np.zeros((num_records, num_reads))
+        acceptance_hist = np.zeros((num_records, num_reads), dtype=int)
+        # Parents of all steps are needed to trace back the lineages, but only if the stats are recorded
+        parents = np.zeros((num_sweeps if stats_stride is not None else 0, num_reads), dtype=int)
+        log_z_hist = np.zeros(num_sweeps)
+
+        for step in range(num_sweeps):
+            # Reweight: Z(beta') / Z(beta) = mean( exp(-(beta' - beta) * E) )
+            next_beta = 1.0 / temperatures[step]
+            log_weights = -(next_beta - beta) * energies
+            max_log_weight = np.max(log_weights)
+            weights = np.exp(log_weights - max_log_weight)
+            log_z += max_log_weight + np.log(np.mean(weights))
+            beta = next_beta
+
+            # Resample the population in proportion to the weights
+            parent = self._rng.choice(num_reads, size=num_reads, p=weights / np.sum(weights))
+            x, fields, energies = x[parent], fields[parent], energies[parent]
+
+            log_z_hist[step] = log_z
+            recording = (stats_stride is not None) and (step % stats_stride == 0)
+            if stats_stride is not None:
+                parents[step] = parent
+            if recording:
+                energy_hist[step // stats_stride] = energies
+
+            for _ in range(sweeps_per_step):
+                if pickup_mode == constants.PICKUP_MODE_COLORING:
+                    acceptances = self._sweep_replicas_by_color(x, fields, energies, temperatures[step])
+                else:
+                    acceptances = self._sweep_replicas(x, fields, energies, temperatures[step], self._pickups(pickup_mode))
+                if recording:
+                    acceptance_hist[step // stats_stride] += acceptances
+
+        # Trace back the ancestors of the final population
+        lineage = np.arange(num_reads)
+        for step in reversed(range(len(parents))):
+            if step % stats_stride == 0:
+                energy_hist[step // stats_stride] = energy_hist[step // stats_stride, lineage]
+                acceptance_hist[step // stats_stride] = acceptance_hist[step // stats_stride, lineage]
+            lineage = parents[step, lineage]
+
+        temperature_hist = temperatures[:: stats_stride or 1][:num_records]
+        return x, energies, energy_hist, temperature_hist, acceptance_hist, log_z_hist
+
+    def tempering(self, num_reads, num_sweeps, initial_states, tempering_options, pickup_mode, stats_stride=1, active=None):
+        """
+        Parallel tempering (replica exchange). Each read holds replicas on a ladder of temperatures,
+        all replicas are swept together by the vectorized kernel, and replicas on neighboring temperatures
+        exchange their temperatures periodically. Returns the best state found in the replicas of each read.
+        """
+        num_variables = self._arrays.num_variables
+        num_replicas = tempering_options.get("num_replicas", 8)
+        swap_interval = tempering_options.get("swap_interval", 1)
+        adaptive = tempering_options.get("adaptive", False)
+        ladder = self._temperature_ladder(num_replicas, tempering_options["min_temperature"], tempering_options["max_temperature"])
+
+        # Rows of the r-th read are from r * num_replicas to (r + 1) * num_replicas - 1
+        num_rows = num_reads * num_replicas
+        if initial_states is None:
+            x = ((self._rng.integers(2, size=(num_rows, num_variables)) - 0.5) * 2).astype(int)  # -1 or +1
+        else:
+            x = np.repeat(np.array(initial_states, dtype=int), num_replicas, axis=0)
+
+        energies = self._arrays.energy(x)
+        fields = self._arrays.local_fields(x)
+        temperatures = np.zeros(num_rows)
+
+        # replica_at[r, k] is the row of the replica at the k-th temperature of the ladder for the r-th read.
+        # Swapping temperatures instead of states avoids copying spins and fields.
+        replica_at = np.arange(num_rows).reshape(num_reads, num_replicas)
+
+        best_x = x[replica_at[:, 0]].copy()
+        best_energies = energies[replica_at[:, 0]].copy()
+
+        num_records = _num_records(num_sweeps, stats_stride)
+        energy_hist = np.zeros((num_records, num_reads, num_replicas))
+        temperature_hist = np.zeros((num_records, num_replicas))
+        acceptance_hist = np.zeros((num_records, num_reads, num_replicas), dtype=int)
+        swap_attempts = np.zeros(num_replicas - 1, dtype=int)
+        swap_accepts = np.zeros(num_replicas - 1, dtype=int)
+        adapt_attempts = np.zeros(num_replicas - 1, dtype=int)
+        adapt_accepts = np.zeros(num_replicas - 1, dtype=int)
+        swap_round = 0
+
+        for sweep in range(num_sweeps):  # outer loop (=sweeps)
+            temperatures[replica_at] = ladder[np.newaxis, :]
+            recording = (stats_stride is not None) and (sweep % stats_stride == 0)
+            if recording:
+                energy_hist[sweep // stats_stride] = energies[replica_at]
+                temperature_hist[sweep // stats_stride] = ladder
+
+            if pickup_mode == constants.PICKUP_MODE_COLORING:
+                acceptances = self._sweep_replicas_by_color(x, fields, energies, temperatures)
+            else:
+                acceptances = self._sweep_replicas(x, fields, energies, temperatures, self._pickups(pickup_mode, active))
+            if recording:
+                acceptance_hist[sweep // stats_stride] = acceptances[replica_at]
+
+            # Keep the best state found in the replicas
+            lowest = np.argmin(energies.reshape(num_reads, num_replicas), axis=1)
+            rows = np.arange(num_reads) * num_replicas + lowest
+            improved = energies[rows] < best_energies
+            best_x[improved] = x[rows[improved]]
+            best_energies[improved] = energies[rows[improved]]
+
+            if (num_replicas == 1) or ((sweep + 1) % swap_interval != 0):
+                continue
+
+            # Even and odd pairs of the ladder are tried alternately, so that the pairs in a round are independent
+            k = np.arange(swap_round % 2, num_replicas - 1, 2)
+            swap_round += 1
+            rows_a, rows_b = replica_at[:, k], replica_at[:, k + 1]
+            # Accept with min(1, exp((1 / T_k - 1 / T_{k+1}) * (E_k - E_{k+1})))
+            delta = (1.0 / ladder[k] - 1.0 / ladder[k + 1]) * (energies[rows_a] - energies[rows_b])
+            accepted = np.log1p(-self._rng.random(size=delta.shape)) < delta
+            replica_at[:, k] = np.where(accepted, rows_b, rows_a)
+            replica_at[:, k + 1] = np.where(accepted, rows_a, rows_b)
+            swap_attempts[k] += num_reads
+            swap_accepts[k] += np.count_nonzero(accepted, axis=0)
+
+            # The ladder is adapted only in the first half of the sweeps, so that the second half samples with a fixed ladder
+            if adaptive and (sweep < num_sweeps // 2):
+                adapt_attempts[k] += num_reads
+                adapt_accepts[k] += np.count_nonzero(accepted, axis=0)
+                if swap_round % 10 == 0:
+                    ladder = self._adapt_temperature_ladder(ladder, adapt_accepts / np.maximum(adapt_attempts, 1))
+                    adapt_attempts[:] = 0
+                    adapt_accepts[:] = 0
+
+        swap_rates = swap_accepts / np.maximum(swap_attempts, 1)
+        return best_x, best_energies, energy_hist, temperature_hist, acceptance_hist, swap_rates
+
+    @staticmethod
+    def _temperature_ladder(num_replicas, min_temperature, max_temperature):
+        """
+        Returns geometrically spaced temperatures from the min to the max.
+        """
+        if num_replicas == 1:
+            return np.array([float(min_temperature)])
+        return min_temperature * (max_temperature / min_temperature) ** (np.arange(num_replicas) / (num_replicas - 1))
+
+    @staticmethod
+    def _adapt_temperature_ladder(ladder, swap_rates):
+        """
+        Returns a ladder whose (log-scale) gaps are widened where swaps are accepted often and narrowed where they are not,
+        so that the swap rates become even. The min and max temperatures are kept.
+        """
+        gaps = np.diff(np.log(ladder))
+        gaps = gaps * (swap_rates + 0.01) / (np.mean(swap_rates) + 0.01)
+        gaps = gaps * np.log(ladder[-1] / ladder[0]) / np.sum(gaps)
+        return ladder[0] * np.exp(np.concatenate([[0.0], np.cumsum(gaps)]))
+
+    def _pickups(self, pickup_mode, active=None):
+        """
+        Returns the variables to be picked up in a sweep in order, which are only the active ones if given.
+        """
+        variables = np.arange(self._arrays.num_variables) if (active is None) else active
+        if pickup_mode == constants.PICKUP_MODE_RANDOM:
+            return self._rng.permutation(variables)
+        return variables
+
+    def _sweep_replicas(self, x, fields, energies, temperature, pickups):
+        """
+        Performs one Metropolis sweep on all replicas in place, and returns the numbers of accepted flips.
+        `temperature` can be either a scalar or an array holding a temperature for each replica.
+        """
+        num_reads = x.shape[0]
+        indptr, indices, data = self._arrays._indptr, self._arrays._indices, self._arrays._data
+        dense = self._arrays._dense
+        low_rank = self._arrays.low_rank > 0
+        if low_rank:
+            u, v, diag = self._arrays._low_rank_u, self._arrays._low_rank_v, self._arrays._low_rank_diag
+            p, q = self._arrays.low_rank_projections(x)
+
+        # A flip is accepted if diff <= -T * log(u), which is equivalent to u < exp(-diff / T)
+        thresholds = -np.reshape(temperature, (-1, 1)) * np.log1p(-self._rng.random(size=(num_reads, len(pickups))))
+
+        acceptances = np.zeros(num_reads, dtype=int)
+        for inner, idx in enumerate(pickups):
+            diff = 2.0 * x[:, idx] * fields[:, idx]
+            if low_rank:
+                diff += x[:, idx] * (q @ u[idx] + p @ v[idx]) - 2.0 * diag[idx]
+            accepted = np.flatnonzero(diff <= thresholds[:, inner])
+            if len(accepted) == 0:
+                continue
+            x[accepted, idx] *= -1
+            energies[accepted] += diff[accepted]
+            acceptances[accepted] += 1
+            if low_rank:
+                p[accepted] += 2 * x[accepted, idx][:, np.newaxis] * u[idx][np.newaxis, :]
+                q[accepted] += 2 * x[accepted, idx][:, np.newaxis] * v[idx][np.newaxis, :]
+            if dense is not None:
+                # Fields of all variables are updated by adding the column of the flipped spin
+                fields[accepted] += (2 * x[accepted, idx])[:, np.newaxis] * dense[np.newaxis, idx]
+                continue
+            start, end = indptr[idx], indptr[idx + 1]
+            fields[np.ix_(accepted, indices[start:end])] += (2 * x[accepted, idx])[:, np.newaxis] * data[np.newaxis, start:end]
+
+        return acceptances
+
+    def _sweep_replicas_by_color(self, x, fields, energies, temperature):
+        """
+        Performs one Metropolis sweep on all replicas in place, updating all spins of a color at once.
+        This is exact because spins of the same color do not interact with each other.
+        """
+        num_reads, num_variables = x.shape
+        thresholds = -np.reshape(temperature, (-1, 1)) * np.log1p(-self._rng.random(size=(num_reads, num_variables)))
+
+        acceptances = np.zeros(num_reads, dtype=int)
+        for color_class in self._arrays.color_classes():
+            variables = color_class[0]
+            diff = 2.0 * x[:, variables] * fields[:, variables]
+            accepted = diff <= thresholds[:, variables]
+            self._arrays.flip_class(color_class, x, fields, accepted)
+            energies += np.sum(np.where(accepted, diff, 0.0), axis=1)
+            acceptances += np.count_nonzero(accepted, axis=1)
+
+        return acceptances
+
+    @staticmethod
+    def _summarize_stop_reasons(stop_reasons):
+        """
+        Returns the reason to stop for the whole solve: time_limit if any read hit the deadline,
+        num_sweeps if all reads ran all sweeps, or otherwise the most common early stopping reason.
+        """
+        if constants.STOP_REASON_TIME_LIMIT in stop_reasons:
+            return constants.STOP_REASON_TIME_LIMIT
+        early_reasons = [reason for reason in stop_reasons if reason != constants.STOP_REASON_NUM_SWEEPS]
+        if len(early_reasons) == 0:
+            return constants.STOP_REASON_NUM_SWEEPS
+        return max(sorted(set(early_reasons)), key=early_reasons.count)
+
+    @staticmethod
+    def _temperature_schedule(num_sweeps, cooling_rate, initial_temperature, reverse_options):
+        """
+        Returns temperatures for each sweep as an array.
+        """
+        temperatures = np.zeros(num_sweeps)
+        if not reverse_options:
+            # Forward (normal) annealing
+            temperature = initial_temperature
+        else:
+            # Reverse annealing
+            temperature = 1e-9
+            reverse_target_temperature = reverse_options["reverse_temperature"]
+        reversing_phase = True if reverse_options else False
+
+        for sweep in range(num_sweeps):
+            if reversing_phase and (reverse_options["reverse_period"] <= sweep):
+                reversing_phase = False
+            temperatures[sweep] = temperature
             if reversing_phase:
                 reverse_target_temperature *= cooling_rate
                 temperature = reverse_options["reverse_temperature"] - reverse_target_temperature
             else:
                 temperature *= cooling_rate
 
-        sample = dict(zip(list(self._model._index_to_label.values()), x))
+        return temperatures
 
-        # Check energy if needed
-        # recalc_energy = self._bqm.energy(sample) * -1.0
-        # assert math.isclose(energy, recalc_energy, rel_tol=1e-9, abs_tol=1e-9)
-
-        # Deal with offset
-        energy += self._original_bqm.offset * 2
-
-        return sample, energy, energy_hist, temperature_hist, acceptance_hist
+    @staticmethod
+    def _auto_temperature_range(arrays):
+        """
+        Returns the hot and cold temperatures derived from the coefficients, in the same manner as neal.default_beta_range.
+        At the hot temperature, a flip with the largest energy diff is accepted with the probability of 50%,
+        and at the cold temperature, a flip with the smallest energy diff is accepted with the probability of 1%.
+        """
+        min_diff, max_diff = arrays.energy_diff_range()
+        return max_diff / np.log(2.0), min_diff / np.log(100.0)
 
-    def calc_energy_diff(self, idx, x):
-        # h_{i}
-        diff = x[idx] * self._bqm_linear[idx]
+    @staticmethod
+    def _interpolate_temperatures(num_sweeps, hot_temperature, cold_temperature, interpolation):
+        """
+        Returns temperatures for each sweep from the hot one to the cold one,
+        interpolated geometrically in the temperature, or linearly in the inverse temperature (beta).
+        """
+        if interpolation == constants.INTERPOLATION_GEOMETRIC:
+            return np.geomspace(hot_temperature, cold_temperature, num_sweeps)
+        return 1.0 / np.linspace(1.0 / hot_temperature, 1.0 / cold_temperature, num_sweeps)
 
-        # J_{ij}
-        for aidx, j in self._bqm_adj[idx].items():
-            diff += x[idx] * x[aidx] * j
+    def calc_energy_diff(self, idx, x, fields, projections=None):
+        # fields[idx] holds h_{i} + sum_{j} J_{ij} * x_j
+        diff = x[idx] * fields[idx]
 
         # Now the calculated diff is the local energy at x[idx].
         # If the spin flips from -1 to +1 (vice versa), the diff energy will be double.
-        return 2.0 * diff
+        diff = 2.0 * diff
 
-    def is_acceptable(self, diff, temperature):
-        """
-        Returns True if the flip is acceptable, False otherwise.
-        """
-        if diff <= 0.0:
-            return True
+        # Low-rank interactions are calculated from the projections (x U, x V) in O(rank)
+        if projections is not None:
+            p, q = projections
+            u, v = self._arrays._low_rank_u[idx], self._arrays._low_rank_v[idx]
+            diff += x[idx] * (u @ q + v @ p) - 2.0 * self._arrays._low_rank_diag[idx]
+        return diff
+
+
+def _num_records(num_sweeps, stats_stride):
+    """
+    Returns the number of sweeps recorded in the stats, which is zero if the stats are not recorded.
+    """
+    if stats_stride is None:
+        return 0
+    return (num_sweeps + stats_stride - 1) // stats_stride
+
+
+class _StoppingCriteria:
+    """
+    Tracks the early stopping criteria and the deadline during an annealing, and tells the reason to stop if any.
+    """
+
+    def __init__(self, early_stopping, deadline, start_sweep=0):
+        early_stopping = early_stopping or {}
+        self._zero_acceptance_sweeps = early_stopping.get("zero_acceptance_sweeps")
+        self._stagnation_sweeps = early_stopping.get("stagnation_sweeps")
+        self._stagnation_tolerance = early_stopping.get("stagnation_tolerance", 0.0)
+        self._deadline = deadline
+        self._start_sweep = start_sweep
+        self._num_zero_acceptance_sweeps = 0
+        self._num_stagnation_sweeps = 0
+        self._best_energy = math.inf
+
+    def update(self, sweep, num_acceptances, energy):
+        if (self._deadline is not None) and (self._deadline <= time.time()):
+            return constants.STOP_REASON_TIME_LIMIT
+        if sweep < self._start_sweep:
+            return None
+
+        if num_acceptances == 0:
+            self._num_zero_acceptance_sweeps += 1
+        else:
+            self._num_zero_acceptance_sweeps = 0
+        if energy < self._best_energy - self._stagnation_tolerance:
+            self._best_energy = energy
+            self._num_stagnation_sweeps = 0
         else:
-            p = math.exp(-diff / temperature)  # Note: np.exp is slow here
-            self._accept_randoms_idx += 1
-            if self._accept_randoms[self._accept_randoms_idx] < p:
-                return True
-        return False
+            self._num_stagnation_sweeps += 1
+
+        if (self._zero_acceptance_sweeps is not None) and (self._zero_acceptance_sweeps <= self._num_zero_acceptance_sweeps):
+            return constants.STOP_REASON_ZERO_ACCEPTANCE
+        if (self._stagnation_sweeps is not None) and (self._stagnation_sweeps <= self._num_stagnation_sweeps):
+            return constants.STOP_REASON_STAGNATION
+        return None
+
+
+def _sample_in_worker(arrays, seed_sequence, kwargs):
+    # A fresh solver holds the arrays sent from the parent, so that the conversion from the model is not repeated in the worker
+    solver = SawatabiSolver()
+    solver._arrays = arrays
+    solver._rng = np.random.default_rng(seed_sequence)
+    start_sec = time.perf_counter()
+    x, energies, stats, info = solver._sample(**kwargs)
+    return x, energies, stats, info, time.perf_counter() - start_sec
@@ -0,0 +1,217 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import dimod
+import numpy as np
+
+import sawatabi.constants as constants
+from sawatabi.model.physical_model import PhysicalModel
+from sawatabi.solver.abstract_solver import AbstractSolver
+from sawatabi.solver.ising_arrays import IsingArrays
+
+
+class SQASolver(AbstractSolver):
+    """
+    A simulated quantum annealing solver by the path-integral Monte Carlo method.
+    The model with a transverse field Γ is mapped to P classical replicas (Trotter slices) by the Suzuki-Trotter decomposition,
+    where the spins of the same variable in neighboring slices are coupled ferromagnetically by
+    J_perp = (P T / 2) log coth(Γ / (P T)). Γ is decreased over sweeps, so that the slices are gradually aligned.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._arrays = None
+        self._rng = None
+
+    def solve(
+        self,
+        model,
+        num_reads=1,
+        num_sweeps=100,
+        num_trotter_slices=8,
+        temperature=None,
+        initial_gamma=None,
+        final_gamma=None,
+        gamma_interpolation=constants.INTERPOLATION_LINEAR,
+        pickup_mode=constants.PICKUP_MODE_RANDOM,
+        seed=None,
+        need_stats=False,
+        dtype="float64",
+    ):
+        """
+        Anneals the model by decreasing Γ from initial_gamma to final_gamma at the fixed temperature.
+        By default, the temperature is the cold end of the auto schedule of SawatabiSolver, Γ starts at the largest energy diff
+        of a single flip, and ends at 1/1000 of the initial one.
+        For each read, the slice with the lowest energy is returned.
+        """
+        self._check_argument_type("model", model, PhysicalModel)
+
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
+            raise ValueError("Model cannot be empty.")
+
+        self._check_argument_type("num_trotter_slices", num_trotter_slices, int)
+        if num_trotter_slices < 1:
+            raise ValueError("'num_trotter_slices' must be a positive integer.")
+
+        allowed_interpolation = [constants.INTERPOLATION_GEOMETRIC, constants.INTERPOLATION_LINEAR]
+        if gamma_interpolation not in allowed_interpolation:
+            raise ValueError(f"gamma_interpolation must be one of {allowed_interpolation}")
+
+        allowed_pickup_mode = [constants.PICKUP_MODE_RANDOM, constants.PICKUP_MODE_SEQUENTIAL]
+        if pickup_mode not in allowed_pickup_mode:
+            raise ValueError(f"pickup_mode must be one of {allowed_pickup_mode}")
+
+        self._arrays = IsingArrays(model, dtype=dtype)
+        if self._arrays.low_rank > 0:
+            raise ValueError("SQASolver does not support models with low-rank interactions.")
+
+        min_diff, max_diff = self._arrays.energy_diff_range()
+        if temperature is None:
+            temperature = min_diff / np.log(100.0)
+        if initial_gamma is None:
+            initial_gamma = max_diff
+        if final_gamma is None:
+            final_gamma = initial_gamma * 1e-3
+        if temperature <= 0.0:
+            raise ValueError("'temperature' must be a positive number.")
+        if not (0.0 < final_gamma <= initial_gamma):
+            raise ValueError("Gammas must satisfy 0 < 'final_gamma' <= 'initial_gamma'")
+
+        # Use a rangom generator so that this random sequence is isolated
+        if seed:
+            self._rng = np.random.default_rng(seed)
+        else:
+            self._rng = np.random.default_rng()
+
+        start_sec = time.perf_counter()
+        gammas = self._gamma_schedule(num_sweeps, initial_gamma, final_gamma, gamma_interpolation)
+        x, energies, energy_hist, acceptance_hist = self.annealing(num_reads, num_trotter_slices, temperature, gammas, pickup_mode, need_stats)
+        execution_sec = time.perf_counter() - start_sec
+
+        samples = (x, self._arrays.labels)
+        sampleset = dimod.SampleSet.from_samples(samples, vartype=dimod.SPIN, energy=energies, aggregate_samples=True, sort_labels=True)
+        sampleset._info = {
+            "timing": {
+                "execution_sec": execution_sec,
+            },
+            "sqa": {
+                "num_trotter_slices": num_trotter_slices,
+                "temperature": temperature,
+                "initial_gamma": initial_gamma,
+                "final_gamma": final_gamma,
+            },
+        }
+        sampleset = sampleset.change_vartype(self._arrays.vartype, inplace=True)
+        if not need_stats:
+            return sampleset
+        else:
+            stats = [self._stats_record(energy_hist[:, r], gammas, acceptance_hist[:, r]) for r in range(num_reads)]
+            return sampleset, stats
+
+    def annealing(self, num_reads, num_trotter_slices, temperature, gammas, pickup_mode, need_stats=False):
+        """
+        Anneals the Trotter slices of all reads together. Spins are held in a (num_reads * P, num_variables) matrix,
+        whose row r * P + k is the slice k of the read r, and a spin of a variable is updated in the slices which are not
+        neighboring each other at once, by the local fields plus the coupling between the slices.
+        Returns the slice with the lowest energy for each read, and the histories of the lowest energies among the slices
+        and the numbers of accepted flips if needed.
+        """
+        num_variables = self._arrays.num_variables
+        num_slices = num_trotter_slices
+        num_rows = num_reads * num_slices
+        x = ((self._rng.integers(2, size=(num_rows, num_variables)) - 0.5) * 2).astype(int)  # -1 or +1
+        fields = self._arrays.local_fields(x)
+
+        rows = np.arange(num_rows)
+        prev_rows = (rows // num_slices) * num_slices + (rows - 1) % num_slices
+        next_rows = (rows // num_slices) * num_slices + (rows + 1) % num_slices
+        rows_by_group = [rows[np.isin(rows % num_slices, group)] for group in self._slice_groups(num_slices)]
+
+        # The classical energies are summed over the slices, so the Metropolis criterion is at P times the temperature
+        slice_temperature = num_slices * temperature
+
+        num_sweeps = len(gammas)
+        energy_hist = np.zeros((num_sweeps if need_stats else 0, num_reads))
+        acceptance_hist = np.zeros((num_sweeps if need_stats else 0, num_reads), dtype=int)
+        for sweep, gamma in enumerate(gammas):
+            # A single slice has no neighbors to be coupled with
+            j_perp = -0.5 * slice_temperature * np.log(np.tanh(gamma / slice_temperature)) if num_slices > 1 else 0.0
+            num_acceptances = np.zeros(num_reads, dtype=int)
+            for step in range(num_variables):
+                for group_rows in rows_by_group:
+                    if pickup_mode == constants.PICKUP_MODE_RANDOM:
+                        indices = self._rng.integers(num_variables, size=len(group_rows))
+                    else:
+                        indices = np.full(len(group_rows), step)
+                    trotter = x[prev_rows[group_rows], indices] + x[next_rows[group_rows], indices]
+                    diff = 2.0 * x[group_rows, indices] * (fields[group_rows, indices] + j_perp * trotter)
+                    thresholds = -slice_temperature * np.log1p(-self._rng.random(len(group_rows)))
+                    accepted = diff <= thresholds
+                    self._arrays.flip_rows(group_rows[accepted], indices[accepted], x, fields)
+                    num_acceptances += np.bincount(group_rows[accepted] // num_slices, minlength=num_reads)
+            if need_stats:
+                energy_hist[sweep] = np.min(self._arrays.energy(x).reshape(num_reads, num_slices), axis=1)
+                acceptance_hist[sweep] = num_acceptances
+
+        energies = self._arrays.energy(x).reshape(num_reads, num_slices)
+        best_slices = np.argmin(energies, axis=1)
+        reads = np.arange(num_reads)
+        return x[reads * num_slices + best_slices], energies[reads, best_slices], energy_hist, acceptance_hist
+
+    @staticmethod
+    def _slice_groups(num_slices):
+        """
+        Returns groups of the slices which do not neighbor each other in the periodic Trotter direction,
+        so that the spins of a variable in a group can be flipped at once.
+        """
+        if num_slices == 1:
+            return [np.array([0])]
+        groups = [np.arange(0, num_slices - (num_slices % 2), 2), np.arange(1, num_slices, 2)]
+        if num_slices % 2 == 1:
+            # The last slice neighbors the first one
+            groups.append(np.array([num_slices - 1]))
+        return groups
+
+    @staticmethod
+    def _gamma_schedule(num_sweeps, initial_gamma, final_gamma, interpolation):
+        """
+        Returns the transverse fields for each sweep, interpolated linearly or geometrically.
+        """
+        if interpolation == constants.INTERPOLATION_GEOMETRIC:
+            return np.geomspace(initial_gamma, final_gamma, num_sweeps)
+        return np.linspace(initial_gamma, final_gamma, num_sweeps)
+
+    @staticmethod
+    def _stats_record(energy_hist, gamma_hist, acceptance_hist):
+        """
+        Returns the histories of a read as a structured array, which has a row for each sweep.
+        """
+        dtype = [
+            ("sweep", np.int64),
+            ("energy_history", np.float64),
+            ("gamma_history", np.float64),
+            ("acceptance_history", np.int64),
+        ]
+        record = np.zeros(len(energy_hist), dtype=dtype)
+        record["sweep"] = np.arange(len(energy_hist))
+        record["energy_history"] = energy_hist
+        record["gamma_history"] = gamma_hist
+        record["acceptance_history"] = acceptance_hist
+        return record
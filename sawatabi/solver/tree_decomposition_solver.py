@@ -0,0 +1,226 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import time
+
+import dimod
+import numpy as np
+
+import sawatabi.constants as constants
+from sawatabi.model.physical_model import PhysicalModel
+from sawatabi.solver.abstract_solver import AbstractSolver
+from sawatabi.solver.ising_arrays import IsingArrays
+
+
+class TreeDecompositionSolver(AbstractSolver):
+    """
+    An exact solver for models whose coupling graphs have small treewidth, such as chains and near-trees.
+    Variables are eliminated in the order given by the min-fill heuristic (bucket elimination), where each bucket is
+    a NumPy table over a bag of the tree decomposition. The optimum is found in O(n * 2^w) for the width w.
+    The lowest states after the optimum are enumerated by partitioning the space of states (Lawler-Murty),
+    whose subproblems are evaluated by the tables of the buckets without solving them again.
+    """
+
+    def __init__(self, max_treewidth=20):
+        super().__init__()
+        self._check_argument_type("max_treewidth", max_treewidth, int)
+        if max_treewidth < 0:
+            raise ValueError("'max_treewidth' must be a non-negative integer.")
+        self._max_treewidth = max_treewidth
+
+    def solve(self, model, num_states=1):
+        self._check_argument_type("model", model, PhysicalModel)
+
+        if (
+            len(model._raw_interactions[constants.INTERACTION_LINEAR]) == 0
+            and len(model._raw_interactions[constants.INTERACTION_QUADRATIC]) == 0
+            and len(model._low_rank_interactions) == 0
+        ):
+            raise ValueError("Model cannot be empty.")
+
+        self._check_argument_type("num_states", num_states, int)
+        if num_states < 1:
+            raise ValueError("'num_states' must be a positive integer.")
+
+        arrays = IsingArrays(model)
+        if arrays.low_rank > 0:
+            raise ValueError("TreeDecompositionSolver does not support models with low-rank interactions.")
+
+        start_sec = time.perf_counter()
+        rows, cols, data = arrays._csr_to_coo()
+        order, treewidth = self._min_fill_order(arrays.num_variables, rows, cols, self._max_treewidth)
+        if treewidth > self._max_treewidth:
+            raise ValueError(f"The treewidth of the model exceeds max_treewidth ({self._max_treewidth}).")
+
+        buckets = _Buckets(order, arrays._h.astype(np.float64), rows, cols, data.astype(np.float64))
+        spins = buckets.lowest_states(num_states)
+        energies = arrays.energy(spins)
+        execution_sec = time.perf_counter() - start_sec
+
+        sampleset = dimod.SampleSet.from_samples((spins, arrays.labels), vartype=dimod.SPIN, energy=energies, sort_labels=True)
+        sampleset._info = {
+            "timing": {
+                "execution_sec": execution_sec,
+            },
+            "treewidth": treewidth,
+        }
+        sampleset = sampleset.change_vartype(arrays.vartype, inplace=True)
+        return sampleset
+
+    @staticmethod
+    def _min_fill_order(num_variables, rows, cols, max_treewidth=None):
+        """
+        Returns an elimination order by the min-fill heuristic, and the width of the tree decomposition given by the order.
+        A variable which adds the fewest edges among its neighbors is eliminated first, and ties are broken by
+        the degree and then by the index. The search stops as soon as the width exceeds max_treewidth, if given.
+        """
+        adjacency = [set() for _ in range(num_variables)]
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            adjacency[i].add(j)
+            adjacency[j].add(i)
+
+        def cost(v):
+            fill = sum(1 for a, b in itertools.combinations(adjacency[v], 2) if b not in adjacency[a])
+            return fill, len(adjacency[v])
+
+        costs = [cost(v) for v in range(num_variables)]
+        heap = [(c[0], c[1], v) for v, c in enumerate(costs)]
+        heapq.heapify(heap)
+        eliminated = np.zeros(num_variables, dtype=bool)
+        order = []
+        treewidth = 0
+        while heap:
+            fill, degree, v = heapq.heappop(heap)
+            # Entries with outdated costs are skipped (lazy deletion)
+            if eliminated[v] or (costs[v] != (fill, degree)):
+                continue
+            neighbors = adjacency[v]
+            treewidth = max(treewidth, len(neighbors))
+            if (max_treewidth is not None) and (treewidth > max_treewidth):
+                break
+            for a, b in itertools.combinations(neighbors, 2):
+                adjacency[a].add(b)
+                adjacency[b].add(a)
+            for a in neighbors:
+                adjacency[a].discard(v)
+            eliminated[v] = True
+            order.append(v)
+
+            # Costs of the neighbors and their neighbors are changed by the elimination
+            affected = set(neighbors)
+            for a in neighbors:
+                affected |= adjacency[a]
+            for a in affected:
+                c = cost(a)
+                if c != costs[a]:
+                    costs[a] = c
+                    heapq.heappush(heap, (c[0], c[1], a))
+        return order, treewidth
+
+
+class _Buckets:
+    """
+    Buckets of the elimination, which hold the factors of E(x) = -(sum h_i x_i + sum J_ij x_i x_j) without the offset.
+    A factor is a pair of a scope (variables sorted by the elimination order) and a table of the shape (2,) * len(scope),
+    where the index 0 and 1 of an axis mean x = -1 and +1 respectively.
+    """
+
+    def __init__(self, order, h, rows, cols, data):
+        num_variables = len(order)
+        self._order = np.array(order, dtype=np.int64)
+        self._position = np.empty(num_variables, dtype=np.int64)
+        self._position[self._order] = np.arange(num_variables)
+
+        # A factor goes to the bucket of the variable eliminated first in its scope.
+        # Messages whose scopes are empty go to the last bucket (num_variables), which holds the constants.
+        self._originals = [[] for _ in range(num_variables)]
+        self._incoming = [[] for _ in range(num_variables + 1)]
+        for i in range(num_variables):
+            if h[i] != 0.0:
+                self._originals[self._position[i]].append(((i,), np.array([h[i], -h[i]])))
+        for i, j, coeff in zip(rows.tolist(), cols.tolist(), data.tolist()):
+            scope = (i, j) if self._position[i] < self._position[j] else (j, i)
+            self._originals[self._position[scope[0]]].append((scope, np.array([[-coeff, coeff], [coeff, -coeff]])))
+
+        # The message and the argmin of each bucket over the variables of the bucket other than the eliminated one
+        self._messages = []
+        self._argmins = []
+        for i, v in enumerate(self._order.tolist()):
+            factors = self._originals[i] + self._incoming[i]
+            scope = sorted({u for s, _ in factors for u in s} | {v}, key=lambda u: self._position[u])
+            table = np.zeros((2,) * len(scope))
+            for s, t in factors:
+                # Axes of the factor are in the same order as in the scope of the bucket, so that the table is just broadcast
+                table = table + t.reshape([2 if u in s else 1 for u in scope])
+            rest = tuple(scope[1:])
+            message = (rest, table.min(axis=0))
+            self._messages.append(message)
+            self._argmins.append(table.argmin(axis=0))
+            landing = self._position[rest[0]] if len(rest) > 0 else num_variables
+            self._incoming[landing].append(message)
+
+    def lowest_states(self, num_states):
+        """
+        Returns the num_states lowest states as a spin matrix by the Lawler-Murty partitioning in the reverse elimination order.
+        A subproblem fixes the variables from the position t to the last in the elimination order, and its optimum is given by
+        the factors of the buckets from t, including the messages coming from the free variables, and by the argmins of the others.
+        """
+        num_variables = len(self._order)
+        constant = sum(float(message[1]) for message in self._incoming[num_variables])
+        counter = itertools.count()
+        # (energy without the offset, tie breaker, index of the parent state, position of the flipped variable)
+        heap = [(constant, next(counter), None, num_variables)]
+        states = []
+        while heap and (len(states) < num_states):
+            _, _, parent, start = heapq.heappop(heap)
+            if parent is None:
+                bits = np.zeros(num_variables, dtype=np.int64)
+            else:
+                bits = states[parent].copy()
+                bits[self._order[start]] ^= 1
+            self._backtrack(bits, start)
+            states.append(bits)
+
+            # The value of the factors which only have the fixed variables (from the position t), including the messages from the others
+            value = sum(self._evaluate(f, bits) for i in range(start, num_variables) for f in self._originals[i])
+            value += sum(self._evaluate(self._messages[i], bits) for i in range(start) if self._landing(i) >= start)
+            for t in range(start - 1, -1, -1):
+                v = self._order[t]
+                factors = self._originals[t] + self._incoming[t]
+                current = sum(self._evaluate(f, bits) for f in factors)
+                value += current - self._evaluate(self._messages[t], bits)
+                bits[v] ^= 1
+                flipped = sum(self._evaluate(f, bits) for f in factors)
+                bits[v] ^= 1
+                heapq.heappush(heap, (value - current + flipped, next(counter), len(states) - 1, t))
+
+        return np.array(states) * 2 - 1
+
+    def _backtrack(self, bits, start):
+        """
+        Fills the variables before the position `start` in the elimination order by the argmins, in the reverse order.
+        """
+        for i in range(start - 1, -1, -1):
+            bits[self._order[i]] = self._argmins[i][tuple(bits[list(self._messages[i][0])])]
+
+    def _landing(self, i):
+        rest = self._messages[i][0]
+        return self._position[rest[0]] if len(rest) > 0 else len(self._order)
+
+    @staticmethod
+    def _evaluate(factor, bits):
+        scope, table = factor
+        return float(table[tuple(bits[list(scope)])])
@@ -14,7 +14,8 @@
 
 import pytest
 
-from sawatabi.model import LogicalModel, PhysicalModel
+import sawatabi.constants as constants
+from sawatabi.model import LogicalModel, PhysicalModel, PhysicalModelDelta
 
 
 @pytest.fixture
@@ -141,3 +142,196 @@ def test_physical_model_str(simple):
     assert "linear:" in simple.__str__()
     assert "quadratic:" in simple.__str__()
     assert "offset:" in simple.__str__()
+
+
+################################
+# Fix
+################################
+
+
+def test_physical_model_fix_variables_ising(ising):
+    fixed = ising.fix_variables({"x[1]": -1})
+    assert fixed._raw_interactions[1] == {"x[2]": 2.0 - 3.0}
+    assert fixed._raw_interactions[2] == {}
+    assert fixed._offset == 1.0
+    assert fixed._label_to_index == {"x[2]": 0}
+    assert fixed._index_to_label == {0: "x[2]"}
+
+    # The original model is not changed
+    assert len(ising._label_to_index) == 2
+
+
+def test_physical_model_fix_variables_qubo(qubo):
+    fixed = qubo.fix_variables({"x[2]": 1})
+    assert fixed._raw_interactions[1] == {"x[1]": 1.0 + 3.0}
+    assert fixed._offset == -2.0
+    assert fixed._label_to_index == {"x[1]": 0}
+
+    fixed = qubo.fix_variables({"x[1]": 0, "x[2]": 1})
+    assert fixed._raw_interactions[1] == {}
+    assert fixed._offset == -2.0
+    assert fixed._label_to_index == {}
+
+
+def test_physical_model_fix_variables_keeps_free_variables():
+    model = LogicalModel(mtype="ising")
+    x = model.variables(name="x", shape=(2,))
+    model.add_interaction(x[1], coefficient=1.0)
+    model.add_interaction((x[0], x[1]), coefficient=-1.0)
+    physical = model.to_physical()
+
+    # x[1] does not have any interactions after x[0] is fixed, but it must remain
+    fixed = physical.fix_variables({"x[0]": 1})
+    assert fixed._raw_interactions[1] == {"x[1]": 0.0}
+    assert fixed._label_to_index == {"x[1]": 0}
+
+
+def test_physical_model_fix_variables_fails(ising):
+    with pytest.raises(TypeError):
+        ising.fix_variables(["x[1]"])
+
+    with pytest.raises(ValueError):
+        ising.fix_variables({"x[0]": 1})
+
+    with pytest.raises(ValueError):
+        ising.fix_variables({"x[1]": 0})
+
+
+################################
+# Diff / Patch
+################################
+
+
+def _create_window_models():
+    model = LogicalModel(mtype="qubo")
+    x = model.variables(name="x", shape=(4,))
+    model.add_interaction(x[0], coefficient=1.0)
+    model.add_interaction(x[1], coefficient=2.0)
+    model.add_interaction((x[0], x[1]), coefficient=3.0)
+    model.add_interaction((x[1], x[2]), coefficient=4.0)
+    before = model.to_physical()
+
+    model.update_interaction(target=x[1], coefficient=5.0)
+    model.remove_interaction(target=(x[0], x[1]))
+    model.remove_interaction(target=x[0])
+    model.add_interaction((x[2], x[3]), coefficient=6.0)
+    model.offset(7.0)
+    after = model.to_physical()
+    return before, after
+
+
+def test_physical_model_diff():
+    before, after = _create_window_models()
+    delta = before.diff(after)
+
+    assert isinstance(delta, PhysicalModelDelta)
+    assert delta.get_mtype() == "qubo"
+    assert delta._linear == {"x[0]": (1.0, 0.0), "x[1]": (2.0, 5.0)}
+    assert delta._quadratic == {("x[0]", "x[1]"): (3.0, 0.0), ("x[2]", "x[3]"): (0.0, 6.0)}
+    assert delta._offset == (0.0, 7.0)
+    assert delta._added_variables == ["x[3]"]
+    assert delta._removed_variables == ["x[0]"]
+    assert delta._index_to_label == {0: "x[1]", 1: "x[2]", 2: "x[3]"}
+    assert delta.has_structural_changes()
+    assert not delta.is_empty()
+    assert len(delta) == 4
+
+    assert before.diff(before).is_empty()
+    assert len(before.diff(before)) == 0
+
+
+def test_physical_model_patch():
+    before, after = _create_window_models()
+    assert before.patch(before.diff(after)) == after
+    assert after.patch(after.diff(before)) == before
+
+
+def test_physical_model_diff_fails(ising, qubo):
+    with pytest.raises(TypeError):
+        ising.diff("other")
+
+    with pytest.raises(ValueError):
+        ising.diff(qubo)
+
+    with pytest.raises(TypeError):
+        ising.patch("delta")
+
+    with pytest.raises(ValueError):
+        ising.patch(qubo.diff(qubo))
+
+
+def test_physical_model_fingerprint(ising, qubo):
+    before, after = _create_window_models()
+    assert before.fingerprint() == after.patch(after.diff(before)).fingerprint()
+    assert before.fingerprint() != after.fingerprint()
+    assert ising.fingerprint() != qubo.fingerprint()
+
+    # The delta holds the fingerprint of the base model, and the fingerprint of the other model is derived from it
+    before, after = _create_window_models()
+    delta = before.diff(after)
+    assert delta.get_base_fingerprint() == before.fingerprint()
+    derived = after.fingerprint()
+    after._fingerprint = None
+    assert after.fingerprint() == derived
+
+    # The cached fingerprint is reset when an interaction is added
+    fingerprint = ising.fingerprint()
+    ising.add_interaction("x[1]", body=constants.INTERACTION_LINEAR, coefficient=5.0)
+    assert ising.fingerprint() != fingerprint
+
+
+def test_physical_model_delta_repr_and_str():
+    before, after = _create_window_models()
+    delta = before.diff(after)
+    assert "PhysicalModelDelta({" in delta.__repr__()
+    assert "PHYSICAL MODEL DELTA" in delta.__str__()
+    assert "added_variables:" in delta.__str__()
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_physical_model_low_rank_interaction(mtype):
+    numbers = [3.0, 1.0, 4.0, 2.0]
+    model = LogicalModel(mtype=mtype)
+    x = model.variables("x", shape=(4,))
+    model.add_interaction(x[0], coefficient=2.0)
+    explicit = LogicalModel(mtype=mtype)
+    y = explicit.variables("x", shape=(4,))
+    explicit.add_interaction(y[0], coefficient=2.0)
+    for i in range(4):
+        for j in range(i + 1, 4):
+            explicit.add_interaction((y[i], y[j]), coefficient=-numbers[i] * numbers[j])
+
+    # J = -a a^T, and new variables are added to the end
+    physical = model.to_physical()
+    physical.add_low_rank_interaction(["x[0]", "x[1]", "x[2]", "x[3]"], numbers, [-n for n in numbers])
+    assert physical._index_to_label == {0: "x[0]", 1: "x[1]", 2: "x[2]", 3: "x[3]"}
+    assert physical.to_bqm() == explicit.to_physical().to_bqm()
+    assert sorted(map(tuple, physical.to_polynomial())) == sorted(map(tuple, explicit.to_physical().to_polynomial()))
+    assert "rank 1" in str(physical)
+
+    other = model.to_physical()
+    assert physical != other
+    assert physical.fingerprint() != other.fingerprint()
+    other.add_low_rank_interaction(["x[0]", "x[1]", "x[2]", "x[3]"], numbers, [-n for n in numbers])
+    assert physical == other
+    assert physical.diff(other).is_empty()
+
+    with pytest.raises(ValueError):
+        physical.diff(model.to_physical())
+
+    with pytest.raises(ValueError):
+        physical.fix_variables({"x[0]": 1})
+
+
+def test_physical_model_low_rank_interaction_fails(ising):
+    with pytest.raises(TypeError):
+        ising.add_low_rank_interaction("x[1]", [1.0])
+
+    with pytest.raises(ValueError):
+        ising.add_low_rank_interaction(["x[1]", "x[2]"], [1.0, 2.0, 3.0])
+
+    with pytest.raises(ValueError):
+        ising.add_low_rank_interaction(["x[1]", "x[2]"], [[1.0], [2.0]], [[1.0, 2.0], [3.0, 4.0]])
+
+    with pytest.raises(ValueError):
+        ising.add_low_rank_interaction(["x[1]", "x[1]"], [1.0, 2.0])
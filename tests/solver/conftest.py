@@ -0,0 +1,40 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from sawatabi.model import LogicalModel
+
+
+@pytest.fixture
+def random_model():
+    """
+    Returns a function which creates a LogicalModel of `size` variables with integer coefficients in [-3, 3],
+    where each pair of the variables interacts with the probability `density`.
+    """
+
+    def create(mtype, size=10, seed=0, density=0.5):
+        rng = np.random.default_rng(seed)
+        model = LogicalModel(mtype=mtype)
+        x = model.variables("x", shape=(size,))
+        for i in range(size):
+            model.add_interaction(x[i], coefficient=float(rng.integers(-3, 4)))
+            for j in range(i + 1, size):
+                if rng.random() < density:
+                    model.add_interaction((x[i], x[j]), coefficient=float(rng.integers(-3, 4)))
+        model.offset(1.5)
+        return model
+
+    return create
@@ -13,11 +13,12 @@
 # limitations under the License.
 
 import dimod
+import minorminer
 import numpy as np
 import pytest
 
 from sawatabi.model import LogicalModel
-from sawatabi.solver import DWaveSolver
+from sawatabi.solver import DWaveSolver, LocalSolver
 
 
 @pytest.fixture
@@ -119,3 +120,78 @@ def test_dwave_solver_with_empty_model_fails(default_solver):
     model = LogicalModel(mtype="ising")
     with pytest.raises(ValueError):
         default_solver.solve(model.to_physical())
+
+
+def _mock_sampler(size=8):
+    # A structured sampler on a king's graph, which stands in for a QPU offline
+    nodes = list(range(size * size))
+    edges = []
+    for r in range(size):
+        for c in range(size):
+            for dr, dc in [(0, 1), (1, -1), (1, 0), (1, 1)]:
+                if (0 <= r + dr < size) and (0 <= c + dc < size):
+                    edges.append((r * size + c, (r + dr) * size + (c + dc)))
+    return dimod.StructureComposite(dimod.ExactSolver(), nodes, edges)
+
+
+def _create_window_model(offset):
+    # A ring of 6 variables with a chord, whose structure is the same for any offset
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(6,))
+    for i in range(6):
+        model.add_interaction(x[i], coefficient=float(offset + i))
+        model.add_interaction((x[i], x[(i + 1) % 6]), coefficient=-1.0)
+    model.add_interaction((x[0], x[3]), coefficient=2.0)
+    return model.to_physical()
+
+
+def test_dwave_solver_embedding_cache(mocker, tmp_path):
+    find_embedding = mocker.spy(minorminer, "find_embedding")
+    solver = DWaveSolver(sampler=_mock_sampler(), embedding_cache=True, embedding_cache_dir=str(tmp_path), embedding_parameters={"random_seed": 1})
+
+    physical = _create_window_model(0.0)
+    expected = LocalSolver(exact=True).solve(physical)
+    sampleset = solver.solve(physical)
+    assert sampleset.info["embedding_cache"]["hit"] is False
+    assert sampleset.first.energy == pytest.approx(expected.first.energy)
+    assert find_embedding.call_count == 1
+
+    # Another window with the same structure uses the cached embedding
+    sampleset = solver.solve(_create_window_model(1.0))
+    assert sampleset.info["embedding_cache"]["hit"] is True
+    assert find_embedding.call_count == 1
+    key = sampleset.info["embedding_cache"]["key"]
+    assert (tmp_path / f"{key}.json").exists()
+
+    # Another solver (e.g. in another process) loads the embedding from the disk
+    other = DWaveSolver(sampler=_mock_sampler(), embedding_cache_dir=str(tmp_path))
+    sampleset = other.solve(physical)
+    assert sampleset.info["embedding_cache"]["hit"] is True
+    assert sampleset.first.energy == pytest.approx(expected.first.energy)
+    assert find_embedding.call_count == 1
+
+    # A different structure or a different topology has another key
+    bqm = physical.to_bqm()
+    changed = bqm.copy()
+    changed.add_interaction("x[1]", "x[4]", 1.0)
+    assert solver.embedding_key(changed) != key
+    assert DWaveSolver(sampler=_mock_sampler(size=7), embedding_cache=True).embedding_key(bqm) != key
+    # The key does not depend on the coefficients
+    assert solver.embedding_key(_create_window_model(5.0).to_bqm()) == key
+
+
+def test_dwave_solver_embedding_not_found():
+    # Any graph with a triangle cannot be embedded into a path
+    sampler = dimod.StructureComposite(dimod.ExactSolver(), [0, 1, 2], [(0, 1), (1, 2)])
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(3,))
+    model.add_interaction((x[0], x[1]), coefficient=1.0)
+    model.add_interaction((x[1], x[2]), coefficient=1.0)
+    model.add_interaction((x[0], x[2]), coefficient=1.0)
+
+    solver = DWaveSolver(sampler=sampler, embedding_cache=True)
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical())
+
+    with pytest.raises(TypeError):
+        DWaveSolver(sampler=sampler, embedding_cache="yes")
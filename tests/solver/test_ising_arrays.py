@@ -0,0 +1,276 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+
+import numpy as np
+import pytest
+
+from sawatabi.model import LogicalModel
+from sawatabi.solver.ising_arrays import IsingArrays
+
+
+def _assert_same_energies(arrays, physical):
+    bqm = physical.to_bqm()
+    labels = [physical._index_to_label[i] for i in range(len(physical._index_to_label))]
+    assert arrays.labels == labels
+    for spins in itertools.product([-1, 1], repeat=len(labels)):
+        x = np.array(spins)
+        if physical.get_mtype() == "qubo":
+            sample = dict(zip(labels, (x + 1) // 2))
+        else:
+            sample = dict(zip(labels, x))
+        assert arrays.energy(x) == pytest.approx(bqm.energy(sample))
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_ising_arrays_energy(mtype, random_model):
+    physical = random_model(mtype, size=5).to_physical()
+    arrays = IsingArrays(physical)
+
+    assert arrays.num_variables == 5
+    assert arrays.vartype.name == ("SPIN" if mtype == "ising" else "BINARY")
+    _assert_same_energies(arrays, physical)
+
+    # Energies of a matrix are calculated row by row
+    x = np.array([[1, -1, 1, -1, 1], [-1, -1, -1, -1, -1]])
+    assert np.allclose(arrays.energy(x), [arrays.energy(x[0]), arrays.energy(x[1])])
+
+
+def test_ising_arrays_local_fields(random_model):
+    physical = random_model("ising", size=5).to_physical()
+    arrays = IsingArrays(physical)
+
+    x = np.array([1, -1, 1, 1, -1])
+    fields = arrays.local_fields(x)
+    for i in range(5):
+        flipped = x.copy()
+        flipped[i] *= -1
+        assert arrays.energy(flipped) - arrays.energy(x) == pytest.approx(2.0 * x[i] * fields[i])
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_ising_arrays_apply_delta_coefficients(mtype, random_model):
+    model = random_model(mtype, size=5)
+    before = model.to_physical()
+    x = model.get_variables_by_name("x")
+    model.update_interaction(target=x[0], coefficient=10.0)
+    model.offset(-1.0)
+    after = model.to_physical()
+
+    arrays = IsingArrays(before)
+    indices = arrays._indices
+    arrays.apply_delta(before.diff(after))
+
+    # The structure of CSR is not rebuilt
+    assert arrays._indices is indices
+    _assert_same_energies(arrays, after)
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_ising_arrays_apply_delta_structure(mtype, random_model):
+    model = random_model(mtype, size=6)
+    x = model.get_variables_by_name("x")
+    model.delete_variable(x[5])
+    before = model.to_physical()
+
+    model = random_model(mtype, size=6)
+    x = model.get_variables_by_name("x")
+    model.delete_variable(x[0])
+    model.add_interaction((x[1], x[5]), name="new", coefficient=2.5)
+    after = model.to_physical()
+
+    arrays = IsingArrays(before)
+    arrays.apply_delta(before.diff(after))
+    _assert_same_energies(arrays, after)
+
+    # Same as the arrays created from scratch
+    expected = IsingArrays(after)
+    assert np.allclose(arrays._h, expected._h)
+    assert np.array_equal(arrays._indptr, expected._indptr)
+    assert np.array_equal(arrays._indices, expected._indices)
+    assert np.allclose(arrays._data, expected._data)
+
+
+def test_ising_arrays_apply_delta_fails(random_model):
+    before = random_model("ising", size=5).to_physical()
+    arrays = IsingArrays(before)
+
+    with pytest.raises(TypeError):
+        arrays.apply_delta("delta")
+
+    with pytest.raises(ValueError):
+        qubo = random_model("qubo", size=5).to_physical()
+        arrays.apply_delta(qubo.diff(qubo))
+
+    with pytest.raises(ValueError):
+        other = random_model("ising", size=3).to_physical()
+        arrays.apply_delta(other.diff(other))
+
+
+def test_ising_arrays_flip(random_model):
+    physical = random_model("ising", size=6).to_physical()
+    arrays = IsingArrays(physical)
+
+    x = np.array([1, -1, 1, 1, -1, -1])
+    fields = arrays.local_fields(x)
+    for idx in [0, 3, 3, 5, 1]:
+        arrays.flip(idx, x, fields)
+        assert np.allclose(fields, arrays.local_fields(x))
+
+
+def test_ising_arrays_float32(random_model):
+    physical = random_model("qubo", size=5).to_physical()
+    arrays = IsingArrays(physical, dtype="float32")
+    assert arrays.dtype == np.float32
+    assert arrays._h.dtype == np.float32
+    assert arrays._data.dtype == np.float32
+    assert arrays.local_fields(np.ones(5)).dtype == np.float32
+    _assert_same_energies(arrays, physical)
+
+    arrays.set_dtype("float64")
+    assert arrays._data.dtype == np.float64
+
+    with pytest.raises(ValueError):
+        IsingArrays(physical, dtype="int32")
+
+
+def test_ising_arrays_color_classes(random_model):
+    physical = random_model("qubo", size=8).to_physical()
+    arrays = IsingArrays(physical)
+
+    color_classes = arrays.color_classes()
+    assert arrays.color_classes() is color_classes
+    assert sorted(np.concatenate([c[0] for c in color_classes]).tolist()) == list(range(8))
+
+    # Variables of the same color do not interact with each other
+    for c in color_classes:
+        for i in c[0]:
+            start, end = arrays._indptr[i], arrays._indptr[i + 1]
+            neighbors = arrays._indices[start:end]
+            assert len(np.intersect1d(neighbors, c[0])) == 0
+
+    # Fields are kept up to date after flipping a whole color class at once
+    rng = np.random.default_rng(0)
+    x = rng.choice([-1, 1], size=(3, 8))
+    fields = arrays.local_fields(x)
+    for c in color_classes:
+        accepted = rng.random(size=(3, len(c[0]))) < 0.5
+        arrays.flip_class(c, x, fields, accepted)
+        assert np.allclose(fields, arrays.local_fields(x))
+
+
+def test_ising_arrays_flip_rows(random_model):
+    physical = random_model("ising", size=6).to_physical()
+    arrays = IsingArrays(physical)
+
+    rng = np.random.default_rng(0)
+    x = rng.choice([-1, 1], size=(4, 6))
+    fields = arrays.local_fields(x)
+    for _ in range(5):
+        rows = np.array([0, 2, 3])
+        indices = rng.integers(6, size=3)
+        expected = x.copy()
+        expected[rows, indices] *= -1
+        arrays.flip_rows(rows, indices, x, fields)
+        assert np.array_equal(x, expected)
+        assert np.allclose(fields, arrays.local_fields(x))
+
+
+def test_ising_arrays_connected_components():
+    u = np.array([0, 1, 5, 7, 8])
+    v = np.array([1, 2, 3, 8, 6])
+    labels = IsingArrays.connected_components(10, u, v)
+    assert labels.tolist() == [0, 0, 0, 3, 4, 3, 6, 6, 6, 9]
+
+    # Without any edges, each node is a component
+    labels = IsingArrays.connected_components(4, np.array([], dtype=int), np.array([], dtype=int))
+    assert labels.tolist() == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_ising_arrays_dense_kernel(mtype, random_model):
+    model = random_model(mtype, size=6)
+    before = model.to_physical()
+    arrays = IsingArrays(before)
+    assert arrays.kernel == "sparse"
+    assert 0.0 < arrays.density <= 1.0
+
+    arrays.set_kernel("dense")
+    assert arrays.kernel == "dense"
+    assert arrays._dense.shape == (6, 6)
+    assert np.allclose(arrays._dense, arrays._dense.T)
+    _assert_same_energies(arrays, before)
+
+    rng = np.random.default_rng(0)
+    x = rng.choice([-1, 1], size=(3, 6))
+    fields = arrays.local_fields(x)
+    for idx in [0, 3, 5]:
+        arrays.flip(idx, x[0], fields[0])
+        arrays.flip_rows(np.array([1, 2]), np.array([idx, (idx + 1) % 6]), x, fields)
+        assert np.allclose(fields, arrays.local_fields(x))
+
+    # The dense matrix follows deltas
+    x = model.get_variables_by_name("x")
+    model.update_interaction(target=x[0], coefficient=10.0)
+    model.add_interaction((x[0], x[5]), name="new", coefficient=2.5)
+    after = model.to_physical()
+    arrays.apply_delta(before.diff(after))
+    _assert_same_energies(arrays, after)
+
+    arrays.set_kernel("sparse")
+    assert arrays._dense is None
+
+    with pytest.raises(ValueError):
+        arrays.set_kernel("unknown")
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_ising_arrays_low_rank(mtype, random_model):
+    model = random_model(mtype, size=4)
+    before = model.to_physical()
+    rng = np.random.default_rng(0)
+    before.add_low_rank_interaction(["x[3]", "x[0]", "x[1]"], rng.integers(-3, 3, size=(3, 2)), rng.integers(-3, 3, size=(3, 2)))
+    arrays = IsingArrays(before)
+    assert arrays.low_rank == 2
+    _assert_same_energies(arrays, before)
+
+    # Energy diffs are given by the local fields and the low-rank couplings
+    x = np.array([1, -1, 1, 1])
+    fields = arrays.local_fields(x) + arrays.low_rank_dot(x)
+    for i in range(4):
+        flipped = x.copy()
+        flipped[i] *= -1
+        assert arrays.energy(flipped) - arrays.energy(x) == pytest.approx(2.0 * x[i] * fields[i])
+
+    # The factors follow structural deltas
+    x = model.get_variables_by_name("x")
+    model.add_interaction((x[2], x[3]), name="new", coefficient=2.5)
+    after = model.to_physical()
+    after._low_rank_interactions = list(before._low_rank_interactions)
+    arrays.apply_delta(before.diff(after))
+    _assert_same_energies(arrays, after)
+
+
+def test_ising_arrays_energy_diff_range():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(4,))
+    model.add_interaction(x[0], coefficient=-0.5)
+    model.add_interaction((x[0], x[1]), coefficient=2.0)
+    model.add_interaction((x[0], x[2]), coefficient=-3.0)
+    model.add_interaction((x[2], x[3]), coefficient=0.0)
+    arrays = IsingArrays(model.to_physical())
+
+    # The largest diff is by x[0] (|-0.5| + |2.0| + |-3.0|), and the smallest non-zero coefficient is -0.5
+    assert arrays.energy_diff_range() == pytest.approx((1.0, 11.0))
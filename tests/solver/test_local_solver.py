@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import neal
 import numpy as np
 import pytest
 
@@ -64,6 +65,82 @@ def test_local_solver_exact_qubo():
         assert False
 
 
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+@pytest.mark.parametrize("chunk_size,num_workers", [(1, 1), (16, 1), (2**16, 1), (16, 3)])
+def test_local_solver_exact_streaming(mtype, chunk_size, num_workers, random_model):
+    physical = random_model(mtype).to_physical()
+    bqm = physical.to_bqm()
+    expected = LocalSolver(exact=True).solve(physical)
+
+    solver = LocalSolver(exact=True)
+    sampleset = solver.solve(physical, num_states=15, chunk_size=chunk_size, num_workers=num_workers)
+
+    assert sampleset.vartype == expected.vartype
+    assert sampleset.variables == expected.variables
+    assert len(sampleset.record) == 15
+    assert np.allclose(sampleset.record.energy, np.sort(expected.record.energy)[:15])
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+    if num_workers > 1:
+        # 2 bits of prefix for 3 workers
+        assert len(sampleset.info["timing"]["worker_execution_sec"]) == 4
+
+    # More states than all states
+    sampleset = solver.solve(physical, num_states=5000, chunk_size=chunk_size)
+    assert len(sampleset.record) == 2**10
+
+
+def test_local_solver_exact_streaming_low_rank():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(3,))
+    model.add_interaction((x[0], x[1]), coefficient=1.0)
+    physical = model.to_physical()
+    # Number partitioning of [3, 1, 1, 2, 2, 1]
+    physical.add_low_rank_interaction(["x[0]", "x[1]", "x[2]", "y[0]", "y[1]", "y[2]"], np.array([3, 1, 1, 2, 2, 1]), -np.array([3, 1, 1, 2, 2, 1]))
+    expected = LocalSolver(exact=True).solve(physical)
+
+    sampleset = LocalSolver(exact=True).solve(physical, num_states=3, chunk_size=4)
+    assert np.allclose(sampleset.record.energy, np.sort(expected.record.energy)[:3])
+
+
+def test_local_solver_exact_streaming_invalid_arguments():
+    model = LogicalModel(mtype="ising")
+    s = model.variables("s", shape=(2,))
+    model.add_interaction((s[0], s[1]), coefficient=-3.0)
+    solver = LocalSolver(exact=True)
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), num_states=0)
+
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), num_states=1.5)
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), num_states=1, chunk_size=0)
+
+    # dimod's brute force solver does not run in parallel
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), num_workers=2)
+
+
+def test_local_solver_exact_arguments_at_every_size():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(21,))
+    for i in range(21):
+        model.add_interaction(x[i], coefficient=1.0)
+    physical = model.to_physical()
+
+    # All states are returned unless num_states is given, with a warning for a large model
+    with pytest.warns(UserWarning):
+        sampleset = LocalSolver(exact=True).solve(physical, num_reads=5)
+    assert len(sampleset.record) == 2**21
+
+    # Arguments for other solvers are ignored by the streaming solver as well
+    sampleset = LocalSolver(exact=True).solve(physical, num_states=3, num_reads=5)
+    assert len(sampleset.record) == 3
+    assert sampleset.first.energy == -21.0
+
+
 def test_local_solver_sa_ising():
     model = LogicalModel(mtype="ising")
     s = model.variables("s", shape=(2,))
@@ -115,6 +192,32 @@ def test_local_solver_sa_qubo():
     assert sampleset.record[0].num_occurrences == 1
 
 
+def test_local_solver_sa_num_workers():
+    model = LogicalModel(mtype="qubo")
+    x = model.variables("x", shape=(6,))
+    model.add_constraint(NHotConstraint(variables=x, n=2))
+    physical = model.to_physical()
+
+    solver = LocalSolver()
+    initial_states = [{f"x[{i}]": 1 for i in range(6)}]
+    sampleset1 = solver.solve(physical, num_reads=7, initial_states=initial_states, seed=12345, num_workers=3)
+    sampleset2 = solver.solve(physical, num_reads=7, initial_states=initial_states, seed=12345, num_workers=3)
+
+    assert sampleset1.variables == [f"x[{i}]" for i in range(6)]
+    assert len(sampleset1.record) == 7
+    for r in sampleset1.record:
+        assert np.count_nonzero(r.sample == 1) == 2
+    assert "beta_range" in sampleset1.info
+    assert sampleset1.info["timing"]["num_workers"] == 3
+    assert len(sampleset1.info["timing"]["worker_execution_sec"]) == 3
+
+    # The result is reproducible with the same seed
+    assert np.array_equal(sampleset1.record.sample, sampleset2.record.sample)
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, num_workers=0)
+
+
 def test_local_solver_with_logical_model_fails():
     model = LogicalModel(mtype="ising")
 
@@ -143,6 +246,59 @@ def test_local_solver_default_beta_range():
     assert beta_range == [0.13862943611198905, 4.605170185988092]
 
 
+def test_local_solver_beta_range_cache(monkeypatch):
+    model = LogicalModel(mtype="ising")
+    s = model.variables("s", shape=(3,))
+    model.add_interaction(s[0], coefficient=1.0)
+    model.add_interaction((s[0], s[1]), coefficient=-3.0)
+    physical = model.to_physical()
+
+    calls = []
+    default_beta_range = neal.default_beta_range
+    monkeypatch.setattr(neal, "default_beta_range", lambda bqm: calls.append(bqm) or default_beta_range(bqm))
+
+    # The range computed by default_beta_range is reused by solve, and by all workers
+    solver = LocalSolver()
+    beta_range = solver.default_beta_range(physical)
+    sampleset = solver.solve(physical, num_reads=4, seed=12345)
+    assert list(sampleset.info["beta_range"]) == pytest.approx(beta_range)
+    sampleset = solver.solve(physical, num_reads=4, seed=12345, num_workers=2)
+    assert list(sampleset.info["beta_range"]) == pytest.approx(beta_range)
+    assert len(calls) == 1
+
+    # A changed model has another fingerprint, and the range computed by neal is cached instead of the least recently used one
+    model.add_interaction((s[1], s[2]), coefficient=2.0)
+    changed = model.to_physical()
+    sampleset = solver.solve(changed, seed=12345)
+    assert len(calls) == 1
+    assert list(solver._beta_range_cache.keys()) == [changed.fingerprint()]
+    assert solver._beta_range_cache[changed.fingerprint()] == pytest.approx(list(sampleset.info["beta_range"]))
+
+    # An explicit beta range is used as it is
+    sampleset = solver.solve(physical, seed=12345, beta_range=[0.1, 1.0])
+    assert list(sampleset.info["beta_range"]) == [0.1, 1.0]
+    assert len(calls) == 1
+
+    with pytest.raises(ValueError):
+        LocalSolver(cache_size=0)
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_local_solver_custom_beta_schedule(num_workers):
+    model = LogicalModel(mtype="ising")
+    s = model.variables("s", shape=(3,))
+    model.add_interaction(s[0], coefficient=1.0)
+    model.add_interaction((s[0], s[1]), coefficient=-3.0)
+    physical = model.to_physical()
+
+    # A cached beta range is not given with a custom beta schedule
+    solver = LocalSolver()
+    solver.default_beta_range(physical)
+    sampleset = solver.solve(physical, num_reads=4, seed=12345, num_workers=num_workers, beta_schedule_type="custom", beta_schedule=[0.1, 1.0, 10.0])
+    assert sampleset.info["beta_schedule_type"] == "custom"
+    assert sampleset.first.energy == -4.0
+
+
 def test_local_solver_default_beta_range_fails():
     model = LogicalModel(mtype="ising")
 
@@ -0,0 +1,111 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from sawatabi.model import LogicalModel
+from sawatabi.solver import LocalSolver, PostProcessedSolver, SawatabiSolver
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_post_processed_solver_descent(mtype, random_model):
+    physical = random_model(mtype, size=12).to_physical()
+    bqm = physical.to_bqm()
+
+    # Hot and short annealing gives samples which are far from local minima
+    solver = PostProcessedSolver(SawatabiSolver(), method="descent")
+    sampleset = solver.solve(physical, num_reads=20, num_sweeps=1, initial_temperature=1000.0, seed=12345)
+    original = SawatabiSolver().solve(physical, num_reads=20, num_sweeps=1, initial_temperature=1000.0, seed=12345)
+
+    assert np.sum(sampleset.record.num_occurrences) == 20
+    assert sampleset.first.energy <= original.first.energy
+    assert sampleset.info["post_process"]["method"] == "descent"
+    assert sampleset.info["post_process"]["num_improved"] > 0
+    assert "post_process_sec" in sampleset.info["timing"]
+
+    # All samples are local minima, and their energies are correct
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+        for label in sample:
+            flipped = dict(sample)
+            flipped[label] = (-1 * sample[label]) if mtype == "ising" else (1 - sample[label])
+            assert energy <= bqm.energy(flipped) + 1e-9
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_post_processed_solver_tabu(mtype, random_model):
+    physical = random_model(mtype, size=12).to_physical()
+    bqm = physical.to_bqm()
+    expected = LocalSolver(exact=True).solve(physical)
+
+    solver = PostProcessedSolver(SawatabiSolver(), method="tabu", tenure=3, max_iterations=200)
+    sampleset = solver.solve(physical, num_reads=5, num_sweeps=1, initial_temperature=1000.0, seed=12345)
+
+    assert sampleset.first.energy == pytest.approx(expected.first.energy)
+    assert sampleset.info["post_process"]["num_iterations"] == 200
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+
+def test_post_processed_solver_time_limit(random_model):
+    physical = random_model("ising", size=50).to_physical()
+
+    solver = PostProcessedSolver(LocalSolver(), method="tabu", max_iterations=10**9, time_limit_sec=0.1)
+    sampleset = solver.solve(physical, num_reads=2, num_sweeps=10, seed=12345)
+
+    assert 0 < sampleset.info["post_process"]["num_iterations"] < 10**9
+
+
+def test_post_processed_solver_with_stats(random_model):
+    physical = random_model("qubo", size=12).to_physical()
+
+    solver = PostProcessedSolver(SawatabiSolver())
+    sampleset, stats = solver.solve(physical, num_reads=3, num_sweeps=10, seed=12345, need_stats=True)
+
+    assert np.sum(sampleset.record.num_occurrences) == 3
+    assert len(stats) == 3
+
+
+def test_post_processed_solver_fails():
+    with pytest.raises(TypeError):
+        PostProcessedSolver("solver")
+
+    with pytest.raises(ValueError):
+        PostProcessedSolver(LocalSolver(), method="unknown")
+
+    with pytest.raises(ValueError):
+        PostProcessedSolver(LocalSolver(), method="tabu", tenure=-1)
+
+    with pytest.raises(TypeError):
+        PostProcessedSolver(LocalSolver(), method="tabu", tenure=1.5)
+
+    with pytest.raises(TypeError):
+        PostProcessedSolver(LocalSolver(), max_iterations=10.0)
+
+    with pytest.raises(ValueError):
+        PostProcessedSolver(LocalSolver(), max_iterations=0)
+
+    with pytest.raises(TypeError):
+        PostProcessedSolver(LocalSolver(), time_limit_sec="1")
+
+    with pytest.raises(ValueError):
+        PostProcessedSolver(LocalSolver(), time_limit_sec=0.0)
+
+    solver = PostProcessedSolver(LocalSolver())
+    with pytest.raises(TypeError):
+        solver.solve(LogicalModel(mtype="ising"))
+
+    with pytest.raises(ValueError):
+        solver.solve(LogicalModel(mtype="ising").to_physical())
@@ -0,0 +1,110 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from sawatabi.model import LogicalModel
+from sawatabi.solver import LocalSolver, PresolvedSolver, SawatabiSolver
+
+
+@pytest.fixture
+def qubo():
+    model = LogicalModel(mtype="qubo")
+    x = model.variables("x", shape=(4,))
+    model.add_interaction(x[0], coefficient=5.0)
+    model.add_interaction((x[0], x[1]), coefficient=-1.0)
+    model.add_interaction((x[1], x[2]), coefficient=2.0)
+    model.add_interaction((x[2], x[3]), coefficient=-3.0)
+    model.add_interaction(x[3], coefficient=1.0)
+    model.offset(3.0)
+    return model.to_physical()
+
+
+def test_presolved_solver_dominance_ising():
+    model = LogicalModel(mtype="ising")
+    s = model.variables("s", shape=(3,))
+    model.add_interaction(s[0], coefficient=3.0)
+    model.add_interaction(s[1], coefficient=-0.5)
+    model.add_interaction((s[0], s[1]), coefficient=1.0)
+    model.add_interaction((s[1], s[2]), coefficient=-0.2)
+
+    solver = PresolvedSolver(LocalSolver(exact=True), roof_duality=False)
+    reduced = solver.presolve(model.to_physical())
+
+    # s[0] is dominant (|3.0| > |1.0|), and then s[1] and s[2] become dominant one after another
+    assert solver._fixed == {"s[0]": 1, "s[1]": 1, "s[2]": -1}
+    assert reduced._label_to_index == {}
+    assert reduced.get_offset() == pytest.approx(-3.7)
+
+
+def test_presolved_solver_roof_duality(qubo):
+    solver = PresolvedSolver(LocalSolver(exact=True), dominance=False)
+    reduced = solver.presolve(qubo)
+
+    assert solver._fixed["x[0]"] == 1
+    assert "x[0]" not in reduced._label_to_index
+
+
+@pytest.mark.parametrize("roof_duality,dominance", [(True, True), (True, False), (False, True), (False, False)])
+def test_presolved_solver_keeps_energies(qubo, roof_duality, dominance):
+    solver = PresolvedSolver(LocalSolver(exact=True), roof_duality=roof_duality, dominance=dominance)
+    sampleset = solver.solve(qubo)
+    expected = LocalSolver(exact=True).solve(qubo)
+
+    assert sampleset.variables == ["x[0]", "x[1]", "x[2]", "x[3]"]
+    assert sampleset.first.energy == expected.first.energy == -3.0
+    assert sampleset.info["presolve"]["num_fixed"] == len(solver._fixed)
+    assert "presolve_sec" in sampleset.info["timing"]
+
+    # Every returned sample has the same energy as in the original model
+    bqm = qubo.to_bqm()
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == energy
+
+
+def test_presolved_solver_all_fixed():
+    model = LogicalModel(mtype="ising")
+    s = model.variables("s", shape=(2,))
+    model.add_interaction(s[0], coefficient=2.0)
+    model.add_interaction(s[1], coefficient=-2.0)
+    model.add_interaction((s[0], s[1]), coefficient=1.0)
+    model.offset(1.0)
+
+    solver = PresolvedSolver(SawatabiSolver())
+    sampleset = solver.solve(model.to_physical(), seed=12345)
+
+    assert sampleset.variables == ["s[0]", "s[1]"]
+    assert np.array_equal(sampleset.record[0].sample, [1, -1])
+    assert sampleset.record[0].energy == -2.0
+
+
+def test_presolved_solver_with_stats(qubo):
+    solver = PresolvedSolver(SawatabiSolver(), roof_duality=False, dominance=False)
+    sampleset, stats = solver.solve(qubo, num_reads=2, seed=12345, need_stats=True)
+
+    assert sampleset.variables == ["x[0]", "x[1]", "x[2]", "x[3]"]
+    assert len(stats) == 2
+
+
+def test_presolved_solver_fails(qubo):
+    with pytest.raises(TypeError):
+        PresolvedSolver("solver")
+
+    solver = PresolvedSolver(LocalSolver())
+    with pytest.raises(TypeError):
+        solver.solve(LogicalModel(mtype="qubo"))
+
+    with pytest.raises(ValueError):
+        solver.solve(LogicalModel(mtype="qubo").to_physical())
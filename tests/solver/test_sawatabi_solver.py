@@ -12,12 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+
+import dimod
 import numpy as np
 import pytest
 
-from sawatabi.model import LogicalModel
+from sawatabi.model import LogicalModel, PhysicalModel
 from sawatabi.model.constraint import NHotConstraint
 from sawatabi.solver import SawatabiSolver
+from sawatabi.solver.ising_arrays import IsingArrays
 
 
 def test_sawatabi_solver_ising():
@@ -249,6 +253,34 @@ def test_sawatabi_solver_with_initial_states_qubo():
     assert sampleset.record[0].energy == 0.0
     assert sampleset.record[0].num_occurrences == 1
 
+    # The given initial states are not modified
+    assert initial_states[0]["x[1]"] == 0
+
+
+@pytest.mark.parametrize("mtype,vectorized", [("ising", False), ("ising", True), ("qubo", False), ("qubo", True)])
+def test_sawatabi_solver_with_initial_states_array(mtype, vectorized):
+    model = LogicalModel(mtype=mtype)
+    x = model.variables("x", shape=(4,))
+    for i in range(3):
+        model.add_interaction((x[i], x[i + 1]), coefficient=1.0)
+    physical = model.to_physical()
+    low = -1 if mtype == "ising" else 0
+
+    # Columns are in the _index_to_label order of the model
+    initial_states = np.array([[1, 1, 1, 1], [1, low, 1, low]], dtype=np.int8)
+    solver = SawatabiSolver()
+    sampleset = solver.solve(physical, num_reads=2, num_sweeps=1, initial_temperature=1e-9, initial_states=initial_states, vectorized=vectorized)
+    # The ground state given as the first initial state is kept at the low temperature
+    assert sampleset.first.energy == -3.0
+    assert all(v == 1 for v in sampleset.first.sample.values())
+    assert np.array_equal(initial_states, [[1, 1, 1, 1], [1, low, 1, low]])
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, num_reads=2, initial_states=np.ones((2, 3), dtype=np.int8))
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, num_reads=2, initial_states=np.full((2, 4), 2, dtype=np.int8))
+
 
 def test_sawatabi_solver_with_initial_states_reverse():
     model = LogicalModel(mtype="ising")
@@ -348,4 +380,862 @@ def test_sawatabi_solver_with_stats():
 
     assert stats[0]["acceptance_history"][-1] == 0
     assert stats[0]["energy_history"][-1] == -2.0
-    assert stats[0]["temperature_history"] == [100.0, 50.0, 25.0, 12.5, 6.25, 3.125, 1.5625, 0.78125, 0.390625, 0.1953125]
+    assert np.array_equal(stats[0]["temperature_history"], [100.0, 50.0, 25.0, 12.5, 6.25, 3.125, 1.5625, 0.78125, 0.390625, 0.1953125])
+    assert np.array_equal(stats[0]["sweep"], np.arange(10))
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_sawatabi_solver_stats_stride(vectorized):
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(4,))
+    for i in range(3):
+        model.add_interaction((x[i], x[i + 1]), coefficient=1.0)
+    solver = SawatabiSolver()
+
+    sampleset, stats = solver.solve(
+        model.to_physical(), num_reads=2, num_sweeps=10, cooling_rate=0.5, seed=12345, vectorized=vectorized, need_stats=True, stats_stride=3
+    )
+
+    # Sweeps 0, 3, 6 and 9 are recorded
+    assert len(stats) == 2
+    assert stats[0].dtype.names == ("sweep", "energy_history", "temperature_history", "acceptance_history")
+    assert np.array_equal(stats[0]["sweep"], [0, 3, 6, 9])
+    assert np.array_equal(stats[0]["temperature_history"], [100.0, 12.5, 1.5625, 0.1953125])
+    assert len(stats[0]["energy_history"]) == 4
+    assert len(stats[0]["acceptance_history"]) == 4
+
+
+def test_sawatabi_solver_invalid_stats_stride():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=1.0)
+    solver = SawatabiSolver()
+
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), need_stats=True, stats_stride=1.5)
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), need_stats=True, stats_stride=0)
+
+
+def test_sawatabi_solver_with_delta():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(4,))
+    for i in range(3):
+        model.add_interaction(x[i], coefficient=1.0)
+    model.add_interaction((x[0], x[1]), coefficient=2.0)
+    before = model.to_physical()
+
+    solver = SawatabiSolver()
+    sampleset = solver.solve(before, num_reads=1, num_sweeps=10, cooling_rate=0.5, seed=12345)
+    assert np.array_equal(sampleset.record[0].sample, [1, 1, 1])
+    assert sampleset.record[0].energy == -5.0
+
+    model.update_interaction(target=x[0], coefficient=-10.0)
+    model.add_interaction(x[3], coefficient=-1.0)
+    after = model.to_physical()
+
+    sampleset = solver.solve(after, num_reads=1, num_sweeps=10, cooling_rate=0.5, seed=12345, delta=before.diff(after))
+    assert sampleset.variables == ["x[0]", "x[1]", "x[2]", "x[3]"]
+    assert np.array_equal(sampleset.record[0].sample, [-1, -1, 1, -1])
+    assert sampleset.record[0].energy == -13.0
+
+    with pytest.raises(TypeError):
+        solver.solve(after, delta="delta")
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_sawatabi_solver_kernel(vectorized):
+    # A fully connected model like NPP
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(8,))
+    numbers = [3, 1, 4, 1, 5, 9, 2, 6]
+    for i in range(8):
+        for j in range(i + 1, 8):
+            model.add_interaction((x[i], x[j]), coefficient=-float(numbers[i] * numbers[j]))
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    samplesets = {}
+    for kernel in ["sparse", "dense", "auto"]:
+        samplesets[kernel] = solver.solve(physical, num_reads=4, num_sweeps=50, seed=12345, vectorized=vectorized, kernel=kernel)
+        assert solver._arrays.kernel == ("sparse" if kernel == "sparse" else "dense")
+
+    # The kernels give the same results with the same seed
+    for kernel in ["dense", "auto"]:
+        assert np.array_equal(samplesets[kernel].record.sample, samplesets["sparse"].record.sample)
+        assert np.array_equal(samplesets[kernel].record.energy, samplesets["sparse"].record.energy)
+    # The perfect partition of the numbers (sum = 31 is odd, so the difference is 1)
+    assert samplesets["dense"].first.energy == (1 - sum(n * n for n in numbers)) / 2
+
+    # A sparse model uses the sparse kernel by default
+    chain = LogicalModel(mtype="ising")
+    y = chain.variables("y", shape=(20,))
+    for i in range(19):
+        chain.add_interaction((y[i], y[i + 1]), coefficient=1.0)
+    solver.solve(chain.to_physical(), seed=12345)
+    assert solver._arrays.kernel == "sparse"
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, kernel="unknown")
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_sawatabi_solver_low_rank(vectorized):
+    # NPP with J = -a a^T, which is not expanded into O(n^2) interactions
+    numbers = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3]
+    model = PhysicalModel(mtype="ising")
+    model.add_low_rank_interaction([f"x[{i}]" for i in range(10)], numbers, [-n for n in numbers])
+
+    solver = SawatabiSolver()
+    sampleset = solver.solve(model, num_reads=4, num_sweeps=100, initial_temperature=100.0, seed=12345, vectorized=vectorized)
+    bqm = model.to_bqm()
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+    # The perfect partition (sum = 39 is odd, so the difference is 1)
+    assert sampleset.first.energy == (1 - sum(n * n for n in numbers)) / 2
+
+    with pytest.raises(ValueError):
+        solver.solve(model, pickup_mode="coloring")
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_sawatabi_solver_return_best(vectorized):
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(10,))
+    for i in range(9):
+        model.add_interaction((x[i], x[i + 1]), coefficient=1.0)
+    physical = model.to_physical()
+
+    # At a constant high temperature, the final state is almost random but a lower energy is visited on the way
+    solver = SawatabiSolver()
+    kwargs = {"num_reads": 1, "num_sweeps": 50, "initial_temperature": 5.0, "cooling_rate": 1.0, "vectorized": vectorized, "need_stats": True}
+    sampleset, stats = solver.solve(physical, seed=12345, return_best=True, **kwargs)
+    assert sampleset.first.energy <= np.min(stats[0]["energy_history"])
+    assert physical.to_bqm().energy(sampleset.first.sample) == pytest.approx(sampleset.first.energy)
+
+    sampleset, stats = solver.solve(physical, seed=12345, **kwargs)
+    assert sampleset.first.energy > np.min(stats[0]["energy_history"])
+
+
+def test_sawatabi_solver_restart_options():
+    rng = np.random.default_rng(0)
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(20,))
+    for i in range(20):
+        for j in range(i + 1, 20):
+            if rng.random() < 0.3:
+                model.add_interaction((x[i], x[j]), coefficient=float(rng.choice([-1.0, 1.0])))
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    restart_options = {"stagnation_sweeps": 3, "elite_fraction": 0.5, "perturbation": 0.2}
+    sampleset = solver.solve(physical, num_reads=8, num_sweeps=50, initial_temperature=3.0, seed=12345, restart_options=restart_options)
+    assert np.sum(sampleset.record.num_occurrences) == 8
+    bqm = physical.to_bqm()
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+    # Stagnant reads restart from the best states of the elites, and their fields and energies are recalculated
+    solver._rng = np.random.default_rng(12345)
+    x = rng.choice([-1, 1], size=(4, 20))
+    best_x = x.copy()
+    fields = solver._arrays.local_fields(x)
+    energies = solver._arrays.energy(x)
+    best_energies = np.array([-10.0, 0.0, 0.0, 0.0])
+    last_improved = np.array([0, 10, 0, 10])
+    solver._restart_stagnant_reads(
+        x, fields, energies, best_x, best_energies, last_improved, 10, {"stagnation_sweeps": 5, "elite_fraction": 0.25, "perturbation": 0.0}
+    )
+    assert np.array_equal(x[[0, 2]], best_x[[0, 0]])
+    assert np.array_equal(x[[1, 3]], best_x[[1, 3]])
+    assert np.allclose(fields, solver._arrays.local_fields(x))
+    assert np.allclose(energies, solver._arrays.energy(x))
+    assert np.array_equal(last_improved, [10, 10, 10, 10])
+
+    with pytest.raises(TypeError):
+        solver.solve(physical, return_best=1)
+
+    with pytest.raises(TypeError):
+        solver.solve(physical, restart_options=3)
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, restart_options={"stagnation_sweeps": 0})
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, restart_options={"elite_fraction": 0.0})
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, restart_options={"perturbation": 1.5})
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, restart_options={}, population_options={})
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, return_best=True, population_options={})
+
+
+def test_sawatabi_solver_cache():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(3,))
+    model.add_interaction((x[0], x[1]), coefficient=1.0)
+    first = model.to_physical()
+    model.add_interaction((x[1], x[2]), coefficient=1.0)
+    second = model.to_physical()
+    model.add_interaction(x[0], coefficient=1.0)
+    third = model.to_physical()
+
+    solver = SawatabiSolver(cache_size=2)
+    solver.solve(first, seed=12345)
+    arrays = solver._arrays
+
+    # Arrays are reused for the same model
+    solver.solve(first, seed=54321)
+    assert solver._arrays is arrays
+
+    # The least recently used arrays are evicted
+    solver.solve(second, seed=12345)
+    solver.solve(first, seed=12345)
+    solver.solve(third, seed=12345)
+    assert list(solver._arrays_cache.keys()) == [(first.fingerprint(), "float64"), (third.fingerprint(), "float64")]
+    assert solver._arrays_cache[(first.fingerprint(), "float64")] is arrays
+
+    # Arrays changed by a delta are cached for the new model
+    solver.solve(second, seed=12345, delta=third.diff(second))
+    assert solver._arrays_cache[(second.fingerprint(), "float64")] is solver._arrays
+    assert len(solver._arrays_cache) == 2
+
+
+@pytest.mark.parametrize("mtype,cache_size", [("ising", 1), ("ising", 2), ("qubo", 1), ("qubo", 2)])
+def test_sawatabi_solver_cache_delta_from_other_model(mtype, cache_size, random_model):
+    a, b, c = [random_model(mtype, size=6, seed=seed, density=1.0).to_physical() for seed in range(3)]
+
+    # The delta is applied to the arrays of the base model, not to the arrays of the model solved last
+    solver = SawatabiSolver(cache_size=cache_size)
+    solver.solve(a, seed=12345)
+    solver.solve(c, seed=12345)
+    sampleset = solver.solve(b, num_reads=10, num_sweeps=200, seed=12345, delta=a.diff(b))
+    assert solver._arrays.energy(np.ones((1, 6), dtype=int))[0] == pytest.approx(IsingArrays(b).energy(np.ones((1, 6), dtype=int))[0])
+    assert sampleset.first.energy == pytest.approx(dimod.ExactSolver().sample(b.to_bqm()).first.energy)
+    assert list(solver._arrays_cache.keys())[-1] == (b.fingerprint(), "float64")
+
+    # The arrays are built from the model if the base model is not cached
+    if cache_size == 1:
+        assert (a.fingerprint(), "float64") not in solver._arrays_cache
+        assert (c.fingerprint(), "float64") not in solver._arrays_cache
+
+
+def test_sawatabi_solver_cache_delta_with_other_dtype():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(3,))
+    model.add_interaction((x[0], x[1]), coefficient=0.1)
+    before = model.to_physical()
+    model.add_interaction((x[1], x[2]), coefficient=0.3)
+    after = model.to_physical()
+
+    # Arrays in float32 are not used as the base of a delta for float64, and the arrays are built from the model
+    solver = SawatabiSolver(cache_size=2)
+    solver.solve(before, seed=12345, dtype="float32")
+    float32_arrays = solver._arrays
+    solver.solve(after, seed=12345, delta=before.diff(after), dtype="float64")
+    assert solver._arrays is not float32_arrays
+    assert solver._arrays.dtype == np.float64
+    assert np.array_equal(solver._arrays._csr_to_coo()[2], IsingArrays(after)._csr_to_coo()[2])
+    assert solver._arrays_cache[(before.fingerprint(), "float32")] is float32_arrays
+
+
+def test_sawatabi_solver_invalid_cache_size():
+    with pytest.raises(TypeError):
+        SawatabiSolver(cache_size="1")
+
+    with pytest.raises(ValueError):
+        SawatabiSolver(cache_size=0)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_sawatabi_solver_dtype(dtype):
+    model = LogicalModel(mtype="qubo")
+    x = model.variables("x", shape=(10,))
+    model.add_constraint(NHotConstraint(variables=x, n=3))
+
+    solver = SawatabiSolver()
+    sampleset = solver.solve(model.to_physical(), seed=12345, dtype=dtype)
+    assert solver._arrays.dtype == dtype
+
+    result = np.array(sampleset.record[0].sample)
+    assert np.count_nonzero(result == 1) == 3
+    assert sampleset.record[0].energy == -9.0
+
+
+def test_sawatabi_solver_invalid_dtype():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=-1.0)
+    solver = SawatabiSolver()
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), dtype="float16")
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+@pytest.mark.parametrize("pickup_mode", ["random", "sequential"])
+def test_sawatabi_solver_vectorized(mtype, pickup_mode):
+    model = LogicalModel(mtype=mtype)
+    x = model.variables("x", shape=(10,))
+    model.add_constraint(NHotConstraint(variables=x, n=3))
+
+    solver = SawatabiSolver()
+    sampleset, stats = solver.solve(model.to_physical(), num_reads=8, pickup_mode=pickup_mode, seed=12345, vectorized=True, need_stats=True)
+
+    assert sampleset.variables == [f"x[{i}]" for i in range(10)]
+    assert np.sum(sampleset.record.num_occurrences) == 8
+    for r in sampleset.record:
+        assert np.count_nonzero(r.sample == 1) == 3
+        assert r.energy == sampleset.first.energy
+
+    assert len(stats) == 8
+    assert len(stats[0]["energy_history"]) == 100
+    assert np.allclose(stats[0]["temperature_history"][:2], [100.0, 90.0])
+
+
+def test_sawatabi_solver_vectorized_energies():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(6,))
+    for i in range(6):
+        model.add_interaction(x[i], coefficient=float(i - 3))
+        model.add_interaction((x[i], x[(i + 1) % 6]), coefficient=-2.0)
+    model.offset(5.0)
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    sampleset = solver.solve(physical, num_reads=20, num_sweeps=5, initial_temperature=10.0, seed=12345, vectorized=True)
+
+    # Tracked energies are the same as the ones recalculated from the samples
+    bqm = physical.to_bqm()
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_sawatabi_solver_coloring(mtype):
+    model = LogicalModel(mtype=mtype)
+    x = model.variables("x", shape=(4, 4))
+    for i in range(4):
+        for j in range(4):
+            model.add_interaction((x[i, j], x[(i + 1) % 4, j]), coefficient=1.0)
+            model.add_interaction((x[i, j], x[i, (j + 1) % 4]), coefficient=1.0)
+            model.add_interaction(x[i, j], coefficient=0.5)
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    sampleset, stats = solver.solve(physical, num_reads=4, num_sweeps=200, pickup_mode="coloring", seed=12345, need_stats=True)
+
+    # All spins are aligned in the ground state
+    bqm = physical.to_bqm()
+    assert len(sampleset.record) == 1
+    assert np.all(sampleset.record[0].sample == 1)
+    assert sampleset.record[0].num_occurrences == 4
+    assert bqm.energy(sampleset.first.sample) == pytest.approx(sampleset.first.energy)
+    assert len(stats) == 4
+    assert len(stats[0]["energy_history"]) == 200
+
+
+def test_sawatabi_solver_vectorized_with_initial_states_reverse():
+    model = LogicalModel(mtype="qubo")
+    x = model.variables("x", shape=(6,))
+    for i in range(6):
+        model.add_interaction(x[i], coefficient=10.0)
+
+    solver = SawatabiSolver()
+    initial_states = [{f"x[{i}]": 0 for i in range(6)}, {f"x[{i}]": 1 for i in range(6)}]
+    sampleset = solver.solve(
+        model.to_physical(),
+        num_reads=2,
+        num_sweeps=10,
+        cooling_rate=0.5,
+        initial_states=initial_states,
+        reverse_options={"reverse_period": 5, "reverse_temperature": 10.0},
+        seed=12345,
+        vectorized=True,
+    )
+
+    assert len(sampleset.record) == 1
+    assert np.array_equal(sampleset.record[0].sample, [1, 1, 1, 1, 1, 1])
+    assert sampleset.record[0].energy == -60.0
+    assert sampleset.record[0].num_occurrences == 2
+
+
+def test_sawatabi_solver_num_workers():
+    model = LogicalModel(mtype="qubo")
+    x = model.variables("x", shape=(10,))
+    model.add_constraint(NHotConstraint(variables=x, n=3))
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    initial_states = [{f"x[{i}]": 1 for i in range(10)} for _ in range(5)]
+    sampleset1, stats = solver.solve(physical, num_reads=5, initial_states=initial_states, seed=12345, num_workers=2, need_stats=True)
+    sampleset2 = solver.solve(physical, num_reads=5, initial_states=initial_states, seed=12345, num_workers=2)
+
+    assert np.sum(sampleset1.record.num_occurrences) == 5
+    for r in sampleset1.record:
+        assert np.count_nonzero(r.sample == 1) == 3
+    assert len(stats) == 5
+    assert sampleset1.info["timing"]["num_workers"] == 2
+    assert len(sampleset1.info["timing"]["worker_execution_sec"]) == 2
+
+    # The result is reproducible with the same seed
+    assert np.array_equal(sampleset1.record, sampleset2.record)
+
+
+def test_sawatabi_solver_invalid_num_workers():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=1.0)
+
+    solver = SawatabiSolver()
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), num_workers=2.0)
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), num_workers=0)
+
+
+@pytest.mark.parametrize("pickup_mode,adaptive", [("random", False), ("random", True), ("coloring", False)])
+def test_sawatabi_solver_tempering(pickup_mode, adaptive):
+    # A frustrated ring: the ground state has exactly one unsatisfied interaction
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(7,))
+    for i in range(7):
+        model.add_interaction((x[i], x[(i + 1) % 7]), coefficient=-1.0)
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    tempering_options = {"num_replicas": 4, "min_temperature": 0.1, "max_temperature": 5.0, "swap_interval": 2, "adaptive": adaptive}
+    sampleset, stats = solver.solve(
+        physical, num_reads=3, num_sweeps=50, pickup_mode=pickup_mode, seed=12345, tempering_options=tempering_options, need_stats=True
+    )
+
+    assert np.sum(sampleset.record.num_occurrences) == 3
+    assert np.all(sampleset.record.energy == -5.0)
+    bqm = physical.to_bqm()
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+    # Stats hold values for each replica on the temperature ladder
+    assert len(stats) == 3
+    assert stats[0]["energy_history"].shape == (50, 4)
+    assert stats[0]["acceptance_history"].shape == (50, 4)
+    assert stats[0]["temperature_history"].shape == (50, 4)
+    assert stats[0]["temperature_history"][-1][0] == pytest.approx(0.1)
+    assert stats[0]["temperature_history"][-1][-1] == pytest.approx(5.0)
+    assert len(sampleset.info["tempering"]["swap_acceptance_rates"]) == 3
+    assert all(0.0 <= rate <= 1.0 for rate in sampleset.info["tempering"]["swap_acceptance_rates"])
+
+
+def test_sawatabi_solver_tempering_ladder():
+    ladder = SawatabiSolver._temperature_ladder(5, 0.5, 8.0)
+    assert np.allclose(ladder, [0.5, 1.0, 2.0, 4.0, 8.0])
+    assert np.allclose(SawatabiSolver._temperature_ladder(1, 0.5, 8.0), [0.5])
+
+    # A gap with a higher swap rate is widened, and the both ends are kept
+    adapted = SawatabiSolver._adapt_temperature_ladder(ladder, np.array([0.9, 0.1, 0.1, 0.1]))
+    assert adapted[0] == pytest.approx(0.5)
+    assert adapted[-1] == pytest.approx(8.0)
+    assert np.all(np.diff(adapted) > 0)
+    assert adapted[1] / adapted[0] > 2.0
+
+
+def test_sawatabi_solver_invalid_tempering_options():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=1.0)
+
+    solver = SawatabiSolver()
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), tempering_options=[0.1, 1.0])
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), tempering_options={"max_temperature": 1.0})
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), tempering_options={"min_temperature": 0.1})
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), tempering_options={"min_temperature": 2.0, "max_temperature": 1.0})
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), tempering_options={"min_temperature": 0.1, "max_temperature": 1.0, "num_replicas": 0})
+
+    with pytest.raises(ValueError):
+        solver.solve(
+            model.to_physical(),
+            tempering_options={"min_temperature": 0.1, "max_temperature": 1.0},
+            reverse_options={"reverse_period": 5, "reverse_temperature": 10.0},
+        )
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+def test_sawatabi_solver_population_annealing(mtype):
+    model = LogicalModel(mtype=mtype)
+    x = model.variables("x", shape=(6,))
+    for i in range(6):
+        model.add_interaction(x[i], coefficient=float(i % 3 - 1))
+        model.add_interaction((x[i], x[(i + 1) % 6]), coefficient=1.0)
+    model.offset(2.0)
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    sampleset, stats = solver.solve(
+        physical,
+        num_reads=500,
+        num_sweeps=20,
+        cooling_rate=0.8,
+        initial_temperature=5.0,
+        seed=12345,
+        population_options={"sweeps_per_step": 2},
+        need_stats=True,
+    )
+
+    # The population size is num_reads
+    assert np.sum(sampleset.record.num_occurrences) == 500
+    bqm = physical.to_bqm()
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+    energies = dimod.ExactSolver().sample(bqm).record.energy
+    assert sampleset.first.energy == energies.min()
+
+    # The free energy estimate is close to the exact one: F = -T log sum( exp(-E / T) )
+    temperature = 5.0 * 0.8**19
+    exact = energies.min() - temperature * np.log(np.sum(np.exp(-(energies - energies.min()) / temperature)))
+    assert sampleset.info["population"]["free_energy"] == pytest.approx(exact, abs=0.1)
+    assert len(sampleset.info["population"]["free_energy_history"]) == 20
+    assert len(sampleset.info["population"]["log_partition_function_history"]) == 20
+
+    assert len(stats) == 500
+    assert len(stats[0]["energy_history"]) == 20
+    assert np.allclose(stats[0]["temperature_history"][:2], [5.0, 4.0])
+
+
+def test_sawatabi_solver_invalid_population_options():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=1.0)
+
+    solver = SawatabiSolver()
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), population_options=[1])
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), population_options={"sweeps_per_step": 0})
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), population_options={}, tempering_options={"min_temperature": 0.1, "max_temperature": 1.0})
+
+
+def test_sawatabi_solver_swendsen_wang_escapes_domain():
+    # A strongly coupled chain with a weak field, which cannot be flipped spin by spin at a low temperature
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(20,))
+    for i in range(19):
+        model.add_interaction((x[i], x[i + 1]), coefficient=5.0)
+    for i in range(20):
+        model.add_interaction(x[i], coefficient=0.1)
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    initial_states = [{f"x[{i}]": -1 for i in range(20)} for _ in range(4)]
+    kwargs = {"num_reads": 4, "num_sweeps": 20, "initial_temperature": 0.5, "initial_states": initial_states, "seed": 12345}
+
+    sampleset = solver.solve(physical, **kwargs)
+    assert np.all(sampleset.record.sample == -1)
+
+    sampleset = solver.solve(physical, cluster_options={"method": "swendsen_wang", "interval": 2}, **kwargs)
+    assert np.all(sampleset.record.sample == 1)
+    assert sampleset.first.energy == pytest.approx(-97.0)
+
+
+@pytest.mark.parametrize("method", ["swendsen_wang", "houdayer"])
+def test_sawatabi_solver_cluster_moves_keep_distribution(method):
+    rng = np.random.default_rng(0)
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(6,))
+    for i in range(6):
+        model.add_interaction(x[i], coefficient=float(rng.normal()))
+        for j in range(i + 1, 6):
+            model.add_interaction((x[i], x[j]), coefficient=float(rng.normal()))
+    physical = model.to_physical()
+
+    # Sample at a fixed temperature, and compare the mean energy to the exact one
+    temperature = 1.5
+    solver = SawatabiSolver()
+    sampleset = solver.solve(
+        physical, num_reads=2000, num_sweeps=20, cooling_rate=1.0, initial_temperature=temperature, seed=12345, cluster_options={"method": method}
+    )
+    energies = dimod.ExactSolver().sample(physical.to_bqm()).record.energy
+    weights = np.exp(-(energies - energies.min()) / temperature)
+    expected = np.sum(energies * weights) / np.sum(weights)
+    assert np.average(sampleset.record.energy, weights=sampleset.record.num_occurrences) == pytest.approx(expected, abs=0.1)
+
+    bqm = physical.to_bqm()
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+
+def test_sawatabi_solver_houdayer_keeps_pair_energies():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(3, 3))
+    for i in range(3):
+        for j in range(3):
+            model.add_interaction(x[i, j], coefficient=0.5 * i - 0.3 * j)
+            model.add_interaction((x[i, j], x[(i + 1) % 3, j]), coefficient=1.0 + i)
+            model.add_interaction((x[i, j], x[i, (j + 1) % 3]), coefficient=-1.0 + j)
+
+    solver = SawatabiSolver()
+    solver._arrays = IsingArrays(model.to_physical())
+    solver._rng = np.random.default_rng(12345)
+
+    spins = np.random.default_rng(0).choice([-1, 1], size=(5, 9))
+    for _ in range(10):
+        before = spins.copy()
+        energies = solver._arrays.energy(spins)
+        solver._houdayer(spins)
+
+        # The total energy of each pair is unchanged, and only disagreeing spins are flipped in both replicas
+        after = solver._arrays.energy(spins)
+        assert np.allclose(energies[0:4:2] + energies[1:4:2], after[0:4:2] + after[1:4:2])
+        assert np.array_equal(spins[4], before[4])
+        flipped = spins != before
+        assert np.array_equal(flipped[0:4:2], flipped[1:4:2])
+        assert np.all(before[0:4:2][flipped[0:4:2]] != before[1:4:2][flipped[1:4:2]])
+
+
+def test_sawatabi_solver_invalid_cluster_options():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=1.0)
+
+    solver = SawatabiSolver()
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), cluster_options=["houdayer"])
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), cluster_options={"method": "wolff"})
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), cluster_options={"interval": 0})
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), cluster_options={"method": "houdayer"}, population_options={})
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_sawatabi_solver_early_stopping(vectorized):
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(10,))
+    for i in range(9):
+        model.add_interaction((x[i], x[i + 1]), coefficient=1.0)
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    kwargs = {"num_reads": 2, "num_sweeps": 200, "initial_temperature": 0.1, "seed": 12345, "vectorized": vectorized, "need_stats": True}
+    initial_states = [{f"x[{i}]": 1 for i in range(10)} for _ in range(2)]
+
+    # Nothing is accepted from the ground state at a low temperature
+    sampleset, stats = solver.solve(physical, initial_states=initial_states, early_stopping={"zero_acceptance_sweeps": 5}, **kwargs)
+    assert sampleset.info["stop_reason"] == "zero_acceptance"
+    assert sampleset.info["stop_reasons"] == ["zero_acceptance", "zero_acceptance"]
+    assert len(stats[0]["energy_history"]) == 5
+    assert len(stats[0]["temperature_history"]) == 5
+    assert sampleset.first.energy == -9.0
+
+    sampleset, stats = solver.solve(physical, early_stopping={"stagnation_sweeps": 10, "stagnation_tolerance": 0.5}, **kwargs)
+    assert sampleset.info["stop_reason"] == "stagnation"
+    assert 10 <= len(stats[0]["energy_history"]) < 200
+
+    sampleset, stats = solver.solve(physical, **kwargs)
+    assert sampleset.info["stop_reason"] == "num_sweeps"
+    assert len(stats[0]["energy_history"]) == 200
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_sawatabi_solver_time_limit(vectorized):
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(30,))
+    for i in range(29):
+        model.add_interaction((x[i], x[i + 1]), coefficient=1.0)
+
+    solver = SawatabiSolver()
+    sampleset = solver.solve(model.to_physical(), num_reads=3, num_sweeps=10**6, seed=12345, vectorized=vectorized, time_limit_sec=0.2)
+
+    assert sampleset.info["stop_reason"] == "time_limit"
+    assert sampleset.info["timing"]["execution_sec"] < 5.0
+    assert 1 <= np.sum(sampleset.record.num_occurrences) <= 3
+
+
+def test_sawatabi_solver_invalid_early_stopping():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=1.0)
+
+    solver = SawatabiSolver()
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), early_stopping=5)
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), early_stopping={"unknown": 5})
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), early_stopping={"zero_acceptance_sweeps": 0})
+
+    with pytest.raises(TypeError):
+        solver.solve(model.to_physical(), time_limit_sec="1")
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), time_limit_sec=0)
+
+    with pytest.raises(ValueError):
+        solver.solve(model.to_physical(), time_limit_sec=1.0, population_options={})
+
+
+def test_sawatabi_solver_temperature_schedule():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction(x[0], coefficient=-1.0)
+    solver = SawatabiSolver()
+
+    reverse_options = {"reverse_period": 4, "reverse_temperature": 10.0}
+    _, stats = solver.solve(model.to_physical(), num_sweeps=10, cooling_rate=0.5, reverse_options=reverse_options, seed=12345, need_stats=True)
+    temperatures = SawatabiSolver._temperature_schedule(10, 0.5, 100.0, reverse_options)
+    assert np.array_equal(temperatures, stats[0]["temperature_history"])
+
+
+@pytest.mark.parametrize("interpolation", ["geometric", "linear"])
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_sawatabi_solver_auto_schedule(interpolation, vectorized):
+    # A scaled-down ferromagnetic chain, which is too cold for the default schedule
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(20,))
+    for i in range(19):
+        model.add_interaction((x[i], x[i + 1]), coefficient=0.001)
+    model.add_interaction(x[0], coefficient=0.001)
+    physical = model.to_physical()
+
+    solver = SawatabiSolver()
+    sampleset, stats = solver.solve(
+        physical, num_reads=4, num_sweeps=200, seed=12345, vectorized=vectorized, need_stats=True, schedule="auto", schedule_interpolation=interpolation
+    )
+    assert sampleset.first.energy == pytest.approx(-0.02)
+    assert set(sampleset.first.sample.values()) == {1}
+
+    # A flip of x[1] changes the energy by 0.004 at most, and a flip of x[19] changes it by 0.002 at least
+    schedule = sampleset.info["schedule"]
+    assert schedule["hot_temperature"] == pytest.approx(0.004 / np.log(2.0))
+    assert schedule["cold_temperature"] == pytest.approx(0.002 / np.log(100.0))
+    assert schedule["interpolation"] == interpolation
+    temperatures = stats[0]["temperature_history"]
+    assert temperatures[0] == pytest.approx(schedule["hot_temperature"])
+    assert temperatures[-1] == pytest.approx(schedule["cold_temperature"])
+    assert np.all(np.diff(temperatures) < 0.0)
+    if interpolation == "geometric":
+        assert np.allclose(temperatures[1:] / temperatures[:-1], temperatures[1] / temperatures[0])
+    else:
+        assert np.allclose(np.diff(1.0 / temperatures), 1.0 / temperatures[1] - 1.0 / temperatures[0])
+
+    # The schedule is also used for population annealing
+    sampleset = solver.solve(physical, num_reads=8, num_sweeps=50, seed=12345, population_options={}, schedule="auto")
+    assert sampleset.first.energy == pytest.approx(-0.02)
+    assert len(sampleset.info["population"]["free_energy_history"]) == 50
+
+
+def test_sawatabi_solver_invalid_schedule():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(2,))
+    model.add_interaction((x[0], x[1]), coefficient=1.0)
+    physical = model.to_physical()
+    solver = SawatabiSolver()
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, schedule="unknown")
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, schedule="auto", schedule_interpolation="unknown")
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, schedule="auto", reverse_options={"reverse_period": 5, "reverse_temperature": 10.0})
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, schedule="auto", tempering_options={"min_temperature": 0.1, "max_temperature": 10.0})
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+@pytest.mark.parametrize("vectorized,tempering", [(False, False), (True, False), (True, True)])
+def test_sawatabi_solver_frozen(mtype, vectorized, tempering, random_model):
+    rng = np.random.default_rng(0)
+    physical = random_model(mtype, size=8, density=1.0).to_physical()
+    bqm = physical.to_bqm()
+    labels = [physical._index_to_label[i] for i in range(8)]
+    values = [-1, 1] if mtype == "ising" else [0, 1]
+    initial_states = rng.choice(values, size=(4, 8))
+
+    # The best energy with the frozen variables fixed to the values of the first initial state
+    frozen = ["x[0]", "x[3]", "x[6]"]
+    expected = np.inf
+    for active_values in itertools.product(values, repeat=5):
+        sample = dict(zip(labels, initial_states[0]))
+        sample.update(dict(zip([label for label in labels if label not in frozen], active_values)))
+        expected = min(expected, bqm.energy(sample))
+
+    solver = SawatabiSolver()
+    tempering_options = {"min_temperature": 0.5, "max_temperature": 20.0} if tempering else None
+    for frozen_arg in [frozen, np.isin(labels, frozen)]:
+        sampleset = solver.solve(
+            physical,
+            num_reads=4,
+            num_sweeps=100,
+            initial_temperature=10.0,
+            initial_states=initial_states,
+            seed=12345,
+            vectorized=vectorized,
+            tempering_options=tempering_options,
+            frozen=frozen_arg,
+        )
+        # The frozen variables keep their initial values, and the energies include them
+        frozen_values = {tuple(state[labels.index(label)] for label in frozen) for state in initial_states}
+        for sample, energy in sampleset.data(["sample", "energy"]):
+            assert tuple(sample[label] for label in frozen) in frozen_values
+            assert bqm.energy(sample) == pytest.approx(energy)
+        best = min(
+            energy
+            for sample, energy in sampleset.data(["sample", "energy"])
+            if all(sample[label] == initial_states[0][labels.index(label)] for label in frozen)
+        )
+        assert best == pytest.approx(expected)
+
+
+def test_sawatabi_solver_invalid_frozen():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(3,))
+    model.add_interaction((x[0], x[1]), coefficient=1.0)
+    model.add_interaction((x[1], x[2]), coefficient=1.0)
+    physical = model.to_physical()
+    initial_states = [{"x[0]": 1, "x[1]": -1, "x[2]": 1}]
+    solver = SawatabiSolver()
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, frozen=["x[0]"])
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, initial_states=initial_states, frozen=["y[0]"])
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, initial_states=initial_states, frozen=np.array([True, False]))
+
+    with pytest.raises(TypeError):
+        solver.solve(physical, initial_states=initial_states, frozen="x[0]")
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, initial_states=initial_states, frozen=["x[0]"], pickup_mode="coloring")
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, initial_states=initial_states, frozen=["x[0]"], population_options={})
@@ -0,0 +1,116 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from sawatabi.model import LogicalModel
+from sawatabi.solver import LocalSolver, SQASolver
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+@pytest.mark.parametrize("pickup_mode", ["random", "sequential"])
+def test_sqa_solver(mtype, pickup_mode, random_model):
+    physical = random_model(mtype).to_physical()
+    bqm = physical.to_bqm()
+    expected = LocalSolver(exact=True).solve(physical)
+
+    solver = SQASolver()
+    sampleset = solver.solve(physical, num_reads=4, num_sweeps=100, num_trotter_slices=8, pickup_mode=pickup_mode, seed=12345)
+
+    assert sampleset.vartype.name == ("SPIN" if mtype == "ising" else "BINARY")
+    assert np.sum(sampleset.record.num_occurrences) == 4
+    assert sampleset.first.energy == pytest.approx(expected.first.energy)
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+    info = sampleset.info["sqa"]
+    assert info["num_trotter_slices"] == 8
+    assert info["final_gamma"] == pytest.approx(info["initial_gamma"] * 1e-3)
+    assert "execution_sec" in sampleset.info["timing"]
+
+    # The same seed gives the same result
+    other = solver.solve(physical, num_reads=4, num_sweeps=100, num_trotter_slices=8, pickup_mode=pickup_mode, seed=12345)
+    assert np.array_equal(other.record.sample, sampleset.record.sample)
+
+
+@pytest.mark.parametrize("num_trotter_slices", [1, 2, 5])
+def test_sqa_solver_stats(num_trotter_slices, random_model):
+    physical = random_model("ising").to_physical()
+
+    solver = SQASolver()
+    sampleset, stats = solver.solve(
+        physical,
+        num_reads=3,
+        num_sweeps=30,
+        num_trotter_slices=num_trotter_slices,
+        temperature=0.1,
+        initial_gamma=5.0,
+        final_gamma=0.01,
+        gamma_interpolation="geometric",
+        seed=12345,
+        need_stats=True,
+    )
+    assert len(stats) == 3
+    assert stats[0]["sweep"].tolist() == list(range(30))
+    assert np.allclose(stats[0]["gamma_history"], np.geomspace(5.0, 0.01, 30))
+    assert np.all(stats[0]["acceptance_history"] >= 0)
+    # The lowest energy among the slices at the last sweep is returned
+    assert sorted(st["energy_history"][-1] for st in stats) == pytest.approx(sorted(np.repeat(sampleset.record.energy, sampleset.record.num_occurrences)))
+
+
+def test_sqa_solver_slice_groups():
+    for num_slices in range(1, 8):
+        groups = SQASolver._slice_groups(num_slices)
+        assert sorted(np.concatenate(groups).tolist()) == list(range(num_slices))
+        if num_slices < 3:
+            continue
+        # No slices in a group are neighbors in the periodic Trotter direction
+        for group in groups:
+            for k in group:
+                assert (k + 1) % num_slices not in group
+                assert (k - 1) % num_slices not in group
+
+
+def test_sqa_solver_invalid_arguments(random_model):
+    physical = random_model("ising").to_physical()
+    solver = SQASolver()
+
+    with pytest.raises(TypeError):
+        solver.solve("model")
+
+    with pytest.raises(ValueError):
+        solver.solve(LogicalModel(mtype="ising").to_physical())
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, num_trotter_slices=0)
+
+    with pytest.raises(TypeError):
+        solver.solve(physical, num_trotter_slices=2.0)
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, gamma_interpolation="unknown")
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, pickup_mode="coloring")
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, temperature=0.0)
+
+    with pytest.raises(ValueError):
+        solver.solve(physical, initial_gamma=1.0, final_gamma=2.0)
+
+    with pytest.raises(ValueError):
+        physical.add_low_rank_interaction(["x[0]", "x[1]"], np.ones(2))
+        solver.solve(physical)
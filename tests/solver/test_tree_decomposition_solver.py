@@ -0,0 +1,115 @@
+# Copyright 2021 Kotaro Terada
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from sawatabi.model import LogicalModel
+from sawatabi.solver import LocalSolver, TreeDecompositionSolver
+
+
+@pytest.mark.parametrize("mtype", ["ising", "qubo"])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_tree_decomposition_solver(mtype, seed, random_model):
+    physical = random_model(mtype, seed=seed).to_physical()
+    bqm = physical.to_bqm()
+    expected = LocalSolver(exact=True).solve(physical)
+
+    solver = TreeDecompositionSolver()
+    sampleset = solver.solve(physical)
+    assert sampleset.vartype == expected.vartype
+    assert sampleset.variables == expected.variables
+    assert len(sampleset.record) == 1
+    assert sampleset.first.energy == pytest.approx(expected.first.energy)
+    assert 0 < sampleset.info["treewidth"] < 10
+    assert "execution_sec" in sampleset.info["timing"]
+
+    # The lowest states are all different, and their energies are the lowest ones
+    sampleset = solver.solve(physical, num_states=30)
+    assert len(sampleset.record) == 30
+    assert len({tuple(sample) for sample in sampleset.record.sample}) == 30
+    assert np.allclose(np.sort(sampleset.record.energy), np.sort(expected.record.energy)[:30])
+    for sample, energy in sampleset.data(["sample", "energy"]):
+        assert bqm.energy(sample) == pytest.approx(energy)
+
+    # All states are enumerated if more states are requested
+    sampleset = solver.solve(physical, num_states=5000)
+    assert np.allclose(np.sort(sampleset.record.energy), np.sort(expected.record.energy))
+
+
+def test_tree_decomposition_solver_chain():
+    # A long chain, which is too large for brute force
+    rng = np.random.default_rng(0)
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(500,))
+    for i in range(500):
+        model.add_interaction(x[i], coefficient=float(rng.normal()))
+        if i > 0:
+            model.add_interaction((x[i - 1], x[i]), coefficient=float(rng.normal()))
+    physical = model.to_physical()
+
+    sampleset = TreeDecompositionSolver().solve(physical, num_states=3)
+    assert sampleset.info["treewidth"] == 1
+    energies = sampleset.record.energy
+    assert energies[0] <= energies[1] <= energies[2]
+
+    # No single flip improves the optimum
+    best = sampleset.first.sample
+    bqm = physical.to_bqm()
+    for label in ["x[0]", "x[250]", "x[499]"]:
+        flipped = dict(best)
+        flipped[label] *= -1
+        assert bqm.energy(flipped) >= sampleset.first.energy
+
+
+def test_tree_decomposition_solver_min_fill_order():
+    # A cycle of 6 variables has the treewidth 2
+    rows = np.array([0, 1, 2, 3, 4, 5])
+    cols = np.array([1, 2, 3, 4, 5, 0])
+    order, treewidth = TreeDecompositionSolver._min_fill_order(6, rows, cols)
+    assert sorted(order) == list(range(6))
+    assert treewidth == 2
+
+    # A star is eliminated from its leaves without any fill, and the center is eliminated when it has a single leaf left
+    order, treewidth = TreeDecompositionSolver._min_fill_order(5, np.array([0, 0, 0, 0]), np.array([1, 2, 3, 4]))
+    assert order == [1, 2, 3, 0, 4]
+    assert treewidth == 1
+
+
+def test_tree_decomposition_solver_invalid_arguments():
+    model = LogicalModel(mtype="ising")
+    x = model.variables("x", shape=(6,))
+    for i in range(6):
+        for j in range(i + 1, 6):
+            model.add_interaction((x[i], x[j]), coefficient=1.0)
+    physical = model.to_physical()
+
+    with pytest.raises(ValueError):
+        TreeDecompositionSolver(max_treewidth=3).solve(physical)
+
+    with pytest.raises(ValueError):
+        TreeDecompositionSolver(max_treewidth=-1)
+
+    with pytest.raises(TypeError):
+        TreeDecompositionSolver().solve("model")
+
+    with pytest.raises(ValueError):
+        TreeDecompositionSolver().solve(physical, num_states=0)
+
+    with pytest.raises(ValueError):
+        TreeDecompositionSolver().solve(LogicalModel(mtype="ising").to_physical())
+
+    with pytest.raises(ValueError):
+        physical.add_low_rank_interaction(["x[0]", "x[1]"], np.ones(2))
+        TreeDecompositionSolver().solve(physical)